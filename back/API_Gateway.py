@@ -1,16 +1,28 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from flask_sse import sse
 import requests
 import threading
-import pika
+import os
 import utils
+import logs
+import metricas
+from metricas import registro
+from cliente_http import ClienteUpstream
+from interesses import RegistroInteresses, RegistroInteressesRedis
+from sse_topicos import SSETopicos
+from servico import Servico
 import redis
 import json
+import hashlib
+from collections import OrderedDict
 
 # --- Configurações ---
 app = Flask(__name__)
 app.config["REDIS_URL"] = "redis://localhost:6379"
+metricas.expor(app)
+servico = Servico(app)
+log = logs.Log('gateway')
+amostra_lances = logs.Amostragem(logs.LOG_AMOSTRAGEM_LANCES)
 
 CORS(
     app,
@@ -22,127 +34,237 @@ CORS(
 LEILAO_SERVICE_URL = 'http://localhost:4999'
 LANCE_SERVICE_URL = 'http://localhost:4998' 
 
+# Timeouts (segundos) e limites dos clientes HTTP para os microsserviços
+UPSTREAM_TIMEOUT_CONEXAO = float(os.environ.get('UPSTREAM_TIMEOUT_CONEXAO', 2))
+UPSTREAM_TIMEOUT_LEITURA = float(os.environ.get('UPSTREAM_TIMEOUT_LEITURA', 10))
+UPSTREAM_TAMANHO_POOL = int(os.environ.get('UPSTREAM_TAMANHO_POOL', 20))
+UPSTREAM_MAX_CONCORRENCIA = int(os.environ.get('UPSTREAM_MAX_CONCORRENCIA', 50))
+
+def criar_cliente_upstream(base_url: str) -> ClienteUpstream:
+    return ClienteUpstream(
+        base_url,
+        timeout_conexao=UPSTREAM_TIMEOUT_CONEXAO,
+        timeout_leitura=UPSTREAM_TIMEOUT_LEITURA,
+        tamanho_pool=UPSTREAM_TAMANHO_POOL,
+        max_concorrencia=UPSTREAM_MAX_CONCORRENCIA,
+    )
+
+leilao_upstream = criar_cliente_upstream(LEILAO_SERVICE_URL)
+lance_upstream = criar_cliente_upstream(LANCE_SERVICE_URL)
+
+# SSE com um canal por leilão: cada stream se inscreve nos leilões que o cliente segue
+sse = SSETopicos('sse', __name__, leiloes_do_cliente=lambda cliente_id: interesses.leiloes_do_cliente(cliente_id))
+sse.add_url_rule(rule="", endpoint="stream", view_func=sse.stream)
 app.register_blueprint(sse, url_prefix='/events/stream')
 
-interests = {}
+# Interesses ficam no Redis (compartilhados entre instâncias do gateway);
+# INTERESSES_BACKEND=memoria mantém o registro local ao processo
+if os.environ.get('INTERESSES_BACKEND', 'redis') == 'memoria':
+    interesses = RegistroInteresses()
+else:
+    interesses = RegistroInteressesRedis(redis.from_url(app.config["REDIS_URL"]))
+
+class CacheLeiloesAtivos:
+    """
+    Listagem de leilões ativos já serializada em JSON, com ETag.
+    É mantida pelos eventos leilao_iniciado/leilao_finalizado (sem TTL) e só é
+    usada enquanto o consumidor RabbitMQ está conectado; caso contrário cada
+    leitura consulta o MS Leilão, como antes.
+    """
+    def __init__(self, carregar):
+        self._carregar = carregar  # Função que busca a lista atual no MS Leilão
+        self._lock = threading.Lock()
+        self._ativo = False
+        self._geracao = 0  # Incrementada a cada evento/invalidação
+        self._leiloes = None  # OrderedDict {id: resumo}; None = cache frio
+        self._corpo = None
+        self._etag = None
+
+    def ativar(self):
+        """Chamado quando o consumidor passa a receber os eventos de ciclo de vida"""
+        with self._lock:
+            self._ativo = True
+            self._invalidar()
+
+    def desativar(self):
+        """Chamado quando o consumidor perde a conexão (eventos podem ser perdidos)"""
+        with self._lock:
+            self._ativo = False
+            self._invalidar()
+
+    def invalidar(self):
+        """Descarta o conteúdo; a próxima leitura consulta o MS Leilão"""
+        with self._lock:
+            self._invalidar()
+
+    def _invalidar(self):
+        self._geracao += 1
+        self._leiloes = None
+        self._corpo = self._etag = None
+
+    def _serializar(self):
+        self._corpo = json.dumps(list(self._leiloes.values())).encode('utf-8')
+        self._etag = hashlib.blake2b(self._corpo, digest_size=8).hexdigest()
+
+    def leilao_iniciado(self, evento: dict):
+        leilao_id = str(evento.get('id'))
+        with self._lock:
+            self._geracao += 1
+            if self._leiloes is not None:
+                self._leiloes[leilao_id] = {
+                    "id": leilao_id,
+                    "desc": evento.get("desc", ""),
+                    "valor_inicial": evento.get("valor_inicial", 0),
+                    "inicio": evento.get("inicio", ""),
+                    "fim": evento.get("fim", ""),
+                    "status": "ativo"
+                }
+                self._corpo = self._etag = None
+
+    def leilao_finalizado(self, evento: dict):
+        leilao_id = str(evento.get('id'))
+        with self._lock:
+            self._geracao += 1
+            if self._leiloes is not None and self._leiloes.pop(leilao_id, None) is not None:
+                self._corpo = self._etag = None
+
+    def obter(self):
+        """Retorna (corpo_json, etag), consultando o MS Leilão apenas com o cache frio"""
+        with self._lock:
+            if self._leiloes is not None:
+                if self._corpo is None:
+                    self._serializar()
+                return self._corpo, self._etag
+            geracao = self._geracao
+
+        leiloes = self._carregar()
+        corpo = json.dumps(leiloes).encode('utf-8')
+        etag = hashlib.blake2b(corpo, digest_size=8).hexdigest()
+
+        with self._lock:
+            # Só instala o resultado se nenhum evento chegou durante a consulta
+            if self._ativo and self._leiloes is None and geracao == self._geracao:
+                self._leiloes = OrderedDict((str(leilao['id']), leilao) for leilao in leiloes)
+                self._corpo, self._etag = corpo, etag
+        return corpo, etag
 
 ## RabbitMQ ##
 
-class RabbitMQConsumer(threading.Thread):
-    def __init__(self, app_context):
-        super().__init__()
-        self.daemon = True
-        self.app_context = app_context
-        self.connection = None
-        self.channel = None
-        self.aux_queue = None
-
-    def connect(self):
-        print("[RabbitMQ] Conectando...")
-        self.connection = utils.get_rabbitmq_connection()
-        self.channel = self.connection.channel()
-        utils.setup_queues(self.channel)
-        exchange = self.channel.queue_declare(queue='', exclusive=True)
-        self.aux_queue = exchange.method.queue
-        self.channel.queue_bind(exchange='leilao_vencedor', queue=self.aux_queue)
-        print("[RabbitMQ] Conectado e filas configuradas.")
-
-
-    def disconnect(self):
-        if self.connection and self.connection.is_open:
-            self.connection.close()
+# Configuração do pool de consumidores (uma conexão/thread por fila)
+CONSUMIDOR_PREFETCH = int(os.environ.get('CONSUMIDOR_PREFETCH', 200))
+CONSUMIDOR_LOTE_ACK = int(os.environ.get('CONSUMIDOR_LOTE_ACK', 50))
+CONSUMIDOR_SHARDS_LANCES = int(os.environ.get('CONSUMIDOR_SHARDS_LANCES', os.cpu_count() or 1))
+
+TIPOS_EVENTO_SSE = ('lance_v', 'lance_inv', 'leilao_v', 'link_p', 'status_p')
+latencia_fanout = {tipo: registro.histograma('sse_fanout_segundos', 'Publicação de um evento no canal SSE do leilão', tipo=tipo)
+                   for tipo in TIPOS_EVENTO_SSE}
+
+class RabbitMQConsumer:
+    """
+    Pool de consumidores do gateway: cada fila tem sua própria conexão e thread,
+    então um evento lento numa fila não atrasa as demais. As filas de lances
+    (as mais movimentadas) são divididas em shards por leilão.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.consumidores = []
+
+    @staticmethod
+    def declarar_fila_exclusiva(*exchanges):
+        def declarar(channel):
+            utils.setup_queues(channel)
+            fila = channel.queue_declare(queue='', exclusive=True).method.queue
+            for exchange in exchanges:
+                channel.queue_bind(exchange=exchange, queue=fila)
+            return fila
+        return declarar
+
+    def start(self):
+        log.info("Iniciando pool de consumidores")
+        config = dict(prefetch=CONSUMIDOR_PREFETCH, lote_ack=CONSUMIDOR_LOTE_ACK)
+        self.consumidores = [
+            utils.ConsumidorFila('lance_validado', utils.declarar_fila('lance_validado'),
+                                 self.processar_lance_validado, shards=CONSUMIDOR_SHARDS_LANCES, **config),
+            utils.ConsumidorFila('lance_invalidado', utils.declarar_fila('lance_invalidado'),
+                                 self.processar_lance_invalidado, shards=CONSUMIDOR_SHARDS_LANCES, **config),
+            # Compartilhada: com uma fila exclusiva por worker, cada worker repetiria o evento no SSE
+            utils.ConsumidorFila('leilao_vencedor', utils.declarar_fila_compartilhada('gateway_leilao_vencedor', 'leilao_vencedor'),
+                                 self.processar_leilao_vencedor, **config),
+            utils.ConsumidorFila('link_pagamento', utils.declarar_fila('link_pagamento'),
+                                 self.processar_link_pagamento, **config),
+            utils.ConsumidorFila('status_pagamento', utils.declarar_fila('status_pagamento'),
+                                 self.processar_status_pagamento, **config),
+            utils.ConsumidorFila('ciclo_vida', self.declarar_fila_exclusiva('leilao_iniciado', 'leilao_finalizado'),
+                                 self.processar_ciclo_vida,
+                                 ao_conectar=cache_leiloes_ativos.ativar,
+                                 ao_desconectar=cache_leiloes_ativos.desativar, **config),
+        ]
+        for consumidor in self.consumidores:
+            consumidor.start()
+
+    def stop(self):
+        for consumidor in self.consumidores:
+            consumidor.parar()
 
     def publish_sse_event(self, body, event_type):
-        with self.app_context:
+        with self.app.app_context():
             try:
                 message = body.decode('utf-8')
-                print(f"[SSE] Publicando evento {event_type} para o Redis: {message}")
-
                 evento = json.loads(message)
 
                 leilao_id = evento.get('id')
                 if not leilao_id:
-                    print(f"[AVISO SSE] Evento {event_type} recebido SEM 'leilao_id'. Mensagem: {message}")
-                    return
-
-                lista_de_interessados = interests.get(leilao_id)
-
-                if not lista_de_interessados:
-                    print(f"[AVISO SSE] Evento {event_type} para leilão {leilao_id}, mas ninguém está a seguir.")
+                    log.aviso("Evento SSE sem id do leilão", tipo=event_type, corpo=message)
                     return
 
-                print(f"[SSE] Enviando {event_type} para {len(lista_de_interessados)} seguidores do leilão {leilao_id}...")
-                for cliente in lista_de_interessados:
-                    sse.publish(message, type=event_type, channel=cliente)
+                # Um único PUBLISH no canal do leilão, independente do número de seguidores
+                with latencia_fanout[event_type].cronometrar():
+                    recebido_por = sse.publicar_leilao(leilao_id, message, type=event_type)
 
-                print(f"[SSE] Evento {event_type} publicado com sucesso")
+                log.debug("Evento SSE publicado", tipo=event_type, leilao_id=leilao_id, streams=recebido_por)
 
             except json.JSONDecodeError as json_err:
-                print(f"[ERRO SSE] Mensagem recebida não é um JSON válido: {body.decode('utf-8')} | Erro: {json_err}")
-            except Exception as e:
-                print(f"[ERRO SSE] Falha inesperada ao publicar: {e}")
+                log.erro("Evento SSE não é um JSON válido", tipo=event_type, corpo=body.decode('utf-8', 'replace'), erro=str(json_err))
+            except Exception:
+                log.erro("Falha inesperada ao publicar evento SSE", excecao=True, tipo=event_type)
                 
     # Métodos de Callback
     
-    def processar_lance_validado(self, ch, method, properties, body):
+    def processar_lance_validado(self, method, body):
         self.publish_sse_event(body, event_type='lance_v')
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def processar_lance_invalidado(self, ch, method, properties, body):
+    def processar_lance_invalidado(self, method, body):
         self.publish_sse_event(body, event_type='lance_inv')
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def processar_leilao_vencedor(self, ch, method, properties, body):
+    def processar_leilao_vencedor(self, method, body):
         self.publish_sse_event(body, event_type='leilao_v')
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def processar_link_pagamento(self, ch, method, properties, body):
+    def processar_link_pagamento(self, method, body):
         self.publish_sse_event(body, event_type='link_p')
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def processar_status_pagamento(self, ch, method, properties, body):
+    def processar_status_pagamento(self, method, body):
         self.publish_sse_event(body, event_type='status_p')
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def run(self):
-        print("[RabbitMQ] Thread consumidora iniciada.")
-        while True:
-            try:
-                self.connect()
-                queues_callbacks = {
-                    'lance_validado': self.processar_lance_validado,
-                    'lance_invalidado': self.processar_lance_invalidado,
-                    self.aux_queue: self.processar_leilao_vencedor,
-                    'link_pagamento': self.processar_link_pagamento,
-                    'status_pagamento': self.processar_status_pagamento,
-                }
-                for queue_name, callback in queues_callbacks.items():
-                    self.channel.basic_consume(
-                        queue=queue_name,
-                        on_message_callback=callback
-                    )
-                    print(f"[RabbitMQ] Consumindo fila: '{queue_name}'")
-                print("[RabbitMQ] Aguardando mensagens...")
-                self.channel.start_consuming()
-            except pika.exceptions.ConnectionClosedByBroker:
-                print("[RabbitF_MQ] Conexão fechada pelo broker. Tentando reconectar em 5s...")
-            except pika.exceptions.AMQPChannelError as e:
-                print(f"[RabbitMQ] Erro no canal AMQP: {e}. Reconectando em 5s...")
-            except Exception as e:
-                print(f"[RabbitMQ] Erro fatal no thread consumidor: {e}. Reconectando em 5s...")
-            finally:
-                self.disconnect()
-                import time
-                time.sleep(5)
+    def processar_ciclo_vida(self, method, body):
+        """Atualiza o cache de leilões ativos a partir dos eventos de ciclo de vida"""
+        try:
+            evento = json.loads(body.decode('utf-8'))
+            if method.exchange == 'leilao_iniciado':
+                cache_leiloes_ativos.leilao_iniciado(evento)
+            elif method.exchange == 'leilao_finalizado':
+                cache_leiloes_ativos.leilao_finalizado(evento)
+        except json.JSONDecodeError as json_err:
+            log.erro("Evento de ciclo de vida inválido", erro=str(json_err))
+            cache_leiloes_ativos.invalidar()
 
 ## Rest ##
 
 @app.route('/leiloes', methods=['POST'])
 def add_leilao():
     novo_leilao = request.get_json()
-    print(f"Adicionando novo leilao: {novo_leilao.get('id')} | {novo_leilao.get('desc')}")
+    log.info("Novo leilão", leilao_id=novo_leilao.get('id'), desc=novo_leilao.get('desc'))
     try:
-        response = requests.post(f'{LEILAO_SERVICE_URL}/leiloes', json=novo_leilao)
+        response = leilao_upstream.post('/leiloes', json=novo_leilao)
         response.raise_for_status()
         return jsonify(response.json()), response.status_code
     except requests.exceptions.RequestException as e:
@@ -151,9 +273,9 @@ def add_leilao():
 @app.route('/lances', methods=['POST'])
 def add_lance():
     novo_lance = request.get_json()
-    print(f"Novo lance realizado no leilao {novo_lance.get('id')} de {novo_lance.get('valor')} reais")
+    log.amostrado(amostra_lances, logs.INFO, "Novo lance", leilao_id=novo_lance.get('id'), valor=novo_lance.get('valor'))
     try:
-        response = requests.post(f'{LANCE_SERVICE_URL}/lances', json=novo_lance, timeout=10)
+        response = lance_upstream.post('/lances', json=novo_lance)
         try:
             return jsonify(response.json()), response.status_code
         except requests.exceptions.JSONDecodeError:
@@ -161,6 +283,18 @@ def add_lance():
     except requests.exceptions.RequestException as e:
         return jsonify({"erro": f"Erro de comunicação com Serviço Lance: {e}"}), 503
     
+@app.route('/lances/batch', methods=['POST'])
+def add_lances_em_lote():
+    novos_lances = request.get_json()
+    try:
+        response = lance_upstream.post('/lances/batch', json=novos_lances)
+        try:
+            return jsonify(response.json()), response.status_code
+        except requests.exceptions.JSONDecodeError:
+            return jsonify({"erro": response.text}), response.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify({"erro": f"Erro de comunicação com Serviço Lance: {e}"}), 503
+
 @app.route('/interest', methods=['POST'])
 def add_interest():
     interest = request.get_json()
@@ -169,13 +303,11 @@ def add_interest():
     if not cliente_id or not leilao_id:
         return jsonify({"erro": "Faltam cliente_id ou leilao_id"}), 400
 
-    lista_de_interessados = interests.get(leilao_id)
-
-    if lista_de_interessados is not None:
-        if cliente_id not in lista_de_interessados:
-            lista_de_interessados.append(cliente_id)
-    else:
-        interests[leilao_id] = [cliente_id]
+    try:
+        if interesses.seguir(leilao_id, cliente_id):
+            sse.notificar_interesse(cliente_id, seguir=[leilao_id])
+    except redis.exceptions.RedisError as e:
+        return jsonify({"erro": f"Erro de comunicação com Redis: {e}"}), 503
 
     return jsonify({"sucesso": f"Cliente {cliente_id} a seguir o leilão {leilao_id}"})
         
@@ -188,47 +320,73 @@ def del_interest():
     if not leilao_id or not cliente_id:
         return jsonify({"erro": "Faltam cliente_id ou leilao_id"}), 400
 
-    lista_de_interessados = interests.get(leilao_id)
+    try:
+        removido = interesses.deixar_de_seguir(leilao_id, cliente_id)
+        if removido:
+            sse.notificar_interesse(cliente_id, deixar=[leilao_id])
+    except redis.exceptions.RedisError as e:
+        return jsonify({"erro": f"Erro de comunicação com Redis: {e}"}), 503
 
-    if lista_de_interessados is None:
+    if removido is None:
         return jsonify({"aviso": "Leilão não encontrado nos interesses"}), 404
 
-    if cliente_id in lista_de_interessados:
-        lista_de_interessados.remove(cliente_id)
-        
-        print(f"[interesses] Interesse removido de {cliente_id} por {leilao_id}")
-        
-        if not lista_de_interessados:
-            del interests[leilao_id]
-            print(f"[interesses] Lista do leilão {leilao_id} removida por estar vazia.")
-
+    if removido:
+        log.info("Interesse removido", cliente_id=cliente_id, leilao_id=leilao_id)
         return jsonify({"sucesso": "Interesse removido"}), 200
     else:
         return jsonify({"aviso": "Cliente não estava na lista de interesses"}), 200
 
+@app.route('/interest/<cliente_id>', methods=['DELETE'])
+def del_all_interests(cliente_id):
+    """Remove todos os interesses de um cliente (ex.: ao fechar a stream SSE)"""
+    try:
+        leiloes = interesses.remover_cliente(cliente_id)
+        if leiloes:
+            sse.notificar_interesse(cliente_id, deixar=leiloes)
+    except redis.exceptions.RedisError as e:
+        return jsonify({"erro": f"Erro de comunicação com Redis: {e}"}), 503
+    log.info("Interesses do cliente removidos", cliente_id=cliente_id, leiloes=len(leiloes))
+    return jsonify({"sucesso": "Interesses removidos", "leiloes": sorted(leiloes)}), 200
+
+
+def carregar_leiloes_ativos():
+    """Busca a lista de leilões ativos no MS Leilão"""
+    response = leilao_upstream.get('/leiloes')
+    response.raise_for_status()
+    return response.json()
+
+cache_leiloes_ativos = CacheLeiloesAtivos(carregar_leiloes_ativos)
 
 @app.route('/leiloes/ativos', methods=['GET'])
 def get_leiloes_ativos():
     try:
-        response = requests.get(f'{LEILAO_SERVICE_URL}/leiloes')
-        response.raise_for_status() 
-        return jsonify(response.json()), response.status_code
+        corpo, etag = cache_leiloes_ativos.obter()
     except requests.exceptions.RequestException as e:
         return jsonify({"erro": f"Erro de comunicação com Serviço Leilão: {e}"}), 503
 
-if __name__ == '__main__':
+    response = Response(corpo, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+consumidores = RabbitMQConsumer(app)
+
+@servico.ao_iniciar
+def conectar_redis():
     try:
         redis_client = redis.from_url(app.config['REDIS_URL'])
         redis_client.ping()
-        print(f"Redis conectado com sucesso em: {app.config['REDIS_URL']}")
+        log.info("Redis conectado", url=app.config['REDIS_URL'])
     except Exception as e:
-        print(f"AVISO: Não foi possível conectar ao Redis: {e}")
-    
-    app_context = app.app_context() 
+        log.aviso("Não foi possível conectar ao Redis", url=app.config['REDIS_URL'], erro=str(e))
 
-    consumer_thread = RabbitMQConsumer(app_context)
-    consumer_thread.start()
-    
-    print("Iniciando API Gateway (Flask)...")
-    
-    app.run(debug=True, threaded=True, port=5000, use_reloader=False)
\ No newline at end of file
+servico.ao_iniciar(consumidores.start)
+servico.ao_parar(consumidores.stop)
+
+def criar_app() -> Flask:
+    """Fábrica usada pelo servidor WSGI: inicia o gateway neste processo e retorna a aplicação"""
+    return servico.iniciar()
+
+if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção: python servir.py gateway
+    log.info("API Gateway iniciado", porta=5000)
+    criar_app().run(threaded=True, port=5000)
\ No newline at end of file
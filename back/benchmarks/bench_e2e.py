@@ -0,0 +1,372 @@
+"""
+Benchmark ponta a ponta do pipeline de leilões: sobe no mesmo processo o
+MS Leilão, o MS Lance, o MS Pagamento, o sistema de pagamento externo e o
+API Gateway, cada um na sua porta, com o RabbitMQ trocado pelo transporte
+em memória (transporte_memoria) e o Redis pelo fakeredis. Os cenários são
+dirigidos pelo gateway via HTTP:
+
+  criacao_leiloes        rajada de criação de leilões
+  guerra_lances          muitos clientes dando lances num único leilão
+  leiloes_frios          muitos leilões com um lance cada
+  liquidacao_pagamentos  leilões que terminam juntos, até o status do pagamento
+
+Para cada cenário são medidos p50/p99 e vazão das requisições HTTP, de cada
+salto do broker (publicação -> entrega e publicação -> ack) e dos eventos SSE
+(lance -> lance_v; fim do leilão -> leilao_v -> link_p -> status_p).
+
+Uso: python benchmarks/bench_e2e.py [--escala 1.0] [--clientes 32] [--cenarios guerra_lances,...]
+                                    [--com-fsync] [--saida bench_e2e.json]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fakeredis  # noqa: E402
+import redis  # noqa: E402
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import utils  # noqa: E402
+from transporte_memoria import BrokerMemoria, TransporteMemoria  # noqa: E402
+
+GATEWAY_URL = 'http://localhost:5000'
+PORTAS = {'ms_leilao': 4999, 'ms_lance': 4998, 'ms_pagamento': 4997,
+          'sistema_pagamento_externo': 5001, 'API_Gateway': 5000}
+CENARIOS = ('criacao_leiloes', 'guerra_lances', 'leiloes_frios', 'liquidacao_pagamentos')
+
+def percentis(amostras) -> dict:
+    """Contagem, p50 e p99 (ms) de uma lista de latências em segundos"""
+    ordenadas = sorted(amostras)
+    if not ordenadas:
+        return {"n": 0, "p50_ms": None, "p99_ms": None}
+    return {
+        "n": len(ordenadas),
+        "p50_ms": round(ordenadas[len(ordenadas) // 2] * 1e3, 3),
+        "p99_ms": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))] * 1e3, 3),
+    }
+
+class ObservadorSSE(threading.Thread):
+    """Assina todos os canais de leilão no (fake)Redis e registra quando cada evento chegou"""
+    def __init__(self, cliente_redis):
+        super().__init__(name='observador-sse', daemon=True)
+        self.pubsub = cliente_redis.pubsub()
+        self.pubsub.psubscribe('leilao:*')
+        self._lock = threading.Lock()
+        self.eventos = []  # (instante time.time(), tipo, evento)
+
+    def run(self):
+        for mensagem in self.pubsub.listen():
+            if mensagem['type'] != 'pmessage':
+                continue
+            agora = time.time()
+            try:
+                envelope = json.loads(mensagem['data'])
+                dados = envelope['data']
+                evento = json.loads(dados) if isinstance(dados, str) else dados
+            except (ValueError, KeyError, TypeError):
+                continue
+            with self._lock:
+                self.eventos.append((agora, envelope.get('type'), evento))
+
+    def desde(self, indice: int):
+        with self._lock:
+            return self.eventos[indice:]
+
+    def marcar(self) -> int:
+        with self._lock:
+            return len(self.eventos)
+
+class Ambiente:
+    """Os cinco serviços em threads, sobre o broker em memória e o fakeredis"""
+    def __init__(self, diretorio: str, fsync: bool):
+        os.environ.setdefault('LEILAO_DIRETORIO_DADOS', os.path.join(diretorio, 'ms_leilao'))
+        os.environ.setdefault('LANCE_DIRETORIO_DADOS', os.path.join(diretorio, 'ms_lance'))
+        os.environ.setdefault('LEILAO_FSYNC', '1' if fsync else '0')
+        os.environ.setdefault('LANCE_FSYNC', '1' if fsync else '0')
+        # Liquidação automática rápida e webhooks sem atraso: o cenário mede o pipeline, não o simulador
+        os.environ.setdefault('SIMULACAO_AUTO', '1')
+        os.environ.setdefault('SIMULACAO_LATENCIA', 'fixa:20')
+        os.environ.setdefault('WEBHOOK_ATRASO', '0')
+
+        transporte = TransporteMemoria(declarar=utils.setup_queues, medir=True)
+        utils.usar_transporte(transporte)
+        self.broker = transporte.broker
+        servidor_redis = fakeredis.FakeServer()
+        fabrica = lambda *args, **kwargs: fakeredis.FakeStrictRedis(server=servidor_redis)  # noqa: E731
+        redis.from_url = fabrica
+        redis.StrictRedis.from_url = staticmethod(fabrica)
+        self.redis = fabrica()
+
+        # Cada serviço é iniciado pela mesma fábrica usada pelo servidor de produção (servir.py)
+        self.modulos = {}
+        self.servidores = []
+        for nome, porta in PORTAS.items():
+            self.modulos[nome] = modulo = __import__(nome)
+            servidor = make_server('localhost', porta, modulo.criar_app(), threaded=True)
+            threading.Thread(target=servidor.serve_forever, name=f'http-{nome}', daemon=True).start()
+            self.servidores.append(servidor)
+
+        self.observador = ObservadorSSE(self.redis)
+        self.observador.start()
+
+    def fechar(self):
+        for servidor in self.servidores:
+            servidor.shutdown()
+        for modulo in self.modulos.values():
+            modulo.servico.parar()
+
+class Cenario:
+    """Dispara requisições em paralelo pelo gateway, guardando a latência de cada uma"""
+    def __init__(self, ambiente: Ambiente, clientes: int):
+        self.ambiente = ambiente
+        self.clientes = clientes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.http = {}  # endpoint -> {"latencias": [...], "status": {codigo: n}}
+        self.duracao_http = {}
+
+    def _sessao(self) -> requests.Session:
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = self._local.sessao = requests.Session()
+        return sessao
+
+    def _post(self, endpoint: str, corpo, ao_enviar=None) -> requests.Response:
+        if ao_enviar:
+            ao_enviar(corpo)
+        inicio = time.perf_counter()
+        resposta = self._sessao().post(GATEWAY_URL + endpoint, json=corpo, timeout=30)
+        latencia = time.perf_counter() - inicio
+        with self._lock:
+            registro = self.http.setdefault(endpoint, {"latencias": [], "status": {}})
+            registro["latencias"].append(latencia)
+            registro["status"][resposta.status_code] = registro["status"].get(resposta.status_code, 0) + 1
+        return resposta
+
+    def disparar(self, endpoint: str, corpos, ao_enviar=None):
+        """Envia todos os corpos para o endpoint com `clientes` conexões concorrentes"""
+        corpos = list(corpos)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.clientes) as executor:
+            list(executor.map(lambda corpo: self._post(endpoint, corpo, ao_enviar), corpos))
+        self.duracao_http[endpoint] = self.duracao_http.get(endpoint, 0.0) + time.perf_counter() - inicio
+
+    def criar_leiloes(self, prefixo: str, quantidade: int, duracao_s: float):
+        fim = (datetime.datetime.now() + datetime.timedelta(seconds=duracao_s)).isoformat()
+        self.disparar('/leiloes', ({"id": f'{prefixo}-{i}', "desc": f'Leilão {prefixo} {i}',
+                                    "hora_finalizacao": fim, "criador_id": 'bench'}
+                                   for i in range(quantidade)))
+        # Os lances só são aceitos depois que o MS Lance consumiu leilao_iniciado
+        self.ambiente.broker.aguardar_ociosidade()
+        return fim
+
+    def resultado_http(self) -> dict:
+        resultado = {}
+        for endpoint, registro in self.http.items():
+            duracao = self.duracao_http.get(endpoint) or float('nan')
+            resultado[endpoint] = {
+                **percentis(registro["latencias"]),
+                "req_por_s": round(len(registro["latencias"]) / duracao, 1),
+                "status": {str(codigo): n for codigo, n in sorted(registro["status"].items())},
+            }
+        return resultado
+
+def resultado_broker(broker: BrokerMemoria, duracao: float) -> dict:
+    resultado = {}
+    for salto, estatisticas in sorted(broker.estatisticas.items()):
+        resultado[salto] = {
+            "publicadas": estatisticas.publicadas,
+            "eventos_por_s": round(estatisticas.publicadas / duracao, 1),
+            "entrega": percentis(estatisticas.entregas),
+            "ack": percentis(estatisticas.acks),
+        }
+    return resultado
+
+def latencias_lances(eventos, enviados) -> list:
+    """Lance enviado -> lance_v recebido no canal SSE, casando por (leilão, valor)"""
+    latencias = []
+    for instante, tipo, evento in eventos:
+        if tipo == 'lance_v':
+            enviado = enviados.get((str(evento.get('id')), float(evento.get('valor', 0))))
+            if enviado is not None:
+                latencias.append(instante - enviado)
+    return latencias
+
+def cenario_criacao_leiloes(ambiente: Ambiente, clientes: int, escala: float) -> Cenario:
+    cenario = Cenario(ambiente, clientes)
+    cenario.criar_leiloes('criacao', max(1, int(500 * escala)), 3600)
+    return cenario
+
+def cenario_guerra_lances(ambiente: Ambiente, clientes: int, escala: float) -> Cenario:
+    cenario = Cenario(ambiente, clientes)
+    cenario.criar_leiloes('guerra', 1, 3600)
+    valores = itertools.count(1)
+    enviados = {}  # (leilao_id, valor) -> instante do envio
+
+    def enviar(lance):
+        # Contador compartilhado: valores crescentes, mas a ordem de chegada varia (há recusas)
+        lance["valor"] = float(next(valores))
+        enviados[(lance["id"], lance["valor"])] = time.time()
+
+    marca = ambiente.observador.marcar()
+    cenario.disparar('/lances', ({"id": 'guerra-0', "usuario_id": f'usuario-{i % clientes}'}
+                                 for i in range(max(1, int(3000 * escala)))), enviar)
+    ambiente.broker.aguardar_ociosidade()
+    cenario.sse = {"lance_v": percentis(latencias_lances(ambiente.observador.desde(marca), enviados))}
+    return cenario
+
+def cenario_leiloes_frios(ambiente: Ambiente, clientes: int, escala: float) -> Cenario:
+    cenario = Cenario(ambiente, clientes)
+    quantidade = max(1, int(1000 * escala))
+    cenario.criar_leiloes('frio', quantidade, 3600)
+    enviados = {}
+
+    def enviar(lance):
+        enviados[(lance["id"], lance["valor"])] = time.time()
+
+    marca = ambiente.observador.marcar()
+    cenario.disparar('/lances', ({"id": f'frio-{i}', "usuario_id": f'usuario-{i}', "valor": 10.0}
+                                 for i in range(quantidade)), enviar)
+    ambiente.broker.aguardar_ociosidade()
+    cenario.sse = {"lance_v": percentis(latencias_lances(ambiente.observador.desde(marca), enviados))}
+    return cenario
+
+def cenario_liquidacao_pagamentos(ambiente: Ambiente, clientes: int, escala: float, timeout: float = 60.0) -> Cenario:
+    cenario = Cenario(ambiente, clientes)
+    quantidade = max(1, int(200 * escala))
+    marca = ambiente.observador.marcar()
+    # Prazo curto, mas longo o bastante para todos os leilões receberem o lance antes do fim
+    fim = datetime.datetime.fromisoformat(cenario.criar_leiloes('pagamento', quantidade, 3 + quantidade / 500))
+    cenario.disparar('/lances', ({"id": f'pagamento-{i}', "usuario_id": f'usuario-{i}', "valor": 100.0}
+                                 for i in range(quantidade)))
+
+    limite = time.monotonic() + (fim - datetime.datetime.now()).total_seconds() + timeout
+    while time.monotonic() < limite:
+        finalizados = sum(1 for _, tipo, _ in ambiente.observador.desde(marca) if tipo == 'status_p')
+        if finalizados >= quantidade:
+            break
+        time.sleep(0.1)
+    # Os status chegam ao SSE antes dos acks de link/status_pagamento: espera-os para medir esses saltos
+    ambiente.broker.aguardar_ociosidade()
+
+    chegadas = {}  # leilao_id -> {tipo: instante do primeiro evento}
+    for instante, tipo, evento in ambiente.observador.desde(marca):
+        chegadas.setdefault(str(evento.get('id')), {}).setdefault(tipo, instante)
+    fim_s = fim.timestamp()
+    saltos = {"fim->leilao_v": [], "leilao_v->link_p": [], "link_p->status_p": [], "fim->status_p": []}
+    for tipos in chegadas.values():
+        if 'leilao_v' in tipos:
+            saltos["fim->leilao_v"].append(tipos['leilao_v'] - fim_s)
+        if 'leilao_v' in tipos and 'link_p' in tipos:
+            saltos["leilao_v->link_p"].append(tipos['link_p'] - tipos['leilao_v'])
+        if 'link_p' in tipos and 'status_p' in tipos:
+            saltos["link_p->status_p"].append(tipos['status_p'] - tipos['link_p'])
+        if 'status_p' in tipos:
+            saltos["fim->status_p"].append(tipos['status_p'] - fim_s)
+    cenario.sse = {salto: percentis(latencias) for salto, latencias in saltos.items()}
+    cenario.sse["pagamentos_concluidos"] = len(saltos["fim->status_p"])
+    return cenario
+
+EXECUTORES = {
+    'criacao_leiloes': cenario_criacao_leiloes,
+    'guerra_lances': cenario_guerra_lances,
+    'leiloes_frios': cenario_leiloes_frios,
+    'liquidacao_pagamentos': cenario_liquidacao_pagamentos,
+}
+
+def executar(ambiente: Ambiente, nome: str, clientes: int, escala: float) -> dict:
+    ambiente.broker.aguardar_ociosidade()
+    ambiente.broker.reiniciar_estatisticas()
+    inicio = time.perf_counter()
+    cenario = EXECUTORES[nome](ambiente, clientes, escala)
+    duracao = time.perf_counter() - inicio
+    return {
+        "cenario": nome,
+        "duracao_s": round(duracao, 3),
+        "http": cenario.resultado_http(),
+        "broker": resultado_broker(ambiente.broker, duracao),
+        "sse": getattr(cenario, 'sse', {}),
+    }
+
+def metadados(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "data": datetime.datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "escala": args.escala,
+        "clientes": args.clientes,
+        "fsync": args.com_fsync,
+    }
+
+def ms(valor) -> str:
+    return 'n/a' if valor is None else f'{valor}ms'
+
+def imprimir(resultado: dict, saida):
+    print(f"\n== {resultado['cenario']} ({resultado['duracao_s']}s)", file=saida)
+    for endpoint, r in resultado['http'].items():
+        print(f"  HTTP {endpoint:<14} {r['req_por_s']:>9.1f} req/s  p50={ms(r['p50_ms'])}  p99={ms(r['p99_ms'])}  {r['status']}", file=saida)
+    for salto, r in resultado['broker'].items():
+        print(f"  AMQP {salto:<18} {r['eventos_por_s']:>9.1f} ev/s  entrega p50={ms(r['entrega']['p50_ms'])} "
+              f"p99={ms(r['entrega']['p99_ms'])}  ack p50={ms(r['ack']['p50_ms'])} p99={ms(r['ack']['p99_ms'])}", file=saida)
+    for salto, r in resultado['sse'].items():
+        if isinstance(r, dict):
+            print(f"  SSE  {salto:<18} n={r['n']}  p50={ms(r['p50_ms'])}  p99={ms(r['p99_ms'])}", file=saida)
+        else:
+            print(f"  SSE  {salto:<18} {r}", file=saida)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--escala', type=float, default=1.0, help='Multiplica o tamanho de todos os cenários')
+    parser.add_argument('--clientes', type=int, default=32, help='Conexões HTTP concorrentes')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS))
+    parser.add_argument('--com-fsync', action='store_true', help='Mantém o fsync dos livros de leilões e lances')
+    parser.add_argument('--verboso', action='store_true', help='Mostra os logs dos serviços')
+    parser.add_argument('--saida', default='bench_e2e.json', help='Arquivo JSON para gravar os resultados')
+    args = parser.parse_args()
+
+    cenarios = [c for c in args.cenarios.split(',') if c]
+    desconhecidos = set(cenarios) - set(CENARIOS)
+    if desconhecidos:
+        parser.error(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    if not args.verboso:
+        # Logs dos serviços (módulo logs, já configurado ao importar utils) e do werkzeug:
+        # só erros por padrão, para não misturar com o resumo
+        logging.getLogger('leilao').setLevel(logging.ERROR)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    resultados = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        ambiente = Ambiente(diretorio, fsync=args.com_fsync)
+        try:
+            for nome in cenarios:
+                resultado = executar(ambiente, nome, args.clientes, args.escala)
+                imprimir(resultado, sys.stdout)
+                resultados.append(resultado)
+        finally:
+            ambiente.fechar()
+
+    with open(args.saida, 'w') as f:
+        json.dump({"metadados": metadados(args), "cenarios": resultados}, f, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark do livro de lances do MS Lance: vazão de lances aceitos com
+durabilidade desligada (só memória), com o livro sem fsync e com fsync em grupo.
+
+Uso: python benchmarks/bench_livro_lances.py [--threads 16] [--lances 20000] [--leiloes 64]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LANCE_PERSISTENCIA', '0')  # O benchmark escolhe o livro de cada modo
+
+import ms_lance  # noqa: E402
+from livro_lances import LivroLances  # noqa: E402
+
+def executar(modo: str, threads: int, lances: int, leiloes: int) -> dict:
+    with tempfile.TemporaryDirectory() as diretorio:
+        if modo == 'memoria':
+            ms_lance.livro = None
+        else:
+            ms_lance.livro = LivroLances(diretorio, sincrono=(modo == 'fsync'))
+
+        estados = [ms_lance.EstadoLeilao(f'bench-{i}') for i in range(leiloes)]
+        por_thread = lances // threads
+        latencias = [[] for _ in range(threads)]
+        barreira = threading.Barrier(threads + 1)
+
+        def trabalhar(indice: int):
+            registro = latencias[indice]
+            barreira.wait()
+            for n in range(por_thread):
+                estado = estados[(indice + n) % leiloes]
+                # Valores sempre crescentes por thread: a maioria dos lances é aceita
+                valor = (n + 1) * threads + indice
+                inicio = time.perf_counter()
+                estado.tentar_lance(f'usuario-{indice}', float(valor))
+                registro.append(time.perf_counter() - inicio)
+
+        workers = [threading.Thread(target=trabalhar, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        barreira.wait()
+        inicio = time.perf_counter()
+        for w in workers:
+            w.join()
+        duracao = time.perf_counter() - inicio
+
+        if ms_lance.livro:
+            ms_lance.livro.diario.fechar()
+
+    todas = sorted(l for registro in latencias for l in registro)
+    return {
+        "modo": modo,
+        "lances": len(todas),
+        "lances_por_segundo": round(len(todas) / duracao, 1),
+        "p50_us": round(todas[len(todas) // 2] * 1e6, 1),
+        "p99_us": round(todas[int(len(todas) * 0.99)] * 1e6, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--lances', type=int, default=20000)
+    parser.add_argument('--leiloes', type=int, default=64)
+    parser.add_argument('--saida', help='Arquivo JSON para gravar os resultados')
+    args = parser.parse_args()
+
+    resultados = [executar(modo, args.threads, args.lances, args.leiloes) for modo in ('memoria', 'sem_fsync', 'fsync')]
+    for r in resultados:
+        print(f"{r['modo']:>10}: {r['lances_por_segundo']:>10.1f} lances/s  p50={r['p50_us']}us  p99={r['p99_us']}us")
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump(resultados, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metricas import registro
+
+class CircuitoAberto(requests.exceptions.RequestException):
+    """O serviço de destino está marcado como indisponível pelo disjuntor"""
+
+class UpstreamSaturado(requests.exceptions.RequestException):
+    """Limite de requisições simultâneas para o serviço de destino atingido"""
+
+class DisjuntorCircuito:
+    """
+    Circuit breaker simples: abre após `limite_falhas` falhas seguidas e,
+    depois de `tempo_recuperacao` segundos, deixa passar uma requisição de teste.
+    """
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(self, limite_falhas: int = 5, tempo_recuperacao: float = 10.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_recuperacao = tempo_recuperacao
+        self._lock = threading.Lock()
+        self._estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_em = 0.0
+
+    @property
+    def estado(self) -> str:
+        return self._estado
+
+    def permitir(self) -> bool:
+        """Indica se uma requisição pode ser feita agora"""
+        with self._lock:
+            if self._estado == self.FECHADO:
+                return True
+            if self._estado == self.ABERTO and time.monotonic() - self._aberto_em >= self.tempo_recuperacao:
+                self._estado = self.MEIO_ABERTO  # Apenas uma requisição de teste
+                return True
+            return False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._estado = self.FECHADO
+            self._falhas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self._estado == self.MEIO_ABERTO or self._falhas >= self.limite_falhas:
+                self._estado = self.ABERTO
+                self._aberto_em = time.monotonic()
+
+class ClienteUpstream:
+    """
+    Cliente HTTP para um serviço de destino, com pool de conexões keep-alive,
+    timeouts padrão, limite de concorrência e circuit breaker.
+    Erros são sempre subclasses de requests.exceptions.RequestException.
+    """
+    def __init__(self, base_url: str, timeout_conexao: float = 2.0, timeout_leitura: float = 10.0,
+                 tamanho_pool: int = 20, max_concorrencia: int = 50,
+                 limite_falhas: int = 5, tempo_recuperacao: float = 10.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.disjuntor = DisjuntorCircuito(limite_falhas, tempo_recuperacao)
+        self._vagas = threading.BoundedSemaphore(max_concorrencia)
+
+        self.latencia = registro.histograma('upstream_segundos', 'Duração das requisições ao serviço de destino', destino=self.base_url)
+        self.erros = registro.contador('upstream_erros_total', 'Requisições ao destino que falharam (rede, 5xx ou recusadas localmente)',
+                                       destino=self.base_url)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, caminho: str, **kwargs) -> requests.Response:
+        # Falha rápido em vez de prender mais threads atrás de um serviço lento
+        if not self._vagas.acquire(blocking=False):
+            self.erros.inc()
+            raise UpstreamSaturado(f"Muitas requisições simultâneas para {self.base_url}")
+        if not self.disjuntor.permitir():
+            self._vagas.release()
+            self.erros.inc()
+            raise CircuitoAberto(f"Circuito aberto para {self.base_url}")
+
+        kwargs.setdefault('timeout', self.timeout)
+        inicio = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{caminho}', **kwargs)
+        except requests.exceptions.RequestException:
+            self.disjuntor.registrar_falha()
+            self.erros.inc()
+            raise
+        finally:
+            self._vagas.release()
+            self.latencia.observar(time.perf_counter() - inicio)
+
+        if response.status_code >= 500:
+            self.disjuntor.registrar_falha()
+            self.erros.inc()
+        else:
+            self.disjuntor.registrar_sucesso()
+        return response
+
+    def get(self, caminho: str, **kwargs) -> requests.Response:
+        return self.request('GET', caminho, **kwargs)
+
+    def post(self, caminho: str, **kwargs) -> requests.Response:
+        return self.request('POST', caminho, **kwargs)
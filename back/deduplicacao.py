@@ -0,0 +1,88 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+class FiltroBloom:
+    """Filtro de Bloom sobre um bytearray: pode dar falso positivo, nunca falso negativo"""
+    def __init__(self, capacidade: int, taxa_erro: float = 0.01):
+        self.num_bits = max(8, int(-capacidade * math.log(taxa_erro) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacidade * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posicoes(self, chave: str):
+        # Hash duplo: k posições a partir de dois hashes de 64 bits
+        digest = hashlib.blake2b(chave.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def adicionar(self, chave: str):
+        for p in self._posicoes(chave):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, chave: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._posicoes(chave))
+
+class CacheDeduplicacao:
+    """
+    Lembra os message_ids já processados por um consumidor, para que reentregas
+    (entrega at-least-once do RabbitMQ) sejam descartadas.
+
+    Os IDs ficam num LRU limitado a `capacidade` entradas, cada uma expirando
+    após `ttl` segundos. Um filtro de Bloom na frente responde sem lock e sem
+    tocar no LRU para o caso comum (mensagem nova); só um "talvez" do filtro é
+    conferido no LRU, então a resposta final é sempre exata.
+    """
+    def __init__(self, capacidade: int = 100000, ttl: float = 600.0):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vistos: "OrderedDict[str, float]" = OrderedDict()  # message_id -> expira em (monotonic)
+        self._filtro = FiltroBloom(capacidade)
+        self._inseridos_filtro = 0
+
+    def contem(self, message_id: Optional[str]) -> bool:
+        """Indica se a mensagem já foi processada (mensagens sem ID nunca são descartadas)"""
+        if not message_id or message_id not in self._filtro:
+            return False
+        with self._lock:
+            expira = self._vistos.get(message_id)
+            if expira is None:
+                return False
+            if expira < time.monotonic():
+                del self._vistos[message_id]
+                return False
+            self._vistos.move_to_end(message_id)
+            return True
+
+    def marcar(self, message_id: Optional[str]):
+        """Registra a mensagem como processada"""
+        if not message_id:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            self._vistos[message_id] = agora + self.ttl
+            self._vistos.move_to_end(message_id)
+            # Descarta os menos usados além da capacidade e os expirados do início do LRU
+            while self._vistos:
+                expira = next(iter(self._vistos.values()))
+                if expira >= agora and len(self._vistos) <= self.capacidade:
+                    break
+                self._vistos.popitem(last=False)
+
+            self._filtro.adicionar(message_id)
+            self._inseridos_filtro += 1
+            # O filtro não remove IDs: é reconstruído periodicamente para não saturar
+            if self._inseridos_filtro >= 2 * self.capacidade:
+                filtro = FiltroBloom(self.capacidade)
+                for chave in self._vistos:
+                    filtro.adicionar(chave)
+                self._filtro = filtro
+                self._inseridos_filtro = len(self._vistos)
+
+    def __len__(self) -> int:
+        return len(self._vistos)
@@ -0,0 +1,181 @@
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+class DiarioGroupCommit:
+    """
+    Log append-only em segmentos (diario.000001.log, diario.000002.log, ...),
+    com fsync em grupo: os registros anexados enquanto um fsync está em
+    andamento são gravados juntos no fsync seguinte, feito por uma thread
+    dedicada. Assim o custo de um fsync é dividido entre todos os escritores
+    concorrentes.
+
+    O formato dos registros é responsabilidade de quem usa o diário: cada
+    registro é um bloco de bytes já enquadrado (linha JSON, struct, ...).
+    """
+    PADRAO_SEGMENTO = re.compile(r'^diario\.(\d{6})\.log$')
+
+    def __init__(self, diretorio: str, sincrono: bool = True):
+        self.diretorio = diretorio
+        self.sincrono = sincrono  # False desliga o fsync (benchmarks / desenvolvimento)
+        os.makedirs(diretorio, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._buffer: List[bytes] = []
+        self._seq_anexada = 0  # Último registro anexado ao buffer
+        self._seq_duravel = 0  # Último registro já gravado (e sincronizado)
+        self._erro: Optional[BaseException] = None
+        self._fechado = False
+        self._gravando = False  # Um lote tirado do buffer ainda está sendo gravado
+        self._rotacionando = False  # Novas anexações esperam a troca de segmento
+
+        segmentos = self.segmentos()
+        self._segmento = segmentos[-1][0] if segmentos else 1
+        self._arquivo = open(self._caminho_segmento(self._segmento), 'ab')
+
+        self._gravador = threading.Thread(target=self._gravar, name='diario-group-commit', daemon=True)
+        self._gravador.start()
+
+    def _caminho_segmento(self, numero: int) -> str:
+        return os.path.join(self.diretorio, f'diario.{numero:06d}.log')
+
+    def segmentos(self) -> List[Tuple[int, str]]:
+        """Segmentos existentes em ordem: [(numero, caminho)]"""
+        encontrados = []
+        for nome in os.listdir(self.diretorio):
+            m = self.PADRAO_SEGMENTO.match(nome)
+            if m:
+                encontrados.append((int(m.group(1)), os.path.join(self.diretorio, nome)))
+        return sorted(encontrados)
+
+    def anexar(self, registro: bytes) -> int:
+        """Coloca o registro no buffer e retorna seu número de sequência (sem esperar o disco)"""
+        with self._cond:
+            while self._rotacionando and self._erro is None:
+                self._cond.wait()
+            if self._erro is not None:
+                raise IOError(f"Diário indisponível: {self._erro}")
+            self._buffer.append(registro)
+            self._seq_anexada += 1
+            self._cond.notify_all()
+            return self._seq_anexada
+
+    def aguardar(self, seq: int):
+        """Bloqueia até o registro `seq` estar durável"""
+        with self._cond:
+            while self._seq_duravel < seq and self._erro is None:
+                self._cond.wait()
+            if self._seq_duravel < seq:
+                raise IOError(f"Falha ao gravar o diário: {self._erro}")
+
+    def registrar(self, registro: bytes):
+        """Anexa o registro e espera o commit em grupo"""
+        self.aguardar(self.anexar(registro))
+
+    def _gravar(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._fechado:
+                    self._cond.wait()
+                if not self._buffer and self._fechado:
+                    return
+                lote, self._buffer = self._buffer, []
+                ultimo = self._seq_anexada
+                arquivo = self._arquivo
+                self._gravando = True
+            try:
+                arquivo.write(b''.join(lote))
+                arquivo.flush()
+                if self.sincrono:
+                    os.fsync(arquivo.fileno())
+            except Exception as e:
+                # Qualquer falha encerra o gravador: quem espera recebe o erro em vez de ficar bloqueado
+                with self._cond:
+                    self._erro = e
+                    self._gravando = False
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._seq_duravel = ultimo
+                self._gravando = False
+                self._cond.notify_all()
+
+    def rotacionar(self) -> int:
+        """
+        Passa a escrever num segmento novo e retorna o número dele.
+        Deve ser chamado com o estado de quem escreve congelado: tudo o que foi
+        anexado antes pertence aos segmentos anteriores.
+        """
+        with self._cond:
+            # Segura as novas anexações e espera o buffer e o lote em gravação
+            # irem para o segmento antigo: o gravador nunca escreve num arquivo fechado
+            self._rotacionando = True
+            try:
+                while (self._buffer or self._gravando) and self._erro is None:
+                    self._cond.wait()
+                if self._erro is not None:
+                    raise IOError(f"Diário indisponível: {self._erro}")
+                self._arquivo.close()
+                self._segmento += 1
+                self._arquivo = open(self._caminho_segmento(self._segmento), 'ab')
+                return self._segmento
+            finally:
+                self._rotacionando = False
+                self._cond.notify_all()
+
+    def truncar_segmento_atual(self, tamanho: int):
+        """Descarta uma cauda parcial (registro incompleto após uma queda) antes de novas escritas"""
+        with self._cond:
+            self._arquivo.flush()
+            self._arquivo.truncate(tamanho)
+
+    def remover_segmentos_anteriores(self, numero: int):
+        """Apaga os segmentos já cobertos por um snapshot"""
+        for n, caminho in self.segmentos():
+            if n < numero:
+                os.remove(caminho)
+
+    def ler_segmentos(self, a_partir_de: int = 0) -> Iterator[mmap.mmap]:
+        """
+        Cada segmento a partir do número informado, em ordem, mapeado em memória.
+        O mapeamento só é válido até o próximo item ser pedido.
+        """
+        for n, caminho in self.segmentos():
+            if n >= a_partir_de:
+                with mapear_arquivo(caminho) as conteudo:
+                    yield conteudo
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            self._cond.notify_all()
+        self._gravador.join()
+        self._arquivo.close()
+
+@contextmanager
+def mapear_arquivo(caminho: str):
+    """Mapeia um arquivo em memória só para leitura (arquivos vazios produzem b'')"""
+    with open(caminho, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+def escrever_atomicamente(caminho: str, conteudo: bytes):
+    """Grava um arquivo via arquivo temporário + fsync + rename"""
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+    # Garante que o rename também sobreviva a uma queda
+    fd = os.open(os.path.dirname(os.path.abspath(caminho)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,117 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+class HistoricoLeilao:
+    """
+    Histórico colunar dos lances de um leilão: uma coluna (array) por campo,
+    com timestamps em nanossegundos não decrescentes para permitir busca binária.
+    """
+    __slots__ = ('lock', 'timestamps', 'valores', 'usuarios', 'aceitos', 'maior_por_usuario', 'encerrado')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timestamps = array('q')
+        self.valores = array('d')
+        self.usuarios = array('I')  # Índices na tabela de usuários internados
+        self.aceitos = array('b')
+        self.maior_por_usuario: Dict[int, float] = {}  # Maior lance aceito de cada usuário
+        self.encerrado = False
+
+    def registrar(self, usuario: int, valor: float, aceito: bool):
+        with self.lock:
+            agora = time.time_ns()
+            # Mantém a coluna ordenada mesmo se o relógio de parede voltar
+            if self.timestamps and agora < self.timestamps[-1]:
+                agora = self.timestamps[-1]
+            self.timestamps.append(agora)
+            self.valores.append(valor)
+            self.usuarios.append(usuario)
+            self.aceitos.append(1 if aceito else 0)
+            if aceito and valor > self.maior_por_usuario.get(usuario, 0.0):
+                self.maior_por_usuario[usuario] = valor
+
+class HistoricoLances:
+    """
+    Histórico de todos os lances (aceitos e recusados) por leilão, com IDs de
+    usuário internados. Os históricos de leilões encerrados continuam
+    consultáveis, limitados aos `limite_encerrados` mais recentes.
+    """
+    def __init__(self, limite_encerrados: int = 1000):
+        self.limite_encerrados = limite_encerrados
+        self._lock = threading.Lock()
+        self._leiloes: Dict[str, HistoricoLeilao] = {}
+        self._encerrados: "OrderedDict[str, None]" = OrderedDict()
+        self._indices_usuarios: Dict[str, int] = {}
+        self._usuarios: List[str] = []
+
+    def _internar(self, usuario_id: str) -> int:
+        indice = self._indices_usuarios.get(usuario_id)
+        if indice is None:
+            with self._lock:
+                indice = self._indices_usuarios.get(usuario_id)
+                if indice is None:
+                    indice = len(self._usuarios)
+                    self._usuarios.append(usuario_id)
+                    self._indices_usuarios[usuario_id] = indice
+        return indice
+
+    def obter(self, leilao_id: str) -> Optional[HistoricoLeilao]:
+        return self._leiloes.get(leilao_id)
+
+    def registrar(self, leilao_id: str, usuario_id: str, valor: float, aceito: bool):
+        """Registra um lance; cria o histórico do leilão no primeiro lance"""
+        historico = self._leiloes.get(leilao_id)
+        if historico is None:
+            with self._lock:
+                historico = self._leiloes.setdefault(leilao_id, HistoricoLeilao())
+        historico.registrar(self._internar(usuario_id), valor, aceito)
+
+    def encerrar(self, leilao_id: str):
+        """Marca o histórico como encerrado e descarta os encerrados mais antigos além do limite"""
+        with self._lock:
+            historico = self._leiloes.get(leilao_id)
+            if historico is None or historico.encerrado:
+                return
+            historico.encerrado = True
+            self._encerrados[leilao_id] = None
+            while len(self._encerrados) > self.limite_encerrados:
+                antigo, _ = self._encerrados.popitem(last=False)
+                self._leiloes.pop(antigo, None)
+
+    def _linha(self, historico: HistoricoLeilao, i: int) -> Dict:
+        return {
+            "usuario_id": self._usuarios[historico.usuarios[i]],
+            "valor": historico.valores[i],
+            "aceito": bool(historico.aceitos[i]),
+            "timestamp": historico.timestamps[i] / 1e9
+        }
+
+    def pagina(self, historico: HistoricoLeilao, pagina: int, tamanho: int, recentes_primeiro: bool = False) -> Tuple[int, List[Dict]]:
+        """Retorna (total, lances da página); páginas começam em 1"""
+        with historico.lock:
+            total = len(historico.timestamps)
+            inicio = (pagina - 1) * tamanho
+            fim = min(inicio + tamanho, total)
+            if recentes_primeiro:
+                indices = range(total - 1 - inicio, total - 1 - fim, -1)
+            else:
+                indices = range(inicio, fim)
+            return total, [self._linha(historico, i) for i in indices]
+
+    def intervalo(self, historico: HistoricoLeilao, inicio_s: float, fim_s: float, limite: int) -> Tuple[int, List[Dict]]:
+        """Lances com timestamp em [inicio_s, fim_s], por busca binária; retorna (total_no_intervalo, lances)"""
+        with historico.lock:
+            a = bisect_left(historico.timestamps, int(inicio_s * 1e9))
+            b = bisect_right(historico.timestamps, int(fim_s * 1e9))
+            return b - a, [self._linha(historico, i) for i in range(a, min(b, a + limite))]
+
+    def top_usuarios(self, historico: HistoricoLeilao, n: int) -> List[Dict]:
+        """Os n usuários com os maiores lances aceitos"""
+        with historico.lock:
+            maiores = heapq.nlargest(n, historico.maior_por_usuario.items(), key=lambda item: item[1])
+        return [{"usuario_id": self._usuarios[usuario], "valor": valor} for usuario, valor in maiores]
@@ -0,0 +1,130 @@
+import threading
+import redis
+from typing import Dict, Optional, Set, Tuple
+
+class RegistroInteresses:
+    """
+    Interesses cliente ↔ leilão: um conjunto de clientes por leilão e o índice
+    reverso (leilões seguidos por cliente), ambos protegidos por um lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_leilao: Dict[str, Set[str]] = {}
+        self._por_cliente: Dict[str, Set[str]] = {}
+
+    def seguir(self, leilao_id: str, cliente_id: str) -> bool:
+        """Registra o interesse; retorna False se já existia"""
+        with self._lock:
+            seguidores = self._por_leilao.setdefault(leilao_id, set())
+            if cliente_id in seguidores:
+                return False
+            seguidores.add(cliente_id)
+            self._por_cliente.setdefault(cliente_id, set()).add(leilao_id)
+            return True
+
+    def deixar_de_seguir(self, leilao_id: str, cliente_id: str) -> Optional[bool]:
+        """Remove o interesse; None se o leilão não tem seguidores, False se o cliente não o seguia"""
+        with self._lock:
+            seguidores = self._por_leilao.get(leilao_id)
+            if seguidores is None:
+                return None
+            if cliente_id not in seguidores:
+                return False
+            self._remover(leilao_id, cliente_id)
+            return True
+
+    def remover_cliente(self, cliente_id: str) -> Set[str]:
+        """Remove todos os interesses de um cliente; retorna os leilões que ele seguia"""
+        with self._lock:
+            leiloes = self._por_cliente.get(cliente_id, set()).copy()
+            for leilao_id in leiloes:
+                self._remover(leilao_id, cliente_id)
+            return leiloes
+
+    def _remover(self, leilao_id: str, cliente_id: str):
+        seguidores = self._por_leilao[leilao_id]
+        seguidores.discard(cliente_id)
+        if not seguidores:
+            del self._por_leilao[leilao_id]
+        leiloes = self._por_cliente.get(cliente_id)
+        if leiloes is not None:
+            leiloes.discard(leilao_id)
+            if not leiloes:
+                del self._por_cliente[cliente_id]
+
+    def leiloes_do_cliente(self, cliente_id: str) -> Tuple[str, ...]:
+        """Leilões seguidos por um cliente"""
+        with self._lock:
+            return tuple(self._por_cliente.get(cliente_id, ()))
+
+    def seguidores(self, leilao_id: str) -> Tuple[str, ...]:
+        """Cópia dos seguidores de um leilão (segura para iterar fora do lock)"""
+        with self._lock:
+            return tuple(self._por_leilao.get(leilao_id, ()))
+
+class RegistroInteressesRedis:
+    """
+    Mesma interface de RegistroInteresses, mas com os conjuntos guardados no Redis
+    para que várias instâncias do gateway compartilhem os interesses.
+
+    Chaves: interesses:leilao:<id> (clientes) e interesses:cliente:<id> (leilões).
+    Não há cache local: o fan-out dos eventos é feito pelo canal SSE de cada
+    leilão, e só o stream de um cliente lê os leilões dele, ao conectar.
+    """
+    def __init__(self, cliente_redis: redis.Redis):
+        self.redis = cliente_redis
+
+    @staticmethod
+    def _chave_leilao(leilao_id: str) -> str:
+        return f'interesses:leilao:{leilao_id}'
+
+    @staticmethod
+    def _chave_cliente(cliente_id: str) -> str:
+        return f'interesses:cliente:{cliente_id}'
+
+    def seguir(self, leilao_id: str, cliente_id: str) -> bool:
+        """Registra o interesse; retorna False se já existia"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.sadd(self._chave_leilao(leilao_id), cliente_id)
+        pipe.sadd(self._chave_cliente(cliente_id), leilao_id)
+        adicionado, _ = pipe.execute()
+        return bool(adicionado)
+
+    def deixar_de_seguir(self, leilao_id: str, cliente_id: str) -> Optional[bool]:
+        """Remove o interesse; None se o leilão não tem seguidores, False se o cliente não o seguia"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.exists(self._chave_leilao(leilao_id))
+        pipe.srem(self._chave_leilao(leilao_id), cliente_id)
+        pipe.srem(self._chave_cliente(cliente_id), leilao_id)
+        existia, removido, _ = pipe.execute()
+        if not existia:
+            return None
+        return bool(removido)
+
+    def remover_cliente(self, cliente_id: str) -> Set[str]:
+        """Remove todos os interesses de um cliente; retorna os leilões que ele seguia"""
+        chave_cliente = self._chave_cliente(cliente_id)
+        leiloes: Set[str] = set()
+
+        def remover(pipe):
+            leiloes.clear()
+            leiloes.update(m.decode('utf-8') if isinstance(m, bytes) else m
+                           for m in pipe.smembers(chave_cliente))
+            pipe.multi()
+            for leilao_id in leiloes:
+                pipe.srem(self._chave_leilao(leilao_id), cliente_id)
+            pipe.delete(chave_cliente)
+
+        # WATCH na chave do cliente: refaz se ele seguir algo durante a remoção
+        self.redis.transaction(remover, chave_cliente)
+        return leiloes
+
+    def leiloes_do_cliente(self, cliente_id: str) -> Tuple[str, ...]:
+        """Leilões seguidos por um cliente (sempre lido do Redis)"""
+        return tuple(m.decode('utf-8') if isinstance(m, bytes) else m
+                     for m in self.redis.smembers(self._chave_cliente(cliente_id)))
+
+    def seguidores(self, leilao_id: str) -> Tuple[str, ...]:
+        """Seguidores de um leilão"""
+        return tuple(m.decode('utf-8') if isinstance(m, bytes) else m
+                     for m in self.redis.smembers(self._chave_leilao(leilao_id)))
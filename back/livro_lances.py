@@ -0,0 +1,130 @@
+import os
+import struct
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from diario import DiarioGroupCommit, escrever_atomicamente, mapear_arquivo
+
+# Tipos de registro
+INICIADO = 1
+LANCE = 2
+FINALIZADO = 3
+
+# crc32, tipo, tamanho do leilao_id, tamanho do usuario_id, valor; seguido dos dois IDs em UTF-8
+CABECALHO = struct.Struct('<IBHHd')
+CABECALHO_SNAPSHOT = struct.Struct('<Q')  # Número do primeiro segmento não coberto pelo snapshot
+
+def codificar(tipo: int, leilao_id: str, usuario_id: str = '', valor: float = 0.0) -> bytes:
+    """Codifica um registro binário com CRC32 (detecta registros incompletos na recuperação)"""
+    leilao = leilao_id.encode('utf-8')
+    usuario = usuario_id.encode('utf-8')
+    corpo = CABECALHO.pack(0, tipo, len(leilao), len(usuario), valor)[4:] + leilao + usuario
+    return struct.pack('<I', zlib.crc32(corpo)) + corpo
+
+def decodificar(buffer, inicio: int = 0) -> Iterator[Tuple[int, int, str, str, float]]:
+    """
+    Percorre os registros de um buffer (bytes ou mmap) a partir de `inicio`.
+    Produz (fim_do_registro, tipo, leilao_id, usuario_id, valor) e para no
+    primeiro registro incompleto ou corrompido.
+    """
+    tamanho_total = len(buffer)
+    pos = inicio
+    while pos + CABECALHO.size <= tamanho_total:
+        crc, tipo, tam_leilao, tam_usuario, valor = CABECALHO.unpack_from(buffer, pos)
+        fim = pos + CABECALHO.size + tam_leilao + tam_usuario
+        if fim > tamanho_total or zlib.crc32(buffer[pos + 4:fim]) != crc:
+            return
+        ids = pos + CABECALHO.size
+        leilao_id = buffer[ids:ids + tam_leilao].decode('utf-8')
+        usuario_id = buffer[ids + tam_leilao:fim].decode('utf-8')
+        yield fim, tipo, leilao_id, usuario_id, valor
+        pos = fim
+
+class LivroLances:
+    """
+    Livro-razão durável dos lances aceitos em formato binário compacto, sobre o
+    diário com fsync em grupo. Registra também início e fim dos leilões, para
+    que a recuperação reconstrua os leilões ativos e o maior lance de cada um.
+    """
+    def __init__(self, diretorio: str, sincrono: bool = True, registros_por_snapshot: int = 100000):
+        self.caminho_snapshot = os.path.join(diretorio, 'snapshot.bin')
+        self.registros_por_snapshot = registros_por_snapshot
+        self.diario = DiarioGroupCommit(diretorio, sincrono=sincrono)
+        self._desde_snapshot = 0
+
+    def _anexar(self, registro: bytes) -> int:
+        self._desde_snapshot += 1
+        return self.diario.anexar(registro)
+
+    def registrar_iniciado(self, leilao_id: str) -> int:
+        return self._anexar(codificar(INICIADO, leilao_id))
+
+    def registrar_lance(self, leilao_id: str, usuario_id: str, valor: float) -> int:
+        return self._anexar(codificar(LANCE, leilao_id, usuario_id, valor))
+
+    def registrar_finalizado(self, leilao_id: str) -> int:
+        return self._anexar(codificar(FINALIZADO, leilao_id))
+
+    def aguardar(self, seq: int):
+        self.diario.aguardar(seq)
+
+    def precisa_compactar(self) -> bool:
+        return self._desde_snapshot >= self.registros_por_snapshot
+
+    def compactar(self, estados: Callable[[], Iterable[Tuple[str, Optional[str], float]]]) -> int:
+        """
+        Grava um snapshot com (leilao_id, usuario_id, valor) de cada leilão ativo e
+        apaga os segmentos anteriores; retorna o número de leilões no snapshot.
+        `estados` só é chamada depois da rotação: um registro gravado nos segmentos
+        antigos já está refletido no estado lido, e o que vier depois vai para o
+        segmento novo (registros repetidos são idempotentes na reaplicação).
+        """
+        segmento = self.diario.rotacionar()
+        partes = [CABECALHO_SNAPSHOT.pack(segmento)]
+        leiloes = 0
+        for leilao_id, usuario_id, valor in estados():
+            leiloes += 1
+            partes.append(codificar(INICIADO, leilao_id))
+            if usuario_id:
+                partes.append(codificar(LANCE, leilao_id, usuario_id, valor))
+        escrever_atomicamente(self.caminho_snapshot, b''.join(partes))
+        self.diario.remover_segmentos_anteriores(segmento)
+        self._desde_snapshot = 0
+        return leiloes
+
+    @staticmethod
+    def _aplicar(estados: Dict[str, Tuple[str, float]], tipo: int, leilao_id: str, usuario_id: str, valor: float):
+        if tipo == INICIADO:
+            estados.setdefault(leilao_id, (None, 0.0))
+        elif tipo == LANCE:
+            atual = estados.get(leilao_id)
+            if atual is not None and valor > atual[1]:
+                estados[leilao_id] = (usuario_id, valor)
+        elif tipo == FINALIZADO:
+            estados.pop(leilao_id, None)
+
+    def recuperar(self) -> Dict[str, Tuple[str, float]]:
+        """Reconstrói {leilao_id: (usuario_id, maior_valor)} dos leilões ativos percorrendo o log"""
+        estados: Dict[str, Tuple[str, float]] = {}
+        segmento_inicial = 0
+
+        if os.path.exists(self.caminho_snapshot):
+            with mapear_arquivo(self.caminho_snapshot) as conteudo:
+                if conteudo:
+                    segmento_inicial, = CABECALHO_SNAPSHOT.unpack_from(conteudo, 0)
+                    for _, tipo, leilao_id, usuario_id, valor in decodificar(conteudo, CABECALHO_SNAPSHOT.size):
+                        self._aplicar(estados, tipo, leilao_id, usuario_id, valor)
+
+        segmentos = [n for n, _ in self.diario.segmentos() if n >= segmento_inicial]
+        cauda_valida = None
+        for numero, conteudo in zip(segmentos, self.diario.ler_segmentos(segmento_inicial)):
+            tamanho_valido = 0
+            for fim, tipo, leilao_id, usuario_id, valor in decodificar(conteudo):
+                self._aplicar(estados, tipo, leilao_id, usuario_id, valor)
+                tamanho_valido = fim
+            if numero == segmentos[-1] and tamanho_valido < len(conteudo):
+                cauda_valida = tamanho_valido
+
+        # Novas escritas não podem ser anexadas depois de um registro incompleto
+        if cauda_valida is not None:
+            self.diario.truncar_segmento_atual(cauda_valida)
+        return estados
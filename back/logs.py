@@ -0,0 +1,142 @@
+"""
+Logging estruturado e assíncrono dos serviços.
+
+Quem loga apenas enfileira o registro; uma thread de fundo formata (JSON, uma
+linha por evento) e escreve no stdout. Eventos abaixo de LOG_NIVEL são
+descartados antes de qualquer formatação, e eventos frequentes (um por
+lance) passam por uma amostragem. Se a fila encher, os eventos excedentes são
+descartados e contados em vez de bloquear a requisição.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from metricas import registro
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+AVISO = logging.WARNING
+ERRO = logging.ERROR
+
+LOG_NIVEL = os.environ.get('LOG_NIVEL', 'INFO').upper()
+LOG_FORMATO = os.environ.get('LOG_FORMATO', 'json')  # json | texto
+LOG_AMOSTRAGEM_LANCES = float(os.environ.get('LOG_AMOSTRAGEM_LANCES', 0.01))  # Fração dos eventos por lance registrada
+LOG_TAMANHO_FILA = int(os.environ.get('LOG_TAMANHO_FILA', 10000))
+
+descartados = registro.contador('logs_descartados_total', 'Eventos de log descartados com a fila cheia')
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": round(record.created, 6),
+            "nivel": record.levelname,
+            "origem": record.name,
+            "msg": record.getMessage(),
+        }
+        dados.update(getattr(record, 'campos', None) or {})
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+class FormatadorTexto(logging.Formatter):
+    """Formato legível para desenvolvimento (LOG_FORMATO=texto)"""
+    def format(self, record: logging.LogRecord) -> str:
+        instante = time.strftime('%H:%M:%S', time.localtime(record.created))
+        campos = ' '.join(f'{k}={v}' for k, v in (getattr(record, 'campos', None) or {}).items())
+        linha = f"{instante}.{int(record.msecs):03d} {record.levelname:<7} [{record.name}] {record.getMessage()} {campos}".rstrip()
+        if record.exc_info:
+            linha += '\n' + self.formatException(record.exc_info)
+        return linha
+
+class HandlerFila(logging.handlers.QueueHandler):
+    """Enfileira sem formatar (a formatação fica na thread de fundo) e sem bloquear"""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            descartados.inc()
+
+_configurado = False
+_lock = threading.Lock()
+
+def configurar():
+    """Liga o logger raiz dos serviços à fila e inicia a thread de escrita (uma vez por processo)"""
+    global _configurado
+    with _lock:
+        if _configurado:
+            return
+        saida = logging.StreamHandler(sys.stdout)
+        saida.setFormatter(FormatadorTexto() if LOG_FORMATO == 'texto' else FormatadorJSON())
+        fila = queue.Queue(LOG_TAMANHO_FILA)
+        escritor = logging.handlers.QueueListener(fila, saida)
+        escritor.start()
+        atexit.register(escritor.stop)  # Escreve o que ainda estiver na fila
+
+        raiz = logging.getLogger('leilao')
+        raiz.setLevel(LOG_NIVEL)
+        raiz.handlers = [HandlerFila(fila)]
+        raiz.propagate = False
+        _configurado = True
+
+def _reconfigurar_no_filho():
+    # A thread de escrita não sobrevive ao fork (ex.: workers do servidor WSGI): o filho cria a sua
+    global _configurado, _lock
+    _lock = threading.Lock()
+    if _configurado:
+        _configurado = False
+        configurar()
+
+os.register_at_fork(after_in_child=_reconfigurar_no_filho)
+
+class Log:
+    """
+    Logger de um componente. Os campos nomeados viram chaves do JSON:
+    log.info("Lance aceito", leilao_id=..., valor=...).
+    """
+    __slots__ = ('_logger',)
+
+    def __init__(self, nome: str):
+        configurar()
+        self._logger = logging.getLogger(f'leilao.{nome}')
+
+    def ativo(self, nivel: int) -> bool:
+        return self._logger.isEnabledFor(nivel)
+
+    def registrar(self, nivel: int, mensagem: str, excecao: bool = False, **campos):
+        if self._logger.isEnabledFor(nivel):
+            self._logger.log(nivel, mensagem, exc_info=excecao, extra={'campos': campos})
+
+    def debug(self, mensagem: str, **campos):
+        self.registrar(DEBUG, mensagem, **campos)
+
+    def info(self, mensagem: str, **campos):
+        self.registrar(INFO, mensagem, **campos)
+
+    def aviso(self, mensagem: str, **campos):
+        self.registrar(AVISO, mensagem, **campos)
+
+    def erro(self, mensagem: str, excecao: bool = False, **campos):
+        self.registrar(ERRO, mensagem, excecao=excecao, **campos)
+
+    def amostrado(self, amostragem: "Amostragem", nivel: int, mensagem: str, **campos):
+        """Registra só se o nível estiver ativo e o evento for sorteado pela amostragem"""
+        if self._logger.isEnabledFor(nivel) and amostragem():
+            self._logger.log(nivel, mensagem, extra={'campos': campos})
+
+class Amostragem:
+    """Deixa passar um de cada round(1 / taxa) eventos (taxa 0 desliga, 1 deixa passar todos)"""
+    def __init__(self, taxa: float):
+        self.intervalo = max(1, round(1 / taxa)) if taxa > 0 else 0
+        self._contador = itertools.count()
+
+    def __call__(self) -> bool:
+        return self.intervalo != 0 and next(self._contador) % self.intervalo == 0
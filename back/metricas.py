@@ -0,0 +1,261 @@
+"""
+Métricas leves para os serviços: contadores, medidores e histogramas de
+latência no estilo HDR, expostos em /metrics no formato texto do Prometheus.
+
+Cada thread escreve numa célula própria (sem lock no caminho quente); a
+leitura soma as células. As células de threads encerradas são somadas a uma
+célula base de tempos em tempos, então servidores que criam uma thread por
+requisição não acumulam células.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+from flask import Response
+
+# Histogramas guardam microssegundos em baldes log-lineares: valores até
+# 2 * SUBBALDES são exatos e, acima disso, o erro relativo é de até 1/SUBBALDES
+BITS_SUBBALDES = 5
+SUBBALDES = 1 << BITS_SUBBALDES
+QUANTIS = (0.5, 0.9, 0.99, 0.999)
+
+def _indice_balde(micros: int) -> int:
+    if micros < 2 * SUBBALDES:
+        return micros
+    expoente = micros.bit_length() - BITS_SUBBALDES - 1
+    return SUBBALDES * expoente + (micros >> expoente)
+
+def _limite_balde(indice: int) -> int:
+    """Maior valor (em microssegundos) que cai no balde"""
+    if indice < 2 * SUBBALDES:
+        return indice
+    expoente = indice // SUBBALDES - 1
+    return ((indice - SUBBALDES * expoente + 1) << expoente) - 1
+
+class _Celulas:
+    """Uma célula mutável por thread; `somar(destino, origem)` acumula uma célula em outra"""
+    def __init__(self, nova: Callable, somar: Callable):
+        self._nova = nova
+        self._somar = somar
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ativas: List[Tuple[threading.Thread, object]] = []
+        self._base = nova()  # Células das threads já encerradas
+
+    def celula(self):
+        try:
+            return self._local.celula
+        except AttributeError:
+            celula = self._local.celula = self._nova()
+            with self._lock:
+                self._ativas.append((threading.current_thread(), celula))
+                if len(self._ativas) > 2 * threading.active_count() + 16:
+                    self._compactar()
+            return celula
+
+    def _compactar(self):
+        # Uma thread encerrada não escreve mais na sua célula
+        ativas = []
+        for thread, celula in self._ativas:
+            if thread.is_alive():
+                ativas.append((thread, celula))
+            else:
+                self._somar(self._base, celula)
+        self._ativas = ativas
+
+    def total(self):
+        total = self._nova()
+        with self._lock:
+            self._compactar()
+            self._somar(total, self._base)
+            for _, celula in self._ativas:
+                self._somar(total, celula)
+        return total
+
+class Contador:
+    """Contador monotônico"""
+    tipo = 'counter'
+
+    def __init__(self):
+        self._celulas = _Celulas(lambda: [0], self._somar)
+
+    @staticmethod
+    def _somar(destino, origem):
+        destino[0] += origem[0]
+
+    def inc(self, n: int = 1):
+        self._celulas.celula()[0] += n
+
+    def valor(self) -> int:
+        return self._celulas.total()[0]
+
+    def amostras(self, nome: str, rotulos: str) -> List[str]:
+        return [f'{nome}{rotulos} {self.valor()}']
+
+class Medidor:
+    """Valor instantâneo lido de uma função no momento da coleta (tamanho de fila, pendentes, ...)"""
+    tipo = 'gauge'
+
+    def __init__(self, funcao: Callable[[], float]):
+        self.funcao = funcao
+
+    def amostras(self, nome: str, rotulos: str) -> List[str]:
+        try:
+            valor = float(self.funcao())
+        except Exception:
+            valor = math.nan
+        return [f'{nome}{rotulos} {_formatar(valor)}']
+
+class Histograma:
+    """Distribuição de durações em segundos, exposta como summary (quantis, soma e contagem)"""
+    tipo = 'summary'
+
+    def __init__(self):
+        self._celulas = _Celulas(lambda: [0.0, 0, {}], self._somar)
+
+    @staticmethod
+    def _somar(destino, origem):
+        destino[0] += origem[0]
+        destino[1] += origem[1]
+        baldes = destino[2]
+        for indice, n in list(origem[2].items()):
+            baldes[indice] = baldes.get(indice, 0) + n
+
+    def observar(self, segundos: float):
+        celula = self._celulas.celula()
+        indice = _indice_balde(int(segundos * 1e6)) if segundos > 0 else 0
+        baldes = celula[2]
+        baldes[indice] = baldes.get(indice, 0) + 1
+        celula[0] += segundos
+        celula[1] += 1
+
+    def cronometrar(self) -> "Cronometro":
+        """Context manager que observa a duração do bloco"""
+        return Cronometro(self)
+
+    def resumo(self) -> Dict:
+        soma, contagem, baldes = self._celulas.total()
+        quantis = {}
+        if contagem:
+            acumulado = 0
+            alvos = iter(QUANTIS)
+            alvo = next(alvos)
+            for indice in sorted(baldes):
+                acumulado += baldes[indice]
+                while alvo is not None and acumulado >= alvo * contagem:
+                    quantis[alvo] = _limite_balde(indice) / 1e6
+                    alvo = next(alvos, None)
+        return {"soma": soma, "contagem": contagem, "quantis": quantis}
+
+    def amostras(self, nome: str, rotulos: str) -> List[str]:
+        resumo = self.resumo()
+        base = rotulos[1:-1] + ',' if rotulos else ''
+        linhas = [f'{nome}{{{base}quantile="{q}"}} {_formatar(resumo["quantis"].get(q, math.nan))}' for q in QUANTIS]
+        linhas.append(f'{nome}_sum{rotulos} {resumo["soma"]}')
+        linhas.append(f'{nome}_count{rotulos} {resumo["contagem"]}')
+        return linhas
+
+class Cronometro:
+    __slots__ = ('histograma', 'inicio')
+
+    def __init__(self, histograma: Histograma):
+        self.histograma = histograma
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observar(time.perf_counter() - self.inicio)
+        return False
+
+class LockMedido:
+    """Lock que registra no histograma quanto tempo cada aquisição esperou"""
+    def __init__(self, histograma: Histograma, lock=None):
+        self.histograma = histograma
+        self._lock = lock or threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        # Sem disputa não há espera: evita ler o relógio duas vezes
+        if self._lock.acquire(False):
+            self.histograma.observar(0.0)
+            return True
+        if not blocking:
+            return False
+        inicio = time.perf_counter()
+        obtido = self._lock.acquire(True, timeout)
+        self.histograma.observar(time.perf_counter() - inicio)
+        return obtido
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+class Registro:
+    """Conjunto de métricas do processo, identificadas por nome e rótulos"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._familias: Dict[str, Tuple[str, str, Dict[Tuple, object]]] = {}  # nome -> (tipo, ajuda, {rotulos: métrica})
+
+    def _obter(self, classe, nome: str, ajuda: str, rotulos: Dict[str, str], *args):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            tipo, _, metricas = self._familias.setdefault(nome, (classe.tipo, ajuda, {}))
+            if tipo != classe.tipo:
+                raise ValueError(f"Métrica {nome} já registrada como {tipo}")
+            metrica = metricas.get(chave)
+            if metrica is None:
+                metrica = metricas[chave] = classe(*args)
+            return metrica
+
+    def contador(self, nome: str, ajuda: str = '', **rotulos) -> Contador:
+        return self._obter(Contador, nome, ajuda, rotulos)
+
+    def histograma(self, nome: str, ajuda: str = '', **rotulos) -> Histograma:
+        return self._obter(Histograma, nome, ajuda, rotulos)
+
+    def medidor(self, nome: str, funcao: Callable[[], float], ajuda: str = '', **rotulos) -> Medidor:
+        medidor = self._obter(Medidor, nome, ajuda, rotulos, funcao)
+        medidor.funcao = funcao
+        return medidor
+
+    def exportar(self) -> str:
+        """Todas as métricas no formato texto do Prometheus"""
+        with self._lock:
+            familias = [(nome, tipo, ajuda, list(metricas.items()))
+                        for nome, (tipo, ajuda, metricas) in sorted(self._familias.items())]
+        linhas = []
+        for nome, tipo, ajuda, metricas in familias:
+            if ajuda:
+                linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            for chave, metrica in metricas:
+                rotulos = '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in chave) + '}' if chave else ''
+                linhas.extend(metrica.amostras(nome, rotulos))
+        return '\n'.join(linhas) + '\n'
+
+def _formatar(valor: float) -> str:
+    if math.isnan(valor):
+        return 'NaN'
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(valor)
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+registro = Registro()
+
+def expor(app, caminho: str = '/metrics'):
+    """Registra o endpoint de métricas numa aplicação Flask"""
+    def metricas():
+        return Response(registro.exportar(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(caminho, endpoint='metricas', view_func=metricas, methods=['GET'])
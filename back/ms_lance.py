@@ -1,194 +1,316 @@
 from flask import Flask, jsonify, request
-import pika
 import json
+import datetime
+import os
 import threading
+import time
 import utils
-from typing import Dict, Set
+import logs
+import metricas
+from metricas import registro
+from livro_lances import LivroLances
+from historico_lances import HistoricoLances
+from servico import Servico
+from typing import Dict, List, Optional, Tuple
 
 app = Flask(__name__)
+metricas.expor(app)
+servico = Servico(app)
+log = logs.Log('ms_lance')
+amostra_lances = logs.Amostragem(logs.LOG_AMOSTRAGEM_LANCES)
 
-# Armazenamento em memória
-leiloes_ativos: Set[str] = set()  # IDs de leilões ativos
-maiores_lances: Dict[str, Dict] = {}  # {leilao_id: {"usuario_id": str, "valor": float}}
-lock_leiloes = threading.Lock()  # Lock para sincronização
+class EstadoLeilao:
+    """Estado de um leilão ativo, protegido por um lock próprio"""
+    __slots__ = ('leilao_id', 'lock', 'ativo', 'usuario_id', 'valor')
 
-class ConsumidorEventos(threading.Thread):
-    """Thread que consome eventos do RabbitMQ"""
-    def __init__(self):
-        super().__init__()
-        self.daemon = True
+    def __init__(self, leilao_id: str, usuario_id: Optional[str] = None, valor: float = 0.0):
+        self.leilao_id = leilao_id
+        self.lock = threading.Lock()
+        self.ativo = True
+        self.usuario_id = usuario_id
+        self.valor = valor
+
+    def tentar_lances(self, lances: List[Tuple[str, float]]) -> List[Tuple[bool, Optional[float]]]:
+        """
+        Valida e registra uma sequência de lances (usuario_id, valor), em ordem, numa
+        única seção crítica (compare-and-set). Para cada lance retorna
+        (aceito, maior_valor_atual); maior_valor_atual é None se o leilão já encerrou.
+        Com o livro de lances ativo, os lances aceitos são gravados de forma durável antes do retorno.
+        Todos os lances entram no histórico na mesma seção crítica, na ordem em que foram decididos.
+        """
+        resultados = []
+        seq = None
+        with self.lock:
+            for usuario_id, valor in lances:
+                if not self.ativo:
+                    resultados.append((False, None))
+                elif valor <= self.valor:
+                    resultados.append((False, self.valor))
+                else:
+                    self.usuario_id = usuario_id
+                    self.valor = valor
+                    # Anexa dentro do lock para manter a ordem dos lances de um leilão no log
+                    if livro:
+                        seq = livro.registrar_lance(self.leilao_id, usuario_id, valor)
+                    resultados.append((True, valor))
+                historico.registrar(self.leilao_id, usuario_id, valor, resultados[-1][0])
+        # Espera o fsync em grupo fora do lock: outros lances entram no mesmo commit
+        if seq is not None:
+            livro.aguardar(seq)
+        return resultados
+
+    def tentar_lance(self, usuario_id: str, valor: float) -> Tuple[bool, Optional[float]]:
+        """Versão de tentar_lances para um único lance"""
+        return self.tentar_lances([(usuario_id, valor)])[0]
+
+    def registro(self) -> Tuple[str, Optional[str], float]:
+        """(leilao_id, usuario_id, valor) lidos juntos, para o snapshot do livro de lances"""
+        with self.lock:
+            return self.leilao_id, self.usuario_id, self.valor
+
+    def encerrar(self) -> Dict:
+        """Encerra o leilão (nenhum lance é aceito depois) e retorna o maior lance"""
+        with self.lock:
+            self.ativo = False
+            return {"usuario_id": self.usuario_id, "valor": self.valor}
+
+# Livro de lances durável: LANCE_PERSISTENCIA=0 mantém o estado apenas em memória
+DIRETORIO_DADOS = os.environ.get('LANCE_DIRETORIO_DADOS', os.path.join('dados', 'ms_lance'))
+PERSISTENCIA_ATIVA = os.environ.get('LANCE_PERSISTENCIA', '1') != '0'
+FSYNC_ATIVO = os.environ.get('LANCE_FSYNC', '1') != '0'
+
+livro: Optional[LivroLances] = None  # Aberto ao iniciar o serviço (abrir_livro)
+
+# Armazenamento em memória (reconstruído a partir do livro de lances, se houver)
+leiloes_ativos: Dict[str, EstadoLeilao] = {}
+# Protege apenas a inserção/remoção em leiloes_ativos
+lock_leiloes = metricas.LockMedido(registro.histograma('lance_lock_leiloes_espera_segundos', 'Espera para adquirir lock_leiloes'))
+historico = HistoricoLances()  # Todos os lances (aceitos e recusados) por leilão
+
+def registros_ativos() -> List[Tuple[str, Optional[str], float]]:
+    """Estado dos leilões ativos para o snapshot (chamada por compactar, depois da rotação)"""
+    with lock_leiloes:
+        estados = list(leiloes_ativos.values())
+    # Cada estado é lido sob o seu lock: um lance concorrente não mistura o usuário antigo com o valor novo
+    return [e.registro() for e in estados]
+
+class CompactadorLivro(threading.Thread):
+    """Thread que grava snapshots do livro de lances quando ele acumula registros suficientes"""
+    def __init__(self, intervalo: float = 30.0):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
         self.running = True
-        self.connection = None
-        self.channel = None
-
-    def connect(self):
-        """Conecta ao RabbitMQ"""
-        self.connection = utils.get_rabbitmq_connection()
-        self.channel = self.connection.channel()
-        utils.setup_queues(self.channel)
-
-    def disconnect(self):
-        """Desconecta do RabbitMQ"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
-
-    def processar_leilao_iniciado(self, ch, method, properties, body):
-        """Processa evento de leilão iniciado"""
-        try:
-            evento = json.loads(body.decode('utf-8'))
-            leilao_id = str(evento.get('id'))  # Garante que é string
-            
-            if leilao_id:
-                with lock_leiloes:
-                    leiloes_ativos.add(leilao_id)
-                    maiores_lances[leilao_id] = {"usuario_id": None, "valor": 0}
-                print(f"[MS Lance] ✅ Leilão {leilao_id} está ativo")
-                with lock_leiloes:
-                    print(f"[MS Lance] Debug: leiloes_ativos = {leiloes_ativos}")
-            
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"[MS Lance] Erro ao processar leilao_iniciado: {e}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-    def processar_leilao_finalizado(self, ch, method, properties, body):
-        """Processa evento de leilão finalizado"""
-        try:
-            evento = json.loads(body.decode('utf-8'))
-            leilao_id = str(evento.get('id'))  # Garante que é string
-            
-            with lock_leiloes:
-                if leilao_id in leiloes_ativos:
-                    leiloes_ativos.remove(leilao_id)
-                    
-                    # Determina o vencedor
-                    vencedor = maiores_lances.get(leilao_id)
-                    
-                    if vencedor and vencedor.get("usuario_id"):
-                        # Publica evento leilao_vencedor
-                        evento_vencedor = {
-                            "id": leilao_id,
-                            "vencedor_id": vencedor["usuario_id"],
-                            "valor": vencedor["valor"]
-                        }
-                        
-                        self.channel.basic_publish(
-                            exchange='leilao_vencedor',
-                            routing_key='',
-                            body=json.dumps(evento_vencedor),
-                            properties=pika.BasicProperties(delivery_mode=2)
-                        )
-                        
-                        print(f"[MS Lance] 🏆 Leilão {leilao_id} finalizado. Vencedor: {vencedor['usuario_id']} com R${vencedor['valor']:.2f}")
-                    else:
-                        print(f"[MS Lance] ⚠️ Leilão {leilao_id} finalizado sem lances")
-                    
-                    # Remove da memória
-                    maiores_lances.pop(leilao_id, None)
-            
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"[MS Lance] Erro ao processar leilao_finalizado: {e}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
 
     def run(self):
-        """Inicia o consumo de eventos"""
+        while self.running:
+            time.sleep(self.intervalo)
+            try:
+                if livro.precisa_compactar():
+                    leiloes = livro.compactar(registros_ativos)
+                    log.info("Snapshot do livro de lances gravado", leiloes=leiloes)
+            except Exception:
+                log.erro("Erro ao gravar snapshot do livro de lances", excecao=True)
+
+ESPERA_REPUBLICACAO = 1.0  # Pausa antes de devolver um evento cujo vencedor não foi publicado
+
+def processar_leilao_iniciado(method, body):
+    """Processa evento de leilão iniciado"""
+    try:
+        evento = json.loads(body.decode('utf-8'))
+    except json.JSONDecodeError as e:
+        log.erro("Erro ao processar leilao_iniciado", erro=str(e))
+        return
+    leilao_id = str(evento.get('id'))  # Garante que é string
+
+    if leilao_id:
+        seq = None
+        with lock_leiloes:
+            # Não recria um leilão já conhecido (ex.: recuperado do livro de lances)
+            if leilao_id not in leiloes_ativos:
+                leiloes_ativos[leilao_id] = EstadoLeilao(leilao_id)
+                seq = livro.registrar_iniciado(leilao_id) if livro else None
+        if seq is not None:
+            livro.aguardar(seq)
+        log.info("Leilão ativo", leilao_id=leilao_id)
+
+def processar_leilao_finalizado(method, body):
+    """Processa evento de leilão finalizado"""
+    try:
+        evento = json.loads(body.decode('utf-8'))
+    except json.JSONDecodeError as e:
+        log.erro("Erro ao processar leilao_finalizado", erro=str(e))
+        return
+    leilao_id = str(evento.get('id'))  # Garante que é string
+
+    # O estado continua em leiloes_ativos até o FINALIZADO ser registrado: um snapshot
+    # gravado enquanto o vencedor é publicado não pode perder o leilão
+    with lock_leiloes:
+        estado = leiloes_ativos.get(leilao_id)
+
+    if estado is None:
+        return
+
+    # Determina o vencedor (após encerrar, nenhum lance concorrente é aceito)
+    vencedor = estado.encerrar()
+
+    if vencedor.get("usuario_id"):
+        # Publica evento leilao_vencedor
+        evento_vencedor = {
+            "id": leilao_id,
+            "vencedor_id": vencedor["usuario_id"],
+            "valor": vencedor["valor"]
+        }
+
+        # Espera a confirmação do broker antes de marcar o leilão como finalizado no livro
         try:
-            self.connect()
-            
-            # Configura consumo das filas
-            self.channel.basic_consume(
-                queue='leilao_iniciado',
-                on_message_callback=self.processar_leilao_iniciado
-            )
-            
-            self.channel.basic_consume(
-                queue='leilao_finalizado',
-                on_message_callback=self.processar_leilao_finalizado
-            )
-            
-            print("[MS Lance] 📡 Consumindo eventos: leilao_iniciado, leilao_finalizado")
-            self.channel.start_consuming()
-            
-        except Exception as e:
-            print(f"[MS Lance] Erro no consumidor: {e}")
-        finally:
-            self.disconnect()
-
-# Inicia thread consumidora
-consumidor = ConsumidorEventos()
-consumidor.start()
+            utils.get_publicador().publicar('', evento_vencedor, exchange='leilao_vencedor',
+                                           message_id=f'leilao_vencedor:{leilao_id}') \
+                .result(timeout=utils.TEMPO_CONFIRMACAO)
+        except (utils.PublicacaoRecusada, utils.FilaPublicacaoCheia, TimeoutError) as e:
+            # Devolve a mensagem à fila: a reentrega encontra o leilão (encerrado,
+            # sem aceitar lances) e publica o mesmo vencedor
+            log.erro("Falha ao publicar leilao_vencedor, evento devolvido à fila",
+                     leilao_id=leilao_id, erro=repr(e))
+            raise utils.DevolverMensagem() from e
+
+        log.info("Leilão finalizado", leilao_id=leilao_id, vencedor_id=vencedor['usuario_id'], valor=vencedor['valor'])
+    else:
+        log.info("Leilão finalizado sem lances", leilao_id=leilao_id)
+
+    historico.encerrar(leilao_id)
+
+    # Registrado só após publicar o vencedor: se cair antes, o evento é reentregue
+    seq = None
+    with lock_leiloes:
+        leiloes_ativos.pop(leilao_id, None)
+        if livro:
+            seq = livro.registrar_finalizado(leilao_id)
+    if seq is not None:
+        livro.aguardar(seq)
+
+# Consumidores com deduplicação por message_id, acks em lote e reconexão
+consumidores = [
+    utils.ConsumidorFila('leilao_iniciado', utils.declarar_fila('leilao_iniciado'), processar_leilao_iniciado),
+    utils.ConsumidorFila('leilao_finalizado', utils.declarar_fila('leilao_finalizado'), processar_leilao_finalizado,
+                         espera_devolucao=ESPERA_REPUBLICACAO),
+]
+compactador = CompactadorLivro()
+
+@servico.ao_iniciar
+def abrir_livro():
+    """Abre o livro de lances e reconstrói os leilões ativos antes de consumir eventos"""
+    global livro
+    if not PERSISTENCIA_ATIVA:
+        return
+    livro = LivroLances(DIRETORIO_DADOS, sincrono=FSYNC_ATIVO)
+    for leilao_id, (usuario_id, valor) in livro.recuperar().items():
+        leiloes_ativos[leilao_id] = EstadoLeilao(leilao_id, usuario_id, valor)
+    log.info("Leilões ativos recuperados do livro de lances", leiloes=len(leiloes_ativos))
+    compactador.start()
+
+@servico.ao_iniciar
+def iniciar_consumidores():
+    for consumidor in consumidores:
+        consumidor.start()
+
+@servico.ao_parar
+def parar_consumidores():
+    for consumidor in consumidores:
+        consumidor.parar()
+
+def criar_app() -> Flask:
+    """Fábrica usada pelo servidor WSGI: inicia o serviço neste processo e retorna a aplicação"""
+    return servico.iniciar()
 
 # --- Endpoints REST ---
 
-@app.route('/lances', methods=['POST'])
-def receber_lance():
-    """Recebe um lance via REST"""
-    dados = request.get_json()
-    
-    if not dados:
-        return jsonify({"erro": "Dados não fornecidos"}), 400
+latencia_validacao = registro.histograma('lance_validacao_segundos', 'Validação e registro de um lance (POST /lances)')
+latencia_validacao_lote = registro.histograma('lance_lote_validacao_segundos', 'Validação e registro de um lote (POST /lances/batch)')
+lances_aceitos = registro.contador('lances_total', 'Lances recebidos', resultado='aceito')
+lances_recusados = registro.contador('lances_total', 'Lances recebidos', resultado='recusado')
+lances_invalidos = registro.contador('lances_total', 'Lances recebidos', resultado='invalido')
+eventos_nao_anunciados = registro.contador('lance_eventos_nao_anunciados_total',
+                                           'Eventos de lance perdidos com o publicador recusando novas mensagens')
+
+def publicar_eventos(eventos: List[Tuple[str, Dict]]) -> bool:
+    """
+    Publica eventos de lance [(fila, evento), ...]. Retorna False se o publicador
+    recusar (fila de confirmações cheia): o lance já foi decidido e gravado, então
+    a falha é registrada e informada ao cliente em vez de virar um 500.
+    """
+    try:
+        utils.get_publicador().publicar_lote(eventos)
+        return True
+    except (utils.PublicacaoRecusada, utils.FilaPublicacaoCheia) as e:
+        eventos_nao_anunciados.inc(len(eventos))
+        log.erro("Falha ao publicar eventos de lance", eventos=len(eventos), erro=repr(e))
+        return False
+
+def validar_lance(dados) -> Tuple[Optional[Tuple[str, str, float]], Optional[str]]:
+    """Valida os campos de um lance; retorna ((leilao_id, usuario_id, valor), None) ou (None, erro)"""
+    if not isinstance(dados, dict) or not dados:
+        return None, "Dados não fornecidos"
 
     # Validação dos campos obrigatórios
     campos_obrigatorios = ['id', 'usuario_id', 'valor']
     for campo in campos_obrigatorios:
         if campo not in dados:
-            return jsonify({"erro": f"Campo obrigatório ausente: {campo}"}), 400
+            return None, f"Campo obrigatório ausente: {campo}"
 
-    leilao_id = str(dados['id'])
-    usuario_id = str(dados['usuario_id'])
-    
     try:
         valor = float(dados['valor'])
         if valor <= 0:
-            return jsonify({"erro": "Valor do lance deve ser positivo"}), 400
+            return None, "Valor do lance deve ser positivo"
     except (ValueError, TypeError):
-        return jsonify({"erro": "Valor do lance inválido"}), 400
+        return None, "Valor do lance inválido"
 
-    # Verifica se o leilão está ativo
-    with lock_leiloes:
-        leiloes_ativos_copy = set(leiloes_ativos)  # Cria cópia para evitar lock durante print
-    print(f"[MS Lance] Debug: Verificando leilão {leilao_id} em leiloes_ativos = {leiloes_ativos_copy}")
-    
-    with lock_leiloes:
-        if leilao_id not in leiloes_ativos:
-            motivo = f"Leilão não está ativo. Leilões ativos: {list(leiloes_ativos)}"
-            publicar_lance_invalidado(leilao_id, usuario_id, valor, motivo)
-            return jsonify({"erro": motivo}), 400
+    return (str(dados['id']), str(dados['usuario_id']), valor), None
 
-    # Verifica se o lance é maior que o último lance
-    with lock_leiloes:
-        ultimo_lance = maiores_lances.get(leilao_id, {"valor": 0})
-        valor_ultimo_lance = ultimo_lance.get("valor", 0)
-    
-    if valor <= valor_ultimo_lance:
-        motivo = f"Lance deve ser maior que R${valor_ultimo_lance:.2f}"
+def motivo_recusa(valor_atual: Optional[float]) -> str:
+    """Motivo de um lance recusado a partir do maior valor atual (None = leilão inativo)"""
+    if valor_atual is None:
+        return "Leilão não está ativo"
+    return f"Lance deve ser maior que R${valor_atual:.2f}"
+
+@app.route('/lances', methods=['POST'])
+def receber_lance():
+    """Recebe um lance via REST"""
+    inicio = time.perf_counter()
+    lance, erro = validar_lance(request.get_json())
+    if erro:
+        lances_invalidos.inc()
+        return jsonify({"erro": erro}), 400
+    leilao_id, usuario_id, valor = lance
+
+    # Verifica se o leilão está ativo e tenta registrar o lance atomicamente
+    estado = leiloes_ativos.get(leilao_id)
+    aceito, valor_atual = estado.tentar_lance(usuario_id, valor) if estado else (False, None)
+    latencia_validacao.observar(time.perf_counter() - inicio)
+
+    if not aceito:
+        lances_recusados.inc()
+        motivo = motivo_recusa(valor_atual)
+        # O lance foi recusado de qualquer forma: a resposta não depende do anúncio
         publicar_lance_invalidado(leilao_id, usuario_id, valor, motivo)
         return jsonify({"erro": motivo}), 400
 
-    # Lance válido - atualiza o maior lance
-    with lock_leiloes:
-        maiores_lances[leilao_id] = {
-            "usuario_id": usuario_id,
-            "valor": valor
-        }
-
     # Publica evento lance_validado
+    lances_aceitos.inc()
     evento_validado = {
         "id": leilao_id,
         "usuario_id": usuario_id,
         "valor": valor
     }
     
-    channel = utils.get_rabbitmq_channel()
-    channel.basic_publish(
-        exchange='',
-        routing_key='lance_validado',
-        body=json.dumps(evento_validado),
-        properties=pika.BasicProperties(delivery_mode=2)
-    )
-    
-    print(f"[MS Lance] ✅ Lance válido: Usuário {usuario_id} - R${valor:.2f} no leilão {leilao_id}")
+    if not publicar_eventos([('lance_validado', evento_validado)]):
+        return jsonify({
+            "erro": "Lance aceito, mas não anunciado (broker indisponível)",
+            "aceito": True,
+            "id": leilao_id,
+            "valor": valor
+        }), 503
+
+    log.amostrado(amostra_lances, logs.INFO, "Lance aceito", leilao_id=leilao_id, usuario_id=usuario_id, valor=valor)
     
     return jsonify({
         "mensagem": "Lance aceito",
@@ -196,6 +318,131 @@ def receber_lance():
         "valor": valor
     }), 200
 
+TAMANHO_MAXIMO_LOTE = 1000
+
+@app.route('/lances/batch', methods=['POST'])
+def receber_lances_em_lote():
+    """
+    Recebe uma lista de lances. Os lances de cada leilão são validados em ordem
+    numa única seção crítica e todos os eventos resultantes são publicados num
+    único lote. Retorna o resultado de cada lance, na ordem recebida.
+    """
+    dados = request.get_json(silent=True)
+    if isinstance(dados, dict):
+        dados = dados.get('lances')
+    if not isinstance(dados, list) or not dados:
+        return jsonify({"erro": "Envie uma lista de lances não vazia"}), 400
+    if len(dados) > TAMANHO_MAXIMO_LOTE:
+        return jsonify({"erro": f"Lote excede o máximo de {TAMANHO_MAXIMO_LOTE} lances"}), 413
+
+    inicio = time.perf_counter()
+    resultados: List[Optional[Dict]] = [None] * len(dados)
+    por_leilao: Dict[str, List[Tuple[int, str, float]]] = {}
+    for indice, item in enumerate(dados):
+        lance, erro = validar_lance(item)
+        if erro:
+            resultados[indice] = {"indice": indice, "aceito": False, "erro": erro}
+        else:
+            leilao_id, usuario_id, valor = lance
+            por_leilao.setdefault(leilao_id, []).append((indice, usuario_id, valor))
+
+    eventos = []
+    for leilao_id, lances in por_leilao.items():
+        estado = leiloes_ativos.get(leilao_id)
+        if estado:
+            saidas = estado.tentar_lances([(usuario_id, valor) for _, usuario_id, valor in lances])
+        else:
+            saidas = [(False, None)] * len(lances)
+
+        for (indice, usuario_id, valor), (aceito, valor_atual) in zip(lances, saidas):
+            evento = {"id": leilao_id, "usuario_id": usuario_id, "valor": valor}
+            if aceito:
+                eventos.append(('lance_validado', evento))
+                resultados[indice] = {"indice": indice, "aceito": True, **evento}
+            else:
+                motivo = motivo_recusa(valor_atual)
+                eventos.append(('lance_invalidado', {**evento, "motivo": motivo}))
+                resultados[indice] = {"indice": indice, "aceito": False, **evento, "motivo": motivo}
+
+    latencia_validacao_lote.observar(time.perf_counter() - inicio)
+    aceitos = sum(1 for r in resultados if r["aceito"])
+    invalidos = sum(1 for r in resultados if "erro" in r)
+    lances_aceitos.inc(aceitos)
+    lances_invalidos.inc(invalidos)
+    lances_recusados.inc(len(resultados) - aceitos - invalidos)
+
+    resposta = {"aceitos": aceitos, "total": len(resultados), "resultados": resultados}
+    if eventos and not publicar_eventos(eventos):
+        resposta["erro"] = "Lances processados, mas não anunciados (broker indisponível)"
+        return jsonify(resposta), 503
+
+    log.amostrado(amostra_lances, logs.INFO, "Lote de lances processado", aceitos=aceitos, total=len(resultados))
+
+    return jsonify(resposta), 200
+
+TAMANHO_MAXIMO_PAGINA = 1000
+
+def _parametro_int(nome: str, padrao: int, minimo: int = 1, maximo: int = None) -> int:
+    """Lê um parâmetro inteiro da query string, levantando ValueError se inválido"""
+    valor = int(request.args.get(nome, padrao))
+    if valor < minimo or (maximo is not None and valor > maximo):
+        raise ValueError(f"Parâmetro '{nome}' fora do intervalo permitido")
+    return valor
+
+def _parametro_instante(nome: str) -> float:
+    """Lê um instante (ISO 8601 ou segundos desde a época) e retorna segundos desde a época"""
+    valor = request.args[nome]
+    try:
+        return float(valor)
+    except ValueError:
+        return datetime.datetime.fromisoformat(valor.replace('Z', '+00:00')).timestamp()
+
+@app.route('/lances/<leilao_id>/historico', methods=['GET'])
+def consultar_historico(leilao_id):
+    """Histórico paginado dos lances de um leilão (?pagina=1&tamanho=50&ordem=asc|desc)"""
+    hist = historico.obter(leilao_id)
+    if hist is None:
+        return jsonify({"erro": "Nenhum lance registrado para este leilão"}), 404
+    try:
+        pagina = _parametro_int('pagina', 1)
+        tamanho = _parametro_int('tamanho', 50, maximo=TAMANHO_MAXIMO_PAGINA)
+    except ValueError as e:
+        return jsonify({"erro": f"Parâmetros inválidos: {e}"}), 400
+
+    total, lances = historico.pagina(hist, pagina, tamanho, recentes_primeiro=request.args.get('ordem') == 'desc')
+    return jsonify({"id": leilao_id, "total": total, "pagina": pagina, "tamanho": tamanho, "lances": lances}), 200
+
+@app.route('/lances/<leilao_id>/top', methods=['GET'])
+def consultar_top_usuarios(leilao_id):
+    """Os N usuários com os maiores lances aceitos (?n=10)"""
+    hist = historico.obter(leilao_id)
+    if hist is None:
+        return jsonify({"erro": "Nenhum lance registrado para este leilão"}), 404
+    try:
+        n = _parametro_int('n', 10, maximo=TAMANHO_MAXIMO_PAGINA)
+    except ValueError as e:
+        return jsonify({"erro": f"Parâmetros inválidos: {e}"}), 400
+
+    return jsonify({"id": leilao_id, "usuarios": historico.top_usuarios(hist, n)}), 200
+
+@app.route('/lances/<leilao_id>/intervalo', methods=['GET'])
+def consultar_intervalo(leilao_id):
+    """Lances feitos entre dois instantes (?inicio=...&fim=...&limite=1000)"""
+    hist = historico.obter(leilao_id)
+    if hist is None:
+        return jsonify({"erro": "Nenhum lance registrado para este leilão"}), 404
+    try:
+        inicio = _parametro_instante('inicio')
+        fim = _parametro_instante('fim')
+        limite = _parametro_int('limite', TAMANHO_MAXIMO_PAGINA, maximo=TAMANHO_MAXIMO_PAGINA)
+    except KeyError as e:
+        return jsonify({"erro": f"Parâmetro obrigatório ausente: {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({"erro": f"Parâmetros inválidos: {e}"}), 400
+
+    total, lances = historico.intervalo(hist, inicio, fim, limite)
+    return jsonify({"id": leilao_id, "total": total, "lances": lances}), 200
+
 def publicar_lance_invalidado(leilao_id: str, usuario_id: str, valor: float, motivo: str):
     """Publica evento de lance invalidado"""
     evento_invalidado = {
@@ -205,19 +452,13 @@ def publicar_lance_invalidado(leilao_id: str, usuario_id: str, valor: float, mot
         "motivo": motivo
     }
     
-    channel = utils.get_rabbitmq_channel()
-    channel.basic_publish(
-        exchange='',
-        routing_key='lance_invalidado',
-        body=json.dumps(evento_invalidado),
-        properties=pika.BasicProperties(delivery_mode=2)
-    )
-    
-    print(f"[MS Lance] ❌ Lance invalidado: Usuário {usuario_id} - R${valor:.2f} no leilão {leilao_id} (Motivo: {motivo})")
+    if not publicar_eventos([('lance_invalidado', evento_invalidado)]):
+        return
+
+    log.amostrado(amostra_lances, logs.INFO, "Lance recusado", leilao_id=leilao_id, usuario_id=usuario_id, valor=valor, motivo=motivo)
 
 if __name__ == '__main__':
-    print("🚀 MS Lance iniciado na porta 4998")
-    print("📡 Aguardando eventos e requisições REST...")
-    # use_reloader=False evita que o Flask reinicie e perca o estado das variáveis globais
-    app.run(debug=True, port=4998, threaded=True, use_reloader=False)
+    # Servidor de desenvolvimento; em produção: python servir.py ms_lance
+    log.info("MS Lance iniciado", porta=4998)
+    criar_app().run(port=4998, threaded=True)
 
@@ -1,116 +1,419 @@
 from flask import Flask, jsonify, request
-import pika
-import json
 import datetime
-import time
+import heapq
+import itertools
+import json
+import os
 import threading
+import time
 import utils
-from typing import Dict
+import logs
+import metricas
+from diario import DiarioGroupCommit, escrever_atomicamente, mapear_arquivo
+from servico import Servico
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
 
 app = Flask(__name__)
+metricas.expor(app)
+servico = Servico(app)
+log = logs.Log('ms_leilao')
+
+STATUS_LEILAO = ("agendado", "ativo", "finalizado")
+
+class Leilao:
+    """Registro tipado de um leilão, com as datas já convertidas"""
+    __slots__ = ('id', 'desc', 'valor_inicial', 'criador_id', 'inicio', 'fim', 'status', '_resumo')
+
+    def __init__(self, id: str, desc: str, valor_inicial, criador_id: str,
+                 inicio: datetime.datetime, fim: datetime.datetime, status: str = "agendado"):
+        self.id = id
+        self.desc = desc
+        self.valor_inicial = valor_inicial
+        self.criador_id = criador_id
+        self.inicio = inicio
+        self.fim = fim
+        self.status = status
+        self._resumo = None
+
+    def para_dict(self) -> Dict:
+        """Representação completa (resposta da criação)"""
+        return {
+            "id": self.id,
+            "desc": self.desc,
+            "valor_inicial": self.valor_inicial,
+            "criador_id": self.criador_id,
+            "inicio": self.inicio.isoformat(),
+            "fim": self.fim.isoformat(),
+            "status": self.status
+        }
+
+    def resumo(self) -> Dict:
+        """Dados formatados para o frontend, montados uma única vez por status"""
+        if self._resumo is None or self._resumo["status"] != self.status:
+            self._resumo = {
+                "id": self.id,
+                "desc": self.desc,
+                "valor_inicial": self.valor_inicial,
+                "inicio": self.inicio.isoformat(),
+                "fim": self.fim.isoformat(),
+                "status": self.status
+            }
+        return self._resumo
+
+class RepositorioLeiloes:
+    """
+    Armazena os leilões com índice secundário por status.
+    Leilões finalizados saem do índice principal e ficam num arquivo limitado
+    aos `limite_finalizados` mais recentes.
+    """
+    def __init__(self, limite_finalizados: int = 1000, persistencia: "PersistenciaLeiloes" = None):
+        self.limite_finalizados = limite_finalizados
+        self.persistencia = persistencia
+        self._lock = threading.Lock()
+        self._leiloes: Dict[str, Leilao] = {}  # Agendados e ativos
+        self._por_status: Dict[str, Dict[str, Leilao]] = {status: {} for status in STATUS_LEILAO}
+        self._finalizados: Dict[str, Leilao] = OrderedDict()  # Arquivo dos finalizados mais recentes
+        self._por_status["finalizado"] = self._finalizados
+
+    def __contains__(self, leilao_id: str) -> bool:
+        return leilao_id in self._leiloes or leilao_id in self._finalizados
+
+    def obter(self, leilao_id: str) -> Optional[Leilao]:
+        return self._leiloes.get(leilao_id) or self._finalizados.get(leilao_id)
+
+    def adicionar(self, leilao: Leilao) -> bool:
+        """Adiciona um leilão; retorna False se o ID já existe"""
+        with self._lock:
+            if leilao.id in self:
+                return False
+            self._inserir(leilao)
+            seq = self.persistencia.registrar_criacao(leilao) if self.persistencia else None
+        # Espera o commit em grupo fora do lock, para que outras escritas entrem no mesmo fsync
+        if seq is not None:
+            self.persistencia.aguardar(seq)
+        return True
+
+    def _inserir(self, leilao: Leilao):
+        self._por_status[leilao.status][leilao.id] = leilao
+        if leilao.status == "finalizado":
+            self._arquivar()
+        else:
+            self._leiloes[leilao.id] = leilao
+
+    def _arquivar(self):
+        while len(self._finalizados) > self.limite_finalizados:
+            self._finalizados.popitem(last=False)
+
+    def transicionar(self, leilao_id: str, de: str, para: str) -> Optional[Leilao]:
+        """
+        Muda o status atomicamente se ele ainda for `de`; retorna o leilão ou None.
+        Chamado só depois de confirmada a publicação do evento da transição.
+        """
+        with self._lock:
+            leilao = self._leiloes.get(leilao_id)
+            if leilao is None or leilao.status != de:
+                return None
+            del self._por_status[de][leilao_id]
+            leilao.status = para
+            self._por_status[para][leilao_id] = leilao
+            if para == "finalizado":
+                del self._leiloes[leilao_id]
+                self._arquivar()
+            seq = self.persistencia.registrar_status(leilao_id, para) if self.persistencia else None
+        if seq is not None:
+            self.persistencia.aguardar(seq)
+        return leilao
+
+    def recuperar(self) -> List[Leilao]:
+        """Carrega o estado persistido (snapshot + cauda do diário); retorna os leilões não finalizados"""
+        with self._lock:
+            for leilao in self.persistencia.recuperar():
+                self._inserir(leilao)
+            return list(self._leiloes.values())
+
+    def compactar(self):
+        """Grava um snapshot do estado atual e descarta os segmentos do diário já cobertos"""
+        with self._lock:
+            # Estado congelado: o novo segmento começa exatamente após o snapshot
+            registros = [leilao.para_dict() for leilao in self._leiloes.values()]
+            registros += [leilao.para_dict() for leilao in self._finalizados.values()]
+            segmento = self.persistencia.diario.rotacionar()
+        self.persistencia.gravar_snapshot(segmento, registros)
+
+    def listar(self, status: str) -> List[Leilao]:
+        """Lista os leilões de um status (custo proporcional à quantidade nesse status)"""
+        with self._lock:
+            return list(self._por_status[status].values())
+
+class PersistenciaLeiloes:
+    """
+    Durabilidade do estado dos leilões: diário (JSON por linha) de criações e
+    mudanças de status com fsync em grupo, mais snapshots compactos periódicos.
+    A recuperação lê o snapshot mapeado em memória e reaplica a cauda do diário.
+    """
+    def __init__(self, diretorio: str, sincrono: bool = True, registros_por_snapshot: int = 10000):
+        self.diretorio = diretorio
+        self.caminho_snapshot = os.path.join(diretorio, 'snapshot.jsonl')
+        self.registros_por_snapshot = registros_por_snapshot
+        self.diario = DiarioGroupCommit(diretorio, sincrono=sincrono)
+        self._desde_snapshot = 0
+
+    def _anexar(self, registro: Dict) -> int:
+        self._desde_snapshot += 1
+        return self.diario.anexar(json.dumps(registro, separators=(',', ':')).encode('utf-8') + b'\n')
+
+    def registrar_criacao(self, leilao: Leilao) -> int:
+        return self._anexar({"op": "criar", **leilao.para_dict()})
+
+    def registrar_status(self, leilao_id: str, status: str) -> int:
+        return self._anexar({"op": "status", "id": leilao_id, "status": status})
+
+    def aguardar(self, seq: int):
+        self.diario.aguardar(seq)
+
+    def precisa_compactar(self) -> bool:
+        return self._desde_snapshot >= self.registros_por_snapshot
+
+    def gravar_snapshot(self, segmento: int, registros: List[Dict]):
+        linhas = [json.dumps({"segmento": segmento}).encode('utf-8')]
+        linhas += [json.dumps(registro, separators=(',', ':')).encode('utf-8') for registro in registros]
+        escrever_atomicamente(self.caminho_snapshot, b'\n'.join(linhas) + b'\n')
+        self.diario.remover_segmentos_anteriores(segmento)
+        self._desde_snapshot = 0
+
+    @staticmethod
+    def _leilao(registro: Dict) -> Leilao:
+        return Leilao(
+            id=registro["id"],
+            desc=registro["desc"],
+            valor_inicial=registro["valor_inicial"],
+            criador_id=registro["criador_id"],
+            inicio=datetime.datetime.fromisoformat(registro["inicio"]),
+            fim=datetime.datetime.fromisoformat(registro["fim"]),
+            status=registro["status"]
+        )
+
+    def recuperar(self) -> List[Leilao]:
+        """Reconstrói os leilões (na ordem em que foram criados) a partir do disco"""
+        leiloes: Dict[str, Leilao] = OrderedDict()
+        segmento_inicial = 0
+
+        if os.path.exists(self.caminho_snapshot):
+            with mapear_arquivo(self.caminho_snapshot) as conteudo:
+                if conteudo:
+                    segmento_inicial = json.loads(conteudo.readline())["segmento"]
+                    for linha in iter(conteudo.readline, b''):
+                        leilao = self._leilao(json.loads(linha))
+                        leiloes[leilao.id] = leilao
+
+        segmentos = [n for n, _ in self.diario.segmentos() if n >= segmento_inicial]
+        cauda_valida = None
+        for numero, conteudo in zip(segmentos, self.diario.ler_segmentos(segmento_inicial)):
+            tamanho_valido = 0
+            for linha in iter(conteudo.readline, b'') if conteudo else ():
+                if not linha.endswith(b'\n'):
+                    break  # Registro incompleto: queda durante a escrita
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    break
+                tamanho_valido += len(linha)
+                if registro["op"] == "criar":
+                    leilao = self._leilao(registro)
+                    leiloes[leilao.id] = leilao
+                elif registro["op"] == "status" and registro["id"] in leiloes:
+                    leiloes[registro["id"]].status = registro["status"]
+            if numero == segmentos[-1] and tamanho_valido < len(conteudo):
+                cauda_valida = tamanho_valido
+
+        # Novas escritas não podem ser anexadas depois de um registro incompleto
+        if cauda_valida is not None:
+            self.diario.truncar_segmento_atual(cauda_valida)
+        return list(leiloes.values())
+
+class CompactadorLeiloes(threading.Thread):
+    """Thread que grava snapshots quando o diário acumula registros suficientes"""
+    def __init__(self, repositorio: RepositorioLeiloes, intervalo: float = 30.0):
+        super().__init__(daemon=True)
+        self.repositorio = repositorio
+        self.intervalo = intervalo
+        self.running = True
+
+    def run(self):
+        while self.running:
+            time.sleep(self.intervalo)
+            try:
+                if self.repositorio.persistencia.precisa_compactar():
+                    self.repositorio.compactar()
+                    log.info("Snapshot dos leilões gravado")
+            except Exception:
+                log.erro("Erro ao gravar snapshot", excecao=True)
+
+# Persistência: LEILAO_PERSISTENCIA=0 mantém o estado apenas em memória
+DIRETORIO_DADOS = os.environ.get('LEILAO_DIRETORIO_DADOS', os.path.join('dados', 'ms_leilao'))
+PERSISTENCIA_ATIVA = os.environ.get('LEILAO_PERSISTENCIA', '1') != '0'
+FSYNC_ATIVO = os.environ.get('LEILAO_FSYNC', '1') != '0'
+
+# Armazenamento dos leilões (a persistência é aberta ao iniciar o serviço)
+leiloes = RepositorioLeiloes()
+
+class AgendadorLeiloes:
+    """Min-heap de transições de leilões ordenado pelo prazo (O(log n) por operação)"""
+    def __init__(self):
+        self._heap = []  # [(quando, seq, leilao_id, acao)]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._parado = False
+
+    def __len__(self):
+        return len(self._heap)
 
-# Armazenamento em memória dos leilões
-leiloes: Dict[str, Dict] = {}
+    def agendar(self, quando: datetime.datetime, leilao_id: str, acao: str):
+        """Agenda uma transição ('iniciar' ou 'finalizar') para o instante informado"""
+        with self._cond:
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (quando, seq, leilao_id, acao))
+            # Só acorda o monitor se o novo item passou a ser o próximo prazo
+            if self._heap[0][1] == seq:
+                self._cond.notify()
+
+    def aguardar_vencidas(self) -> List[Tuple[str, str]]:
+        """Bloqueia até o próximo prazo e retorna todas as transições vencidas"""
+        with self._cond:
+            while not self._parado:
+                agora = datetime.datetime.now()
+                if self._heap and self._heap[0][0] <= agora:
+                    vencidas = []
+                    while self._heap and self._heap[0][0] <= agora:
+                        _, _, leilao_id, acao = heapq.heappop(self._heap)
+                        vencidas.append((leilao_id, acao))
+                    return vencidas
+                espera = (self._heap[0][0] - agora).total_seconds() if self._heap else None
+                self._cond.wait(timeout=espera)
+            return []
+
+    def parar(self):
+        with self._cond:
+            self._parado = True
+            self._cond.notify_all()
+
+# Transições: ação -> (status de origem, status de destino)
+TRANSICOES = {"iniciar": ("agendado", "ativo"), "finalizar": ("ativo", "finalizado")}
+ESPERA_REPUBLICACAO = 1.0  # Pausa antes de tentar de novo uma transição cujo evento não foi publicado
 
 class CicloVidaLeilao(threading.Thread):
-    """Thread que monitora o ciclo de vida dos leilões"""
+    """Thread que executa as transições de ciclo de vida dos leilões no prazo exato"""
     def __init__(self):
         super().__init__()
         self.daemon = True
         self.running = True
-        self.connection = None
-        self.channel = None
-
-    def connect(self):
-        """Conecta ao RabbitMQ"""
-        self.connection = utils.get_rabbitmq_connection()
-        self.channel = self.connection.channel()
-        utils.setup_queues(self.channel)
+        self.agendador = AgendadorLeiloes()
 
-    def disconnect(self):
-        """Desconecta do RabbitMQ"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
-
-    def publicar_leilao_iniciado(self, leilao_id: str, leilao: Dict):
+    def publicar_leilao_iniciado(self, leilao: Leilao) -> Future:
         """Publica evento de leilão iniciado"""
         evento = {
-            "id": leilao_id,
-            "desc": leilao.get("desc", ""),
-            "valor_inicial": leilao.get("valor_inicial", 0),
-            "inicio": leilao.get("inicio", ""),
-            "fim": leilao.get("fim", "")
+            "id": leilao.id,
+            "desc": leilao.desc,
+            "valor_inicial": leilao.valor_inicial,
+            "inicio": leilao.inicio.isoformat(),
+            "fim": leilao.fim.isoformat()
         }
-        self.channel.basic_publish(
-            exchange='',
-            routing_key='leilao_iniciado',
-            body=json.dumps(evento),
-            properties=pika.BasicProperties(delivery_mode=2)  # Persistente
-        )
-        print(f"[MS Leilão] ✅ Leilão {leilao_id} iniciado: {leilao.get('desc')}")
+        # ID determinístico: uma republicação do mesmo evento é descartada pelos consumidores
+        return utils.get_publicador().publicar('', evento, exchange='leilao_iniciado',
+                                               message_id=f'leilao_iniciado:{leilao.id}')
 
-    def publicar_leilao_finalizado(self, leilao_id: str, leilao: Dict):
+    def publicar_leilao_finalizado(self, leilao: Leilao) -> Future:
         """Publica evento de leilão finalizado"""
         evento = {
-            "id": leilao_id,
-            "desc": leilao.get("desc", ""),
-            "fim": leilao.get("fim", "")
+            "id": leilao.id,
+            "desc": leilao.desc,
+            "fim": leilao.fim.isoformat()
         }
-        self.channel.basic_publish(
-            exchange='',
-            routing_key='leilao_finalizado',
-            body=json.dumps(evento),
-            properties=pika.BasicProperties(delivery_mode=2)  # Persistente
-        )
-        print(f"[MS Leilão] 🏁 Leilão {leilao_id} finalizado: {leilao.get('desc')}")
+        return utils.get_publicador().publicar('', evento, exchange='leilao_finalizado',
+                                               message_id=f'leilao_finalizado:{leilao.id}')
 
-    def verificar_ciclo_vida(self):
-        """Verifica e atualiza o ciclo de vida dos leilões"""
-        agora = datetime.datetime.now()
+    def agendar(self, leilao: Leilao):
+        """Agenda a próxima transição de um leilão de acordo com seu status"""
+        if leilao.status == "agendado":
+            self.agendador.agendar(leilao.inicio, leilao.id, "iniciar")
+        elif leilao.status == "ativo":
+            self.agendador.agendar(leilao.fim, leilao.id, "finalizar")
 
-        for leilao_id, leilao in leiloes.items():
-            status = leilao.get("status", "agendado")
-            inicio_str = leilao.get("inicio", "")
-            fim_str = leilao.get("fim", "")
+    def executar_transicao(self, leilao_id: str, acao: str):
+        """
+        Aplica uma transição vencida, ignorando-a se o status já mudou. O novo
+        status só é gravado depois que o broker confirma o evento: se o processo
+        cair antes, a recuperação encontra o status antigo e publica de novo (com
+        o mesmo message_id, descartado pelos consumidores que já o receberam).
+        """
+        de, para = TRANSICOES[acao]
+        leilao = leiloes.obter(leilao_id)
+        if leilao is None or leilao.status != de:
+            return
 
-            try:
-                inicio = datetime.datetime.fromisoformat(inicio_str.replace('Z', '+00:00'))
-                fim = datetime.datetime.fromisoformat(fim_str.replace('Z', '+00:00'))
-                
-                # Remove timezone para comparação
-                if inicio.tzinfo:
-                    inicio = inicio.replace(tzinfo=None)
-                if fim.tzinfo:
-                    fim = fim.replace(tzinfo=None)
-
-                # Verifica se deve iniciar
-                if status == "agendado" and agora >= inicio and agora < fim:
-                    leilao["status"] = "ativo"
-                    self.publicar_leilao_iniciado(leilao_id, leilao)
-
-                # Verifica se deve finalizar
-                elif status == "ativo" and agora >= fim:
-                    leilao["status"] = "finalizado"
-                    self.publicar_leilao_finalizado(leilao_id, leilao)
-
-            except (ValueError, AttributeError) as e:
-                print(f"[MS Leilão] Erro ao processar datas do leilão {leilao_id}: {e}")
+        publicar = self.publicar_leilao_iniciado if acao == "iniciar" else self.publicar_leilao_finalizado
+        try:
+            publicar(leilao).result(timeout=utils.TEMPO_CONFIRMACAO)
+        except (utils.PublicacaoRecusada, utils.FilaPublicacaoCheia, TimeoutError) as e:
+            log.erro("Falha ao publicar a transição do leilão, nova tentativa agendada",
+                     leilao_id=leilao_id, acao=acao, erro=repr(e))
+            self.agendador.agendar(datetime.datetime.now() + datetime.timedelta(seconds=ESPERA_REPUBLICACAO),
+                                   leilao_id, acao)
+            return
+
+        if leiloes.transicionar(leilao_id, de, para) is None:
+            return
+        if acao == "iniciar":
+            log.info("Leilão iniciado", leilao_id=leilao_id, desc=leilao.desc)
+            self.agendador.agendar(leilao.fim, leilao_id, "finalizar")
+        else:
+            log.info("Leilão finalizado", leilao_id=leilao_id, desc=leilao.desc)
+
+    def parar(self):
+        self.running = False
+        self.agendador.parar()
 
     def run(self):
-        """Loop principal de monitoramento"""
-        try:
-            self.connect()
-            while self.running:
-                self.verificar_ciclo_vida()
-                time.sleep(5)  # Verifica a cada 5 segundos
-        except Exception as e:
-            print(f"[MS Leilão] Erro no monitoramento: {e}")
-        finally:
-            self.disconnect()
-
-# Inicia thread de monitoramento
+        """Loop principal: dorme até o próximo prazo do agendador"""
+        while self.running:
+            for leilao_id, acao in self.agendador.aguardar_vencidas():
+                try:
+                    self.executar_transicao(leilao_id, acao)
+                except Exception:
+                    log.erro("Erro na transição do leilão", excecao=True, leilao_id=leilao_id, acao=acao)
+
 monitor_thread = CicloVidaLeilao()
-monitor_thread.start()
+compactador = CompactadorLeiloes(leiloes)
+
+@servico.ao_iniciar
+def recuperar_leiloes():
+    """
+    Abre a persistência, recupera o estado gravado e reagenda as transições
+    pendentes (as vencidas disparam imediatamente, então leilões que terminaram
+    durante a queda são finalizados agora)
+    """
+    if not PERSISTENCIA_ATIVA:
+        return
+    leiloes.persistencia = PersistenciaLeiloes(DIRETORIO_DADOS, sincrono=FSYNC_ATIVO)
+    recuperados = leiloes.recuperar()
+    for leilao in recuperados:
+        monitor_thread.agendar(leilao)
+    log.info("Leilões não finalizados recuperados do disco", leiloes=len(recuperados))
+    compactador.start()
+
+@servico.ao_iniciar
+def iniciar_monitor():
+    monitor_thread.start()
+
+@servico.ao_parar
+def parar_monitor():
+    monitor_thread.parar()
+
+def criar_app() -> Flask:
+    """Fábrica usada pelo servidor WSGI: inicia o serviço neste processo e retorna a aplicação"""
+    return servico.iniciar()
 
 # --- Endpoints REST ---
 
@@ -151,72 +454,39 @@ def criar_leilao():
         return jsonify({"erro": f"Formato de data inválido: {e}"}), 400
 
     # Cria o leilão
-    novo_leilao = {
-        "id": leilao_id,
-        "desc": dados['desc'],
-        "valor_inicial": dados.get('valor_inicial', 0),
-        "criador_id": dados['criador_id'],
-        "inicio": hora_inicio.isoformat(),
-        "fim": hora_fim.isoformat(),
-        "status": "agendado"
-    }
-
-    leiloes[leilao_id] = novo_leilao
-
-    # Verifica imediatamente se deve iniciar (sem esperar o ciclo de vida)
+    novo_leilao = Leilao(
+        id=leilao_id,
+        desc=dados['desc'],
+        valor_inicial=dados.get('valor_inicial', 0),
+        criador_id=dados['criador_id'],
+        inicio=hora_inicio,
+        fim=hora_fim
+    )
+
+    if not leiloes.adicionar(novo_leilao):
+        return jsonify({"erro": f"Leilão com ID {leilao_id} já existe"}), 409
+
+    # Verifica imediatamente se deve iniciar (sem esperar o ciclo de vida); a
+    # transição agenda o fim do leilão, ou uma nova tentativa se a publicação falhar
     agora = datetime.datetime.now()
     if hora_inicio <= agora < hora_fim:
-        novo_leilao["status"] = "ativo"
-        # Garante que o monitor_thread está conectado
-        if not monitor_thread.channel or not monitor_thread.channel.is_open:
-            monitor_thread.connect()
-        # Publica evento de início imediatamente
-        monitor_thread.publicar_leilao_iniciado(leilao_id, novo_leilao)
-        print(f"[MS Leilão] ✅ Leilão criado e iniciado imediatamente: {leilao_id} - {dados['desc']}")
+        monitor_thread.executar_transicao(leilao_id, "iniciar")
     else:
-        print(f"[MS Leilão] ✅ Leilão criado (agendado): {leilao_id} - {dados['desc']}")
+        log.info("Leilão criado (agendado)", leilao_id=leilao_id, desc=dados['desc'])
+        # Insere a próxima transição diretamente no agendador
+        monitor_thread.agendar(novo_leilao)
     
-    return jsonify(novo_leilao), 201
+    return jsonify(novo_leilao.para_dict()), 201
 
 @app.route('/leiloes', methods=['GET'])
 def consultar_leiloes():
     """Consulta leilões ativos"""
-    # Filtra apenas leilões ativos
-    leiloes_ativos = []
-    agora = datetime.datetime.now()
-
-    for leilao_id, leilao in leiloes.items():
-        status = leilao.get("status", "agendado")
-        
-        # Considera ativo se status é "ativo" ou se está entre início e fim
-        try:
-            inicio = datetime.datetime.fromisoformat(leilao.get("inicio", "").replace('Z', '+00:00'))
-            fim = datetime.datetime.fromisoformat(leilao.get("fim", "").replace('Z', '+00:00'))
-            
-            if inicio.tzinfo:
-                inicio = inicio.replace(tzinfo=None)
-            if fim.tzinfo:
-                fim = fim.replace(tzinfo=None)
-
-            if status == "ativo" or (inicio <= agora < fim):
-                # Retorna dados formatados para o frontend
-                leilao_info = {
-                    "id": leilao_id,
-                    "desc": leilao.get("desc", ""),
-                    "valor_inicial": leilao.get("valor_inicial", 0),
-                    "inicio": leilao.get("inicio", ""),
-                    "fim": leilao.get("fim", ""),
-                    "status": "ativo"
-                }
-                leiloes_ativos.append(leilao_info)
-        except (ValueError, AttributeError):
-            continue
-
+    # Usa o índice por status: custo proporcional apenas aos leilões ativos
+    leiloes_ativos = [leilao.resumo() for leilao in leiloes.listar("ativo")]
     return jsonify(leiloes_ativos), 200
 
 if __name__ == '__main__':
-    print("🚀 MS Leilão iniciado na porta 4999")
-    print("📡 Monitorando ciclo de vida dos leilões...")
-    # use_reloader=False evita que o Flask reinicie e perca o estado das threads
-    app.run(debug=True, port=4999, threaded=True, use_reloader=False)
+    # Servidor de desenvolvimento; em produção: python servir.py ms_leilao
+    log.info("MS Leilão iniciado", porta=4999)
+    criar_app().run(port=4999, threaded=True)
 
@@ -1,170 +1,402 @@
 from flask import Flask, jsonify, request
-import pika
+import heapq
+import itertools
 import json
+import os
+import random
 import threading
+import time
 import requests
 import utils
-from typing import Dict
+import logs
+import metricas
+from concurrent.futures import Future
+from cliente_http import ClienteUpstream
+from servico import Servico
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
 app = Flask(__name__)
+metricas.expor(app)
+servico = Servico(app)
+log = logs.Log('ms_pagamento')
 
 # URL do sistema externo de pagamentos (simulado)
 SISTEMA_PAGAMENTO_URL = "http://localhost:5001"  # Você pode ajustar conforme necessário
 
-# Armazenamento em memória dos pagamentos pendentes
-pagamentos_pendentes: Dict[str, Dict] = {}  # {leilao_id: {"vencedor_id": str, "valor": float, "link": str}}
+ESTADOS_PAGAMENTO = ("link_pendente", "aguardando", "aprovado", "recusado", "expirado")
+ESTADOS_FINAIS = ("aprovado", "recusado", "expirado")
+TRANSICOES_PAGAMENTO = {
+    "link_pendente": ("aguardando",),
+    "aguardando": ("aprovado", "recusado", "expirado"),
+}
+
+class Pagamento:
+    """Registro tipado do pagamento de um leilão"""
+    __slots__ = ('leilao_id', 'vencedor_id', 'valor', 'estado', 'link', 'transacao_id',
+                 'criado_em', 'atualizado_em', 'prazo')
+
+    def __init__(self, leilao_id: str, vencedor_id: str, valor: float):
+        self.leilao_id = leilao_id
+        self.vencedor_id = vencedor_id
+        self.valor = valor
+        self.estado = "link_pendente"
+        self.link = None
+        self.transacao_id = None
+        self.criado_em = self.atualizado_em = time.time()
+        self.prazo = None  # Instante em que um pagamento aguardando expira
+
+    def para_dict(self) -> Dict:
+        return {
+            "id": self.leilao_id,
+            "vencedor_id": self.vencedor_id,
+            "valor": self.valor,
+            "estado": self.estado,
+            "link": self.link,
+            "transacao_id": self.transacao_id,
+            "criado_em": datetime.fromtimestamp(self.criado_em).isoformat(),
+            "atualizado_em": datetime.fromtimestamp(self.atualizado_em).isoformat(),
+            "prazo": datetime.fromtimestamp(self.prazo).isoformat() if self.prazo else None
+        }
+
+class RepositorioPagamentos:
+    """
+    Pagamentos por leilão com máquina de estados explícita e índice por estado.
 
-class ConsumidorVencedor(threading.Thread):
-    """Thread que consome eventos de leilão vencedor"""
-    def __init__(self):
-        super().__init__()
-        self.daemon = True
-        self.running = True
-        self.connection = None
-        self.channel = None
-
-    def connect(self):
-        """Conecta ao RabbitMQ"""
-        self.connection = utils.get_rabbitmq_connection()
-        self.channel = self.connection.channel()
-        utils.setup_queues(self.channel)
-
-    def disconnect(self):
-        """Desconecta do RabbitMQ"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
-
-    def processar_leilao_vencedor(self, ch, method, properties, body):
-        """Processa evento de leilão vencedor e gera link de pagamento"""
+    Pagamentos aguardando têm um prazo (heap de expirações) e uma próxima
+    verificação no sistema externo (heap de verificações), ambos com remoção
+    preguiçosa: entradas cujo pagamento já mudou de estado são ignoradas.
+    Pagamentos em estado final ficam num arquivo limitado aos
+    `limite_finalizados` mais recentes.
+    """
+    def __init__(self, prazo_pagamento: float, intervalo_verificacao: float, limite_finalizados: int = 1000):
+        self.prazo_pagamento = prazo_pagamento
+        self.intervalo_verificacao = intervalo_verificacao
+        self.limite_finalizados = limite_finalizados
+        self._lock = threading.Lock()
+        self._pagamentos: Dict[str, Pagamento] = {}
+        self._por_estado: Dict[str, Dict[str, Pagamento]] = {estado: {} for estado in ESTADOS_PAGAMENTO}
+        self._finalizados: "OrderedDict[str, Pagamento]" = OrderedDict()
+        self._expiracoes: List[Tuple[float, str]] = []
+        self._verificacoes: List[Tuple[float, str]] = []
+
+    def obter(self, leilao_id: str) -> Optional[Pagamento]:
+        return self._pagamentos.get(leilao_id)
+
+    def criar(self, leilao_id: str, vencedor_id: str, valor: float) -> Optional[Pagamento]:
+        """Registra um pagamento em link_pendente; retorna None se o leilão já tem pagamento"""
+        with self._lock:
+            if leilao_id in self._pagamentos:
+                return None
+            pagamento = Pagamento(leilao_id, vencedor_id, valor)
+            self._pagamentos[leilao_id] = pagamento
+            self._por_estado[pagamento.estado][leilao_id] = pagamento
+            return pagamento
+
+    def remover(self, leilao_id: str):
+        """Descarta um pagamento cujo link não pôde ser gerado (um novo evento pode tentar de novo)"""
+        with self._lock:
+            pagamento = self._pagamentos.get(leilao_id)
+            if pagamento is not None and pagamento.estado == "link_pendente":
+                del self._pagamentos[leilao_id]
+                del self._por_estado["link_pendente"][leilao_id]
+
+    def _mudar_estado(self, pagamento: Pagamento, para: str):
+        del self._por_estado[pagamento.estado][pagamento.leilao_id]
+        pagamento.estado = para
+        pagamento.atualizado_em = time.time()
+        self._por_estado[para][pagamento.leilao_id] = pagamento
+        if para in ESTADOS_FINAIS:
+            self._finalizados[pagamento.leilao_id] = pagamento
+            while len(self._finalizados) > self.limite_finalizados:
+                antigo, _ = self._finalizados.popitem(last=False)
+                removido = self._pagamentos.pop(antigo)
+                del self._por_estado[removido.estado][antigo]
+
+    def link_gerado(self, leilao_id: str, link: str, transacao_id: str) -> Optional[Pagamento]:
+        """link_pendente -> aguardando: agenda o prazo e a primeira verificação"""
+        with self._lock:
+            pagamento = self._pagamentos.get(leilao_id)
+            if pagamento is None or pagamento.estado != "link_pendente":
+                return None
+            pagamento.link = link
+            pagamento.transacao_id = transacao_id
+            self._mudar_estado(pagamento, "aguardando")
+            pagamento.prazo = pagamento.atualizado_em + self.prazo_pagamento
+            heapq.heappush(self._expiracoes, (pagamento.prazo, leilao_id))
+            heapq.heappush(self._verificacoes, (pagamento.atualizado_em + self.intervalo_verificacao, leilao_id))
+            return pagamento
+
+    def transicionar(self, leilao_id: str, para: str) -> Optional[Pagamento]:
+        """Aplica uma transição válida a partir do estado atual; retorna o pagamento ou None"""
+        with self._lock:
+            pagamento = self._pagamentos.get(leilao_id)
+            if pagamento is None or para not in TRANSICOES_PAGAMENTO.get(pagamento.estado, ()):
+                return None
+            self._mudar_estado(pagamento, para)
+            return pagamento
+
+    def _retirar(self, heap: List[Tuple[float, str]], agora: float, limite: int, vistos: set) -> List[Pagamento]:
+        encontrados = []
+        while heap and heap[0][0] <= agora and len(encontrados) < limite:
+            _, leilao_id = heapq.heappop(heap)
+            pagamento = self._pagamentos.get(leilao_id)
+            if pagamento is not None and pagamento.estado == "aguardando" and leilao_id not in vistos:
+                vistos.add(leilao_id)
+                encontrados.append(pagamento)
+        return encontrados
+
+    def para_reconciliar(self, agora: float, limite: int) -> List[Pagamento]:
+        """Pagamentos aguardando com prazo vencido ou verificação devida (vencidos primeiro)"""
+        with self._lock:
+            vistos = set()
+            vencidos = self._retirar(self._expiracoes, agora, limite, vistos)
+            return vencidos + self._retirar(self._verificacoes, agora, limite - len(vencidos), vistos)
+
+    def reagendar_verificacao(self, leilao_id: str, quando: float):
+        with self._lock:
+            heapq.heappush(self._verificacoes, (quando, leilao_id))
+
+    def listar(self, estados: Iterable[str], vencedor_id: str = None, pagina: int = 1,
+               tamanho: int = 50) -> Tuple[int, List[Dict]]:
+        """Retorna (total, página de pagamentos) dos estados pedidos; páginas começam em 1"""
+        with self._lock:
+            candidatos = itertools.chain.from_iterable(self._por_estado[e].values() for e in estados)
+            if vencedor_id is None:
+                total = sum(len(self._por_estado[e]) for e in estados)
+            else:
+                candidatos = [p for p in candidatos if p.vencedor_id == vencedor_id]
+                total = len(candidatos)
+            inicio = (pagina - 1) * tamanho
+            return total, [p.para_dict() for p in itertools.islice(candidatos, inicio, inicio + tamanho)]
+
+# Prazo para o vencedor pagar, e de quanto em quanto tempo um pagamento aguardando é conferido no sistema externo
+PAGAMENTO_PRAZO = float(os.environ.get('PAGAMENTO_PRAZO', 15 * 60))
+PAGAMENTO_INTERVALO_VERIFICACAO = float(os.environ.get('PAGAMENTO_INTERVALO_VERIFICACAO', 60))
+
+pagamentos = RepositorioPagamentos(PAGAMENTO_PRAZO, PAGAMENTO_INTERVALO_VERIFICACAO)
+
+# Geração de links: workers, mensagens em andamento (prefetch) e novas tentativas
+PAGAMENTO_WORKERS = int(os.environ.get('PAGAMENTO_WORKERS', 16))
+PAGAMENTO_PREFETCH = int(os.environ.get('PAGAMENTO_PREFETCH', 64))
+PAGAMENTO_TENTATIVAS = max(1, int(os.environ.get('PAGAMENTO_TENTATIVAS', 4)))  # Inclui a primeira chamada
+PAGAMENTO_BACKOFF_BASE = float(os.environ.get('PAGAMENTO_BACKOFF_BASE', 0.2))
+PAGAMENTO_BACKOFF_MAX = float(os.environ.get('PAGAMENTO_BACKOFF_MAX', 5.0))
+
+# Sessão HTTP compartilhada (keep-alive) com limite de concorrência e circuit breaker
+sistema_pagamento = ClienteUpstream(SISTEMA_PAGAMENTO_URL, timeout_leitura=10,
+                                    tamanho_pool=PAGAMENTO_WORKERS, max_concorrencia=PAGAMENTO_WORKERS)
+
+class ErroTransitorio(Exception):
+    """Falha do sistema externo que vale a pena tentar de novo (rede, 5xx, 429)"""
+
+def criar_pagamento_externo(dados_pagamento: Dict) -> Dict:
+    """
+    Cria a transação no sistema externo, com novas tentativas e backoff
+    exponencial com jitter para falhas transitórias. Retorna a resposta JSON.
+    """
+    for tentativa in range(PAGAMENTO_TENTATIVAS):
         try:
-            evento = json.loads(body.decode('utf-8'))
-            leilao_id = evento.get('id')
-            vencedor_id = evento.get('vencedor_id')
-            valor = evento.get('valor')
-            
-            if not all([leilao_id, vencedor_id, valor]):
-                print(f"[MS Pagamento] ⚠️ Evento incompleto: {evento}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
-
-            print(f"[MS Pagamento] 🏆 Processando pagamento para leilão {leilao_id}")
-            print(f"   Vencedor: {vencedor_id}, Valor: R${valor:.2f}")
-
-            # Faz requisição REST ao sistema externo de pagamentos
-            dados_pagamento = {
-                "valor": valor,
-                "moeda": "BRL",
-                "cliente_id": vencedor_id,
+            response = sistema_pagamento.post('/pagamentos', json=dados_pagamento)
+            if response.status_code == 201:
+                return response.json()
+            if response.status_code < 500 and response.status_code != 429:
+                raise Exception(f"Sistema externo retornou status {response.status_code}: {response.text}")
+            erro = ErroTransitorio(f"Sistema externo retornou status {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            erro = e
+        if tentativa + 1 < PAGAMENTO_TENTATIVAS:
+            # Jitter evita que muitos workers tentem de novo ao mesmo tempo
+            espera = min(PAGAMENTO_BACKOFF_MAX, PAGAMENTO_BACKOFF_BASE * 2 ** tentativa)
+            time.sleep(random.uniform(0, espera))
+    raise erro
+
+class ConsumidorVencedor(utils.ConsumidorFila):
+    """
+    Consome os eventos de leilão vencedor com `workers` shards por leilão, para
+    que um sistema externo lento ocupe apenas o shard do leilão, sem travar o
+    consumo (nem os heartbeats) da conexão. Cada mensagem só é confirmada depois
+    que o link foi publicado e confirmado pelo broker; se a publicação falhar,
+    ela volta para a fila.
+
+    A fila é nomeada e durável (não exclusiva): eventos publicados enquanto o
+    serviço está desconectado esperam a reconexão.
+    """
+    def __init__(self, workers: int = PAGAMENTO_WORKERS, prefetch: int = PAGAMENTO_PREFETCH):
+        super().__init__('leilao_vencedor',
+                         utils.declarar_fila_compartilhada('pagamento_leilao_vencedor', 'leilao_vencedor'),
+                         self.processar_leilao_vencedor, prefetch=prefetch, shards=workers)
+
+    def publicar_link(self, pagamento: Pagamento) -> Future:
+        """Publica o evento link_pagamento (ID determinístico por leilão)"""
+        evento_link = {
+            "id": pagamento.leilao_id,
+            "vencedor_id": pagamento.vencedor_id,
+            "link": pagamento.link,
+            "valor": pagamento.valor
+        }
+        return utils.get_publicador().publicar('link_pagamento', evento_link,
+                                               message_id=f'link_pagamento:{pagamento.leilao_id}')
+
+    def gerar_link(self, evento: Dict) -> Future:
+        """Cria a transação no sistema externo e publica o link (ou um evento de erro)"""
+        leilao_id = evento['id']
+        vencedor_id = evento['vencedor_id']
+        valor = evento['valor']
+
+        if pagamentos.criar(leilao_id, vencedor_id, valor) is None:
+            # Pagamento já criado: não abre uma segunda transação no sistema externo
+            existente = pagamentos.obter(leilao_id)
+            if existente is None or existente.link is None:
+                # Link ainda sendo gerado por outro worker, que publicará o evento
+                concluido = Future()
+                concluido.set_result(None)
+                return concluido
+            log.info("Pagamento já existe, republicando o link", leilao_id=leilao_id)
+            return self.publicar_link(existente)
+
+        log.info("Processando pagamento", leilao_id=leilao_id, vencedor_id=vencedor_id, valor=valor)
+
+        dados_pagamento = {
+            "valor": valor,
+            "moeda": "BRL",
+            "cliente_id": vencedor_id,
+            "id": leilao_id,
+            "descricao": f"Pagamento do leilão {leilao_id}"
+        }
+
+        try:
+            resposta = criar_pagamento_externo(dados_pagamento)
+            link_pagamento = resposta.get('link_pagamento')
+            transacao_id = resposta.get('transacao_id')
+
+            if not link_pagamento:
+                raise Exception("Link de pagamento não retornado pelo sistema externo")
+
+            futuro = self.publicar_link(pagamentos.link_gerado(leilao_id, link_pagamento, transacao_id))
+
+            log.info("Link de pagamento gerado", leilao_id=leilao_id, link=link_pagamento, transacao_id=transacao_id)
+        except Exception as e:
+            pagamentos.remover(leilao_id)
+            if isinstance(e, (requests.exceptions.RequestException, ErroTransitorio)):
+                log.erro("Erro ao comunicar com sistema externo", leilao_id=leilao_id, erro=str(e))
+                mensagem = f"Erro de comunicação: {str(e)}"
+            else:
+                log.erro("Erro ao gerar link de pagamento", excecao=True, leilao_id=leilao_id)
+                mensagem = str(e)
+            # Publica evento de erro
+            evento_erro = {
                 "id": leilao_id,
-                "descricao": f"Pagamento do leilão {leilao_id}"
+                "vencedor_id": vencedor_id,
+                "erro": mensagem
             }
+            futuro = utils.get_publicador().publicar('link_pagamento', evento_erro)
 
-            try:
-                # Faz requisição REST ao sistema externo de pagamentos
-                response = requests.post(
-                    f"{SISTEMA_PAGAMENTO_URL}/pagamentos",
-                    json=dados_pagamento,
-                    timeout=10
-                )
-                
-                if response.status_code == 201:
-                    resposta = response.json()
-                    link_pagamento = resposta.get('link_pagamento')
-                    transacao_id = resposta.get('transacao_id')
-                    
-                    if not link_pagamento:
-                        raise Exception("Link de pagamento não retornado pelo sistema externo")
-                    
-                    # Armazena informações do pagamento
-                    pagamentos_pendentes[leilao_id] = {
-                        "vencedor_id": vencedor_id,
-                        "valor": valor,
-                        "link": link_pagamento,
-                        "transacao_id": transacao_id
-                    }
-
-                    # Publica evento link_pagamento
-                    evento_link = {
-                        "id": leilao_id,
-                        "vencedor_id": vencedor_id,
-                        "link": link_pagamento,
-                        "valor": valor
-                    }
-
-                    self.channel.basic_publish(
-                        exchange='',
-                        routing_key='link_pagamento',
-                        body=json.dumps(evento_link),
-                        properties=pika.BasicProperties(delivery_mode=2)
-                    )
-
-                    print(f"[MS Pagamento] ✅ Link de pagamento gerado para leilão {leilao_id}")
-                    print(f"   Link: {link_pagamento}")
-                    print(f"   Transação ID: {transacao_id}")
-                else:
-                    raise Exception(f"Sistema externo retornou status {response.status_code}: {response.text}")
-
-            except requests.exceptions.RequestException as e:
-                print(f"[MS Pagamento] ❌ Erro ao comunicar com sistema externo: {e}")
-                # Publica evento de erro
-                evento_erro = {
-                    "id": leilao_id,
-                    "vencedor_id": vencedor_id,
-                    "erro": f"Erro de comunicação: {str(e)}"
-                }
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key='link_pagamento',
-                    body=json.dumps(evento_erro),
-                    properties=pika.BasicProperties(delivery_mode=2)
-                )
-            except Exception as e:
-                print(f"[MS Pagamento] ❌ Erro ao gerar link de pagamento: {e}")
-                # Publica evento de erro
-                evento_erro = {
-                    "id": leilao_id,
-                    "vencedor_id": vencedor_id,
-                    "erro": str(e)
-                }
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key='link_pagamento',
-                    body=json.dumps(evento_erro),
-                    properties=pika.BasicProperties(delivery_mode=2)
-                )
-
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"[MS Pagamento] Erro ao processar leilao_vencedor: {e}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        return futuro
 
-    def run(self):
-        """Inicia o consumo de eventos"""
+    def processar_leilao_vencedor(self, method, body):
+        """Valida o evento de leilão vencedor, gera o link e espera a confirmação da publicação"""
         try:
-            self.connect()
-            
-            exchange = self.channel.queue_declare(queue='', exclusive=True)
-            self.aux_queue = exchange.method.queue
-            self.channel.queue_bind(exchange='leilao_vencedor', queue=self.aux_queue)
-
-            self.channel.basic_consume(
-                queue=self.aux_queue,
-                on_message_callback=self.processar_leilao_vencedor
-            )
-            
-            print("[MS Pagamento] 📡 Consumindo eventos: leilao_vencedor")
-            self.channel.start_consuming()
-            
-        except Exception as e:
-            print(f"[MS Pagamento] Erro no consumidor: {e}")
-        finally:
-            self.disconnect()
+            evento = json.loads(body.decode('utf-8'))
+        except json.JSONDecodeError as e:
+            log.erro("Erro ao processar leilao_vencedor", erro=str(e))
+            return
 
+        if not all([evento.get('id'), evento.get('vencedor_id'), evento.get('valor')]):
+            log.aviso("Evento leilao_vencedor incompleto", evento=evento)
+            return
+
+        try:
+            self.gerar_link(evento).result(timeout=utils.TEMPO_CONFIRMACAO)
+        except (utils.PublicacaoRecusada, utils.FilaPublicacaoCheia, TimeoutError) as e:
+            log.erro("Falha ao publicar link_pagamento, evento devolvido à fila", leilao_id=evento['id'], erro=repr(e))
+            raise utils.DevolverMensagem() from e
 
-# Inicia thread consumidora
 consumidor = ConsumidorVencedor()
-consumidor.start()
+servico.ao_iniciar(consumidor.start)
+servico.ao_parar(consumidor.parar)
+
+def publicar_status(pagamento: Pagamento):
+    """Publica o evento status_pagamento com o estado atual (ID determinístico por transação e estado)"""
+    evento_status = {
+        "id": pagamento.leilao_id,
+        "vencedor_id": pagamento.vencedor_id,
+        "status": pagamento.estado,
+        "valor": pagamento.valor,
+        "transacao_id": pagamento.transacao_id
+    }
+    utils.get_publicador().publicar(
+        'status_pagamento', evento_status,
+        message_id=f'status_pagamento:{pagamento.leilao_id}:{pagamento.transacao_id}:{pagamento.estado}'
+    )
+    log.info("Status do pagamento publicado", leilao_id=pagamento.leilao_id, estado=pagamento.estado)
+
+# Reconciliação: frequência da varredura e quantas transações são consultadas por requisição
+RECONCILIAR_INTERVALO = float(os.environ.get('PAGAMENTO_RECONCILIAR_INTERVALO', 5))
+RECONCILIAR_LOTE = int(os.environ.get('PAGAMENTO_RECONCILIAR_LOTE', 100))
+
+class ReconciliadorPagamentos(threading.Thread):
+    """
+    Thread que confere no sistema externo, em lotes, os pagamentos aguardando
+    há mais de PAGAMENTO_INTERVALO_VERIFICACAO segundos (webhook perdido) ou
+    com prazo vencido. Pagamentos vencidos que continuam pendentes expiram.
+    """
+    def __init__(self, intervalo: float = RECONCILIAR_INTERVALO, lote: int = RECONCILIAR_LOTE):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.lote = lote
+        self.running = True
+
+    def consultar(self, lote: List[Pagamento]) -> Dict[str, Dict]:
+        """Consulta as transações do lote numa única requisição: {transacao_id: transacao}"""
+        response = sistema_pagamento.get('/transacoes', params={'ids': ','.join(p.transacao_id for p in lote)})
+        response.raise_for_status()
+        return response.json()
+
+    def reconciliar(self, lote: List[Pagamento]):
+        agora = time.time()
+        try:
+            transacoes = self.consultar(lote)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.aviso("Reconciliação adiada, sistema externo indisponível", erro=str(e), pagamentos=len(lote))
+            for pagamento in lote:
+                pagamentos.reagendar_verificacao(pagamento.leilao_id, agora + self.intervalo)
+            return
+
+        for pagamento in lote:
+            status = transacoes.get(pagamento.transacao_id, {}).get('status')
+            if status in ('aprovado', 'recusado'):
+                novo = status
+            elif pagamento.prazo <= agora:
+                novo = 'expirado'
+            else:
+                pagamentos.reagendar_verificacao(pagamento.leilao_id, agora + pagamentos.intervalo_verificacao)
+                continue
+            if pagamentos.transicionar(pagamento.leilao_id, novo):
+                log.info("Pagamento reconciliado", leilao_id=pagamento.leilao_id, estado=novo)
+                publicar_status(pagamento)
+
+    def run(self):
+        while self.running:
+            time.sleep(self.intervalo)
+            try:
+                while True:
+                    lote = pagamentos.para_reconciliar(time.time(), self.lote)
+                    if not lote:
+                        break
+                    self.reconciliar(lote)
+                    if len(lote) < self.lote:
+                        break
+            except Exception:
+                log.erro("Erro na reconciliação de pagamentos", excecao=True)
+
+reconciliador = ReconciliadorPagamentos()
+servico.ao_iniciar(reconciliador.start)
+
+def criar_app() -> Flask:
+    """Fábrica usada pelo servidor WSGI: inicia o serviço neste processo e retorna a aplicação"""
+    return servico.iniciar()
 
 # --- Endpoints REST ---
 
@@ -182,7 +414,6 @@ def webhook_pagamento():
     # Campos esperados do webhook
     leilao_id = dados.get('id')
     status = dados.get('status')  # 'aprovado' ou 'recusado'
-    transacao_id = dados.get('transacao_id', '')
     
     if not leilao_id or not status:
         return jsonify({"erro": "Campos obrigatórios ausentes: leilao_id, status"}), 400
@@ -190,49 +421,62 @@ def webhook_pagamento():
     if status not in ['aprovado', 'recusado']:
         return jsonify({"erro": "Status inválido. Deve ser 'aprovado' ou 'recusado'"}), 400
 
-    # Busca informações do pagamento
-    pagamento = pagamentos_pendentes.get(leilao_id)
-    
-    if not pagamento:
-        print(f"[MS Pagamento] ⚠️ Pagamento não encontrado para leilão {leilao_id}")
-        return jsonify({"erro": "Pagamento não encontrado"}), 404
-
-    # Publica evento status_pagamento
-    evento_status = {
-        "id": leilao_id,
-        "vencedor_id": pagamento.get("vencedor_id"),
-        "status": status,
-        "valor": pagamento.get("valor"),
-        "transacao_id": transacao_id
-    }
+    pagamento = pagamentos.transicionar(leilao_id, status)
+    if pagamento is None:
+        existente = pagamentos.obter(leilao_id)
+        if existente is None:
+            log.aviso("Pagamento não encontrado", leilao_id=leilao_id)
+            return jsonify({"erro": "Pagamento não encontrado"}), 404
+        if existente.estado != status:
+            return jsonify({"erro": f"Transição inválida: pagamento está '{existente.estado}'"}), 409
+        # Webhook repetido (ou já aplicado pela reconciliação)
+        return jsonify({"mensagem": f"Status do pagamento já processado: {status}", "id": leilao_id}), 200
 
-    channel = utils.get_rabbitmq_channel()
-    channel.basic_publish(
-        exchange='',
-        routing_key='status_pagamento',
-        body=json.dumps(evento_status),
-        properties=pika.BasicProperties(delivery_mode=2)
-    )
-
-    print(f"[MS Pagamento] 📢 Status do pagamento publicado: Leilão {leilao_id} - {status.upper()}")
-    
-    # Remove da lista de pendentes se aprovado
-    if status == 'aprovado':
-        pagamentos_pendentes.pop(leilao_id, None)
+    publicar_status(pagamento)
 
     return jsonify({
         "mensagem": f"Status do pagamento processado: {status}",
         "id": leilao_id
     }), 200
 
+TAMANHO_MAXIMO_PAGINA = 1000
+
+def _listar(estados_padrao: Tuple[str, ...]):
+    """Listagem paginada com filtros (?estado=a,b&vencedor_id=...&pagina=1&tamanho=50)"""
+    estados = tuple(request.args['estado'].split(',')) if request.args.get('estado') else estados_padrao
+    invalidos = [e for e in estados if e not in ESTADOS_PAGAMENTO]
+    if invalidos:
+        return jsonify({"erro": f"Estados inválidos: {invalidos}. Válidos: {list(ESTADOS_PAGAMENTO)}"}), 400
+    try:
+        pagina = int(request.args.get('pagina', 1))
+        tamanho = int(request.args.get('tamanho', 50))
+        if pagina < 1 or not 1 <= tamanho <= TAMANHO_MAXIMO_PAGINA:
+            raise ValueError("fora do intervalo permitido")
+    except ValueError as e:
+        return jsonify({"erro": f"Parâmetros de paginação inválidos: {e}"}), 400
+
+    total, itens = pagamentos.listar(estados, request.args.get('vencedor_id'), pagina, tamanho)
+    return jsonify({"total": total, "pagina": pagina, "tamanho": tamanho, "pagamentos": itens}), 200
+
+@app.route('/pagamentos', methods=['GET'])
+def listar_pagamentos():
+    """Lista os pagamentos (todos os estados, por padrão)"""
+    return _listar(ESTADOS_PAGAMENTO)
+
 @app.route('/pagamentos/pendentes', methods=['GET'])
 def listar_pagamentos_pendentes():
-    """Endpoint auxiliar para listar pagamentos pendentes (para debug)"""
-    return jsonify(pagamentos_pendentes), 200
+    """Lista os pagamentos ainda não concluídos (link_pendente e aguardando)"""
+    return _listar(("link_pendente", "aguardando"))
+
+@app.route('/pagamentos/<leilao_id>', methods=['GET'])
+def consultar_pagamento(leilao_id):
+    pagamento = pagamentos.obter(leilao_id)
+    if pagamento is None:
+        return jsonify({"erro": "Pagamento não encontrado"}), 404
+    return jsonify(pagamento.para_dict()), 200
 
 if __name__ == '__main__':
-    print("🚀 MS Pagamento iniciado na porta 4997")
-    print("📡 Aguardando eventos e webhooks...")
-    print(f"🌐 Webhook disponível em: http://localhost:4997/webhook/pagamento")
-    app.run(debug=True, port=4997, threaded=True)
+    # Servidor de desenvolvimento; em produção: python servir.py ms_pagamento
+    log.info("MS Pagamento iniciado", porta=4997, webhook="http://localhost:4997/webhook/pagamento")
+    criar_app().run(port=4997, threaded=True)
 
@@ -0,0 +1,45 @@
+"""
+Ciclo de vida dos serviços. Importar o módulo de um serviço apenas monta a
+aplicação Flask; threads de fundo, conexões e arquivos de dados são abertos
+pelas funções registradas em `ao_iniciar`, executadas uma única vez em cada
+processo que atende requisições (o worker do servidor WSGI, ver servir.py).
+Assim o módulo pode ser importado antes de um fork sem levar threads junto.
+"""
+import threading
+from typing import Callable, List
+from flask import Flask
+
+class Servico:
+    def __init__(self, app: Flask):
+        self.app = app
+        self.estado = 'novo'  # novo -> iniciado -> parado (threads não são reiniciadas)
+        self._ao_iniciar: List[Callable[[], None]] = []
+        self._ao_parar: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def ao_iniciar(self, funcao: Callable[[], None]) -> Callable[[], None]:
+        """Decorador: executa `funcao` ao iniciar o serviço, na ordem de registro"""
+        self._ao_iniciar.append(funcao)
+        return funcao
+
+    def ao_parar(self, funcao: Callable[[], None]) -> Callable[[], None]:
+        """Decorador: executa `funcao` ao parar o serviço, na ordem inversa de registro"""
+        self._ao_parar.append(funcao)
+        return funcao
+
+    def iniciar(self) -> Flask:
+        """Executa os ganchos de início (apenas na primeira chamada) e retorna a aplicação"""
+        with self._lock:
+            if self.estado == 'novo':
+                for funcao in self._ao_iniciar:
+                    funcao()
+                self.estado = 'iniciado'
+        return self.app
+
+    def parar(self):
+        with self._lock:
+            if self.estado != 'iniciado':
+                return
+            self.estado = 'parado'
+            for funcao in reversed(self._ao_parar):
+                funcao()
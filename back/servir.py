@@ -0,0 +1,130 @@
+"""
+Servidor de produção dos serviços, sobre o gunicorn (pip install gunicorn;
+e gevent, para --classe-worker gevent):
+
+    python servir.py gateway
+    python servir.py ms_lance --threads 64
+
+O processo mestre não importa o serviço: cada worker o importa e chama
+`criar_app()`, que inicia as threads de fundo (consumidores, agendadores,
+diários) naquele processo; ao encerrar o worker, `servico.parar()` é chamado.
+
+O MS Leilão, o MS Lance, o MS Pagamento e o sistema de pagamento externo
+rodam sempre com um único worker (a concorrência vem das threads): o estado
+que garante a consistência de cada um vive na memória do processo e nos seus
+diários, e um segundo worker teria uma cópia divergente (o motivo de cada um
+está em SERVICOS). Compartilhar esse estado exigiria levá-lo para fora do
+processo; enquanto isso, escalar esses serviços é dar mais threads ao worker.
+O gateway não tem estado próprio (interesses e SSE ficam no Redis) e aceita
+vários workers, mas roda com um por padrão: cada worker consome as filas
+duráveis lance_validado/lance_invalidado, e com vários workers eles competem
+pelas mensagens. Os shards mantêm a ordem dos eventos de um leilão apenas
+dentro de um processo, então dois lances do mesmo leilão podem chegar ao SSE
+fora de ordem. Filas exclusivas por worker também não resolvem: cada worker
+repetiria o evento no canal SSE compartilhado. Use --workers N (0 = um por
+núcleo) só se essa ordem não importar. Cada worker expõe as próprias métricas
+em /metrics.
+
+No gthread cada stream SSE aberto ocupa uma thread do worker enquanto o
+cliente estiver conectado. Por isso o gateway recebe, além de SERVIR_THREADS
+para as requisições comuns, uma thread por cliente SSE esperado
+(SERVIR_CLIENTES_SSE, divididos entre os workers). Com muitos milhares de
+clientes, prefira --classe-worker gevent, em que um stream custa um greenlet.
+"""
+import argparse
+import importlib
+import os
+import sys
+from gunicorn.app.base import BaseApplication
+
+SERVICOS = {
+    # nome: (módulo, porta, motivo do worker único ou None se aceita vários workers)
+    'gateway': ('API_Gateway', 5000, None),
+    'ms_leilao': ('ms_leilao', 4999,
+                  "o repositório de leilões e o agendador de início/fim ficam em memória, "
+                  "e o diário e os snapshots não podem ser abertos por dois processos"),
+    'ms_lance': ('ms_lance', 4998,
+                 "o lance vencedor de cada leilão é decidido sob o lock do seu estado em memória, "
+                 "e o livro de lances não pode ser aberto por dois processos"),
+    'ms_pagamento': ('ms_pagamento', 4997,
+                     "o repositório de pagamentos e a verificação de prazos ficam em memória; "
+                     "um segundo worker não veria os webhooks dos pagamentos do primeiro"),
+    'sistema_pagamento': ('sistema_pagamento_externo', 5001,
+                          "as transações e as liquidações agendadas ficam em memória, "
+                          "e o lock de liquidação única só vale dentro do processo"),
+}
+
+SERVIR_HOST = os.environ.get('SERVIR_HOST', '0.0.0.0')
+SERVIR_WORKERS = int(os.environ.get('SERVIR_WORKERS', 1))  # 0 = um por núcleo (apenas o gateway, ver acima)
+SERVIR_THREADS = int(os.environ.get('SERVIR_THREADS', 32))  # Threads por worker (gthread)
+SERVIR_CLIENTES_SSE = int(os.environ.get('SERVIR_CLIENTES_SSE', 512))  # Streams SSE simultâneos esperados no gateway
+SERVIR_CLASSE_WORKER = os.environ.get('SERVIR_CLASSE_WORKER', 'gthread')  # gthread | gevent
+SERVIR_CONEXOES = int(os.environ.get('SERVIR_CONEXOES', 1000))  # Conexões simultâneas por worker
+
+class Servidor(BaseApplication):
+    """Aplicação gunicorn que carrega o serviço em cada worker pela sua fábrica"""
+    def __init__(self, modulo: str, opcoes: dict):
+        self.modulo = modulo
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for chave, valor in self.opcoes.items():
+            self.cfg.set(chave, valor)
+
+    def load(self):
+        return importlib.import_module(self.modulo).criar_app()
+
+def parar_servico(servidor, worker):
+    """Gancho worker_exit: para as threads de fundo do serviço carregado no worker"""
+    modulo = sys.modules.get(worker.app.modulo)
+    if modulo is not None:
+        modulo.servico.parar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de produção (gunicorn) de um serviço do leilão")
+    parser.add_argument('servico', choices=sorted(SERVICOS))
+    parser.add_argument('--host', default=SERVIR_HOST)
+    parser.add_argument('--porta', type=int, help="Padrão: a porta do serviço")
+    parser.add_argument('--workers', type=int, default=SERVIR_WORKERS, help="0 = um por núcleo (apenas o gateway; perde a ordem por leilão no SSE)")
+    parser.add_argument('--threads', type=int, help="Padrão: SERVIR_THREADS, mais os clientes SSE no gateway")
+    parser.add_argument('--clientes-sse', type=int, default=SERVIR_CLIENTES_SSE,
+                        help="Streams SSE simultâneos esperados (apenas o gateway, gthread)")
+    parser.add_argument('--classe-worker', default=SERVIR_CLASSE_WORKER, choices=('gthread', 'gevent'))
+    args = parser.parse_args()
+
+    modulo, porta, motivo_worker_unico = SERVICOS[args.servico]
+    if motivo_worker_unico:
+        if args.workers > 1:
+            parser.error(f"{args.servico} roda com um único worker: {motivo_worker_unico}")
+        workers = 1
+    elif os.environ.get('INTERESSES_BACKEND', 'redis') == 'memoria' and args.workers != 1:
+        parser.error("INTERESSES_BACKEND=memoria exige um único worker (use o Redis para compartilhar os interesses)")
+    else:
+        workers = args.workers or os.cpu_count() or 1
+
+    threads = args.threads
+    if threads is None:
+        threads = SERVIR_THREADS
+        if motivo_worker_unico is None and args.classe_worker == 'gthread':
+            # Cada stream SSE prende uma thread: reserva as dos clientes esperados neste worker
+            threads += -(-args.clientes_sse // workers)
+
+    opcoes = {
+        'bind': f'{args.host}:{args.porta or porta}',
+        'workers': workers,
+        'worker_class': args.classe_worker,
+        'threads': threads,
+        'worker_connections': SERVIR_CONEXOES,
+        # Streams SSE ficam abertos indefinidamente: o timeout só vigia o worker travado
+        'timeout': 60,
+        'graceful_timeout': 10,
+        'keepalive': 5,
+        'preload_app': False,  # Importar no mestre levaria as threads do serviço para o fork
+        'worker_exit': parar_servico,
+        'accesslog': None,
+    }
+    Servidor(modulo, opcoes).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,181 @@
 from flask import Flask, jsonify, request
+import heapq
+import itertools
+import math
+import os
+import random
 import requests
 import uuid
 import time
 import threading
+from collections import deque
 from typing import Dict
 from datetime import datetime
+from cliente_http import ClienteUpstream
+from servico import Servico
+import logs
+import metricas
+from metricas import registro
 
 app = Flask(__name__)
+metricas.expor(app)
+servico = Servico(app)
+log = logs.Log('sistema_pagamento')
 
 # URL do webhook do MS Pagamento
-MS_PAGAMENTO_WEBHOOK_URL = "http://localhost:4997/webhook/pagamento"
+MS_PAGAMENTO_URL = os.environ.get('MS_PAGAMENTO_URL', "http://localhost:4997")
+WEBHOOK_CAMINHO = "/webhook/pagamento"
+MS_PAGAMENTO_WEBHOOK_URL = MS_PAGAMENTO_URL + WEBHOOK_CAMINHO
+
+# Envio de webhooks: workers fixos, atraso simulado de processamento e novas tentativas
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 8))
+WEBHOOK_ATRASO = float(os.environ.get('WEBHOOK_ATRASO', 1.0))
+WEBHOOK_TENTATIVAS = int(os.environ.get('WEBHOOK_TENTATIVAS', 8))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get('WEBHOOK_BACKOFF_BASE', 0.5))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', 30.0))
+
+# Modo de carga: liquida as transações automaticamente (sem clicar no formulário)
+SIMULACAO_AUTO = os.environ.get('SIMULACAO_AUTO', '0') == '1'
+SIMULACAO_LATENCIA = os.environ.get('SIMULACAO_LATENCIA', 'lognormal:500:0.5')  # Ver DistribuicaoLatencia
+SIMULACAO_TAXA_APROVACAO = float(os.environ.get('SIMULACAO_TAXA_APROVACAO', 0.9))
+SIMULACAO_TAXA_ERRO = float(os.environ.get('SIMULACAO_TAXA_ERRO', 0.0))  # Fração de POST /pagamentos com 503
+SIMULACAO_MAX_TPS = float(os.environ.get('SIMULACAO_MAX_TPS', 0))  # Transações criadas por segundo (0 = sem limite)
+SIMULACAO_TAXA_WEBHOOKS = float(os.environ.get('SIMULACAO_TAXA_WEBHOOKS', 0))  # Webhooks por segundo (0 = sem limite)
 
 # Armazenamento em memória das transações
 transacoes: Dict[str, Dict] = {}  # {transacao_id: {dados da transação}}
+lock_transacoes = threading.Lock()  # Garante uma única liquidação por transação (manual x automática)
+
+class DistribuicaoLatencia:
+    """
+    Distribuição da latência de liquidação, descrita em texto (valores em ms):
+    "fixa:<ms>", "uniforme:<min>:<max>", "exponencial:<media>" ou
+    "lognormal:<mediana>:<sigma>".
+    """
+    def __init__(self, texto: str):
+        nome, *parametros = texto.split(':')
+        try:
+            valores = [float(p) for p in parametros]
+        except ValueError:
+            raise ValueError(f"Parâmetros de latência inválidos: {texto}")
+        esperados = {"fixa": 1, "uniforme": 2, "exponencial": 1, "lognormal": 2}
+        if nome not in esperados or len(valores) != esperados[nome] or any(v < 0 for v in valores):
+            raise ValueError(f"Distribuição de latência inválida: {texto}")
+        self.texto = texto
+        self.nome = nome
+        self.valores = valores
+
+    def amostrar(self) -> float:
+        """Uma latência em segundos"""
+        if self.nome == "fixa":
+            ms = self.valores[0]
+        elif self.nome == "uniforme":
+            ms = random.uniform(*self.valores)
+        elif self.nome == "exponencial":
+            ms = random.expovariate(1 / self.valores[0]) if self.valores[0] else 0.0
+        else:
+            mediana, sigma = self.valores
+            ms = random.lognormvariate(math.log(mediana), sigma) if mediana else 0.0
+        return ms / 1000
+
+class LimitadorTaxa:
+    """
+    Token bucket: até `taxa` operações por segundo com rajadas de até `rajada`
+    (por padrão, um segundo de operações). taxa <= 0 desliga o limite.
+    """
+    def __init__(self, taxa: float = 0.0, rajada: float = None):
+        self._lock = threading.Lock()
+        self._rajada_fixa = rajada
+        self.configurar(taxa)
+
+    def configurar(self, taxa: float):
+        with self._lock:
+            self.taxa = taxa
+            self.rajada = self._rajada_fixa or max(1.0, taxa)
+            self._fichas = self.rajada
+            self._atualizado = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self._fichas = min(self.rajada, self._fichas + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def tentar(self) -> bool:
+        """Consome uma ficha se houver; não bloqueia"""
+        with self._lock:
+            if self.taxa <= 0:
+                return True
+            self._repor()
+            if self._fichas < 1:
+                return False
+            self._fichas -= 1
+            return True
+
+    def aguardar(self):
+        """Reserva uma ficha e espera até ela estar disponível (espaça as operações na taxa configurada)"""
+        with self._lock:
+            if self.taxa <= 0:
+                return
+            self._repor()
+            self._fichas -= 1
+            espera = -self._fichas / self.taxa if self._fichas < 0 else 0.0
+        if espera > 0:
+            time.sleep(espera)
+
+class ConfiguracaoSimulacao:
+    """Parâmetros do modo de carga, ajustáveis em tempo de execução (PUT /simulacao)"""
+    def __init__(self):
+        self.auto = SIMULACAO_AUTO
+        self.latencia = DistribuicaoLatencia(SIMULACAO_LATENCIA)
+        self.taxa_aprovacao = SIMULACAO_TAXA_APROVACAO
+        self.taxa_erro = SIMULACAO_TAXA_ERRO
+        self.limite_criacao = LimitadorTaxa(SIMULACAO_MAX_TPS)
+        self.limite_webhooks = LimitadorTaxa(SIMULACAO_TAXA_WEBHOOKS, rajada=1)  # Ritmo constante, sem rajadas
+
+    def atualizar(self, dados: Dict):
+        """Valida todos os campos antes de aplicar qualquer um (ValueError se algum for inválido)"""
+        novos = {}
+        if 'auto' in dados:
+            if not isinstance(dados['auto'], bool):
+                raise ValueError("'auto' deve ser booleano")
+            novos['auto'] = dados['auto']
+        if 'latencia' in dados:
+            novos['latencia'] = DistribuicaoLatencia(str(dados['latencia']))
+        for campo in ('taxa_aprovacao', 'taxa_erro'):
+            if campo in dados:
+                valor = float(dados[campo])
+                if not 0 <= valor <= 1:
+                    raise ValueError(f"'{campo}' deve estar entre 0 e 1")
+                novos[campo] = valor
+        for campo in ('max_tps', 'taxa_webhooks'):
+            if campo in dados:
+                novos[campo] = max(0.0, float(dados[campo]))
+
+        for campo in ('auto', 'latencia', 'taxa_aprovacao', 'taxa_erro'):
+            if campo in novos:
+                setattr(self, campo, novos[campo])
+        if 'max_tps' in novos:
+            self.limite_criacao.configurar(novos['max_tps'])
+        if 'taxa_webhooks' in novos:
+            self.limite_webhooks.configurar(novos['taxa_webhooks'])
+
+    def para_dict(self) -> Dict:
+        return {
+            "auto": self.auto,
+            "latencia": self.latencia.texto,
+            "taxa_aprovacao": self.taxa_aprovacao,
+            "taxa_erro": self.taxa_erro,
+            "max_tps": self.limite_criacao.taxa,
+            "taxa_webhooks": self.limite_webhooks.taxa
+        }
+
+simulacao = ConfiguracaoSimulacao()
+estatisticas_simulacao = {"erros_injetados": 0, "limitadas": 0, "liquidadas_automaticamente": 0}
+lock_estatisticas = threading.Lock()  # Contadores atualizados pelas requisições e pelo liquidante
+
+def contar_simulacao(contador: str):
+    with lock_estatisticas:
+        estatisticas_simulacao[contador] += 1
 
 # --- Endpoints REST ---
 
@@ -22,6 +185,14 @@ def criar_transacao():
     Recebe requisição do MS Pagamento para criar uma transação
     Retorna um link de pagamento
     """
+    # Limite de vazão e falhas injetadas do modo de carga
+    if not simulacao.limite_criacao.tentar():
+        contar_simulacao("limitadas")
+        return jsonify({"erro": "Limite de transações por segundo atingido"}), 429
+    if simulacao.taxa_erro and random.random() < simulacao.taxa_erro:
+        contar_simulacao("erros_injetados")
+        return jsonify({"erro": "Falha simulada do sistema de pagamentos"}), 503
+
     dados = request.get_json()
     
     if not dados:
@@ -49,13 +220,14 @@ def criar_transacao():
     }
     
     transacoes[transacao_id] = transacao
+    if simulacao.auto:
+        liquidante.agendar(transacao_id, simulacao.latencia.amostrar())
     
     # Gera o link de pagamento
     link_pagamento = f"http://localhost:5001/pagamentos/{transacao_id}/processar"
     
-    print(f"[Sistema Externo] ✅ Transação criada: {transacao_id}")
-    print(f"   Leilão: {dados['id']}, Cliente: {dados['cliente_id']}, Valor: R${dados['valor']:.2f}")
-    print(f"   Link: {link_pagamento}")
+    log.info("Transação criada", transacao_id=transacao_id, leilao_id=dados['id'],
+             cliente_id=dados['cliente_id'], valor=dados['valor'])
     
     return jsonify({
         "transacao_id": transacao_id,
@@ -130,16 +302,11 @@ def processar_pagamento(transacao_id):
             return f"<h1>Erro: Transação já processada ({transacao['status']})</h1>"
         return jsonify({"erro": f"Transação já processada. Status atual: {transacao['status']}"}), 400
 
-    transacao['status'] = status
-    transacao['processado_em'] = datetime.now().isoformat()
-    
-    threading.Thread(
-        target=enviar_webhook,
-        args=(transacao,),
-        daemon=True
-    ).start()
-    
-    print(f"[Sistema Externo] 💳 Pagamento processado: {transacao_id} - {status.upper()}")
+    if not liquidar(transacao, status):
+        # Liquidada automaticamente entre a verificação acima e agora
+        if not request.is_json:
+            return f"<h1>Erro: Transação já processada ({transacao['status']})</h1>"
+        return jsonify({"erro": f"Transação já processada. Status atual: {transacao['status']}"}), 400
     
     # Resposta final
     if request.is_json:
@@ -152,14 +319,20 @@ def processar_pagamento(transacao_id):
         cor = "green" if status == 'aprovado' else "red"
         return f"<h1 style='color: {cor}; text-align: center; margin-top: 50px;'>Pagamento {status.upper()}!</h1><p style='text-align: center;'>Você pode fechar esta janela.</p>"
 
-def enviar_webhook(transacao: Dict):
-    """
-    Envia notificação assíncrona via webhook ao MS Pagamento
-    """
-    # Aguarda um pouco para simular processamento
-    time.sleep(1)
-    
-    payload = {
+def liquidar(transacao: Dict, status: str) -> bool:
+    """Aprova ou recusa uma transação pendente e enfileira o webhook; False se já foi processada"""
+    with lock_transacoes:
+        if transacao['status'] != 'pendente':
+            return False
+        transacao['status'] = status
+        transacao['processado_em'] = datetime.now().isoformat()
+    despachante.enviar(transacao)
+    log.info("Pagamento processado", transacao_id=transacao['transacao_id'], status=status)
+    return True
+
+def montar_payload(transacao: Dict) -> Dict:
+    """Dados enviados no webhook (cópia do estado da transação no momento do processamento)"""
+    return {
         "transacao_id": transacao['transacao_id'],
         "id": transacao['id'],
         "status": transacao['status'],
@@ -168,27 +341,218 @@ def enviar_webhook(transacao: Dict):
         "moeda": transacao.get('moeda', 'BRL'),
         "processado_em": transacao.get('processado_em', '')
     }
-    
+
+class DespachanteWebhooks:
+    """
+    Envia os webhooks ao MS Pagamento com um número fixo de workers e uma
+    sessão HTTP keep-alive compartilhada.
+
+    Os envios ficam numa fila por horário (heap): o atraso simulado de
+    processamento e o backoff exponencial das novas tentativas são apenas o
+    horário em que o envio fica disponível, então nenhuma thread fica parada
+    esperando. Falhas de rede e respostas 5xx voltam para a fila até
+    `tentativas`; depois disso (ou com resposta 4xx) o envio é descartado e
+    guardado entre os últimos descartados.
+    """
+    def __init__(self, cliente: ClienteUpstream, caminho: str, limitador: LimitadorTaxa = None,
+                 workers: int = WEBHOOK_WORKERS,
+                 atraso: float = WEBHOOK_ATRASO, tentativas: int = WEBHOOK_TENTATIVAS,
+                 backoff_base: float = WEBHOOK_BACKOFF_BASE, backoff_max: float = WEBHOOK_BACKOFF_MAX):
+        self.cliente = cliente
+        self.caminho = caminho
+        self.limitador = limitador  # Taxa alvo de webhooks (modo de carga)
+        self.atraso = atraso
+        self.tentativas = tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._fila = []  # (disponivel_em, seq, tentativa, payload)
+        self._seq = itertools.count()
+        self._parado = False
+        self._em_andamento = 0
+        self._descartados = deque(maxlen=1000)
+        self._contadores = {"enfileirados": 0, "entregues": 0, "falhas": 0, "reenvios": 0, "descartados": 0}
+        self._latencia_total = 0.0
+        self._envios = 0
+        self.workers = workers
+
+    def iniciar(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._trabalhar, name=f'webhook-{i}', daemon=True).start()
+
+    def _agendar(self, quando: float, tentativa: int, payload: Dict):
+        with self._cond:
+            heapq.heappush(self._fila, (quando, next(self._seq), tentativa, payload))
+            self._cond.notify()
+
+    def enviar(self, transacao: Dict):
+        """Enfileira o webhook de uma transação processada (enviado após o atraso simulado)"""
+        with self._cond:
+            self._contadores["enfileirados"] += 1
+        self._agendar(time.monotonic() + self.atraso, 0, montar_payload(transacao))
+
+    def _proximo(self):
+        with self._cond:
+            while True:
+                if self._parado:
+                    return None
+                agora = time.monotonic()
+                if self._fila and self._fila[0][0] <= agora:
+                    self._em_andamento += 1
+                    return heapq.heappop(self._fila)
+                self._cond.wait(timeout=self._fila[0][0] - agora if self._fila else None)
+
+    def _trabalhar(self):
+        while True:
+            item = self._proximo()
+            if item is None:
+                return
+            _, _, tentativa, payload = item
+            if self.limitador:
+                self.limitador.aguardar()
+            inicio = time.monotonic()
+            erro = None
+            try:
+                response = self.cliente.post(self.caminho, json=payload)
+                if response.status_code >= 500:
+                    erro = f"status {response.status_code}"
+                elif response.status_code != 200:
+                    # Recusado pelo MS Pagamento: tentar de novo não muda a resposta
+                    self._descartar(payload, f"status {response.status_code}: {response.text}")
+                    continue
+            except requests.exceptions.RequestException as e:
+                erro = str(e)
+            finally:
+                with self._cond:
+                    self._em_andamento -= 1
+                    self._latencia_total += time.monotonic() - inicio
+                    self._envios += 1
+
+            if erro is None:
+                with self._cond:
+                    self._contadores["entregues"] += 1
+                log.debug("Webhook entregue", transacao_id=payload['transacao_id'], status=payload['status'])
+                continue
+
+            with self._cond:
+                self._contadores["falhas"] += 1
+            if tentativa + 1 >= self.tentativas:
+                self._descartar(payload, erro)
+                continue
+            espera = min(self.backoff_max, self.backoff_base * 2 ** tentativa)
+            log.aviso("Falha no webhook, nova tentativa agendada", transacao_id=payload['transacao_id'],
+                      erro=erro, espera_max=round(espera, 1))
+            with self._cond:
+                self._contadores["reenvios"] += 1
+            self._agendar(time.monotonic() + random.uniform(espera / 2, espera), tentativa + 1, payload)
+
+    def _descartar(self, payload: Dict, motivo: str):
+        log.erro("Webhook descartado", transacao_id=payload['transacao_id'], motivo=motivo)
+        with self._cond:
+            self._contadores["descartados"] += 1
+            self._descartados.append({"transacao_id": payload['transacao_id'], "motivo": motivo})
+
+    def estatisticas(self) -> Dict:
+        with self._cond:
+            return {
+                **self._contadores,
+                "na_fila": len(self._fila),
+                "em_andamento": self._em_andamento,
+                "latencia_media_ms": round(self._latencia_total / self._envios * 1000, 2) if self._envios else None,
+                "ultimos_descartados": list(self._descartados)[-20:]
+            }
+
+    def parar(self):
+        with self._cond:
+            self._parado = True
+            self._cond.notify_all()
+
+despachante = DespachanteWebhooks(
+    ClienteUpstream(MS_PAGAMENTO_URL, timeout_leitura=10, tamanho_pool=WEBHOOK_WORKERS, max_concorrencia=WEBHOOK_WORKERS),
+    WEBHOOK_CAMINHO,
+    limitador=simulacao.limite_webhooks
+)
+servico.ao_iniciar(despachante.iniciar)
+servico.ao_parar(despachante.parar)
+
+class LiquidanteAutomatico(threading.Thread):
+    """
+    Modo de carga: liquida cada transação após a latência sorteada, aprovando
+    com probabilidade `taxa_aprovacao`. As liquidações ficam num heap por
+    horário, então milhares de transações em andamento custam uma única thread.
+    """
+    def __init__(self):
+        super().__init__(name='liquidante-automatico', daemon=True)
+        self._cond = threading.Condition()
+        self._agenda = []  # (quando, seq, transacao_id)
+        self._seq = itertools.count()
+
+    def agendar(self, transacao_id: str, atraso: float):
+        with self._cond:
+            heapq.heappush(self._agenda, (time.monotonic() + atraso, next(self._seq), transacao_id))
+            self._cond.notify()
+
+    def pendentes(self) -> int:
+        return len(self._agenda)
+
+    def run(self):
+        while True:
+            with self._cond:
+                agora = time.monotonic()
+                while not self._agenda or self._agenda[0][0] > agora:
+                    self._cond.wait(timeout=self._agenda[0][0] - agora if self._agenda else None)
+                    agora = time.monotonic()
+                _, _, transacao_id = heapq.heappop(self._agenda)
+            transacao = transacoes.get(transacao_id)
+            if transacao is None:
+                continue
+            status = 'aprovado' if random.random() < simulacao.taxa_aprovacao else 'recusado'
+            if liquidar(transacao, status):
+                contar_simulacao("liquidadas_automaticamente")
+
+liquidante = LiquidanteAutomatico()
+servico.ao_iniciar(liquidante.start)
+registro.medidor('liquidacoes_agendadas', liquidante.pendentes, 'Transações aguardando a liquidação automática')
+
+def criar_app() -> Flask:
+    """Fábrica usada pelo servidor WSGI: inicia o serviço neste processo e retorna a aplicação"""
+    return servico.iniciar()
+
+@app.route('/simulacao', methods=['GET'])
+def consultar_simulacao():
+    """Configuração atual do modo de carga e seus contadores"""
+    with lock_estatisticas:
+        contadores = dict(estatisticas_simulacao)
+    return jsonify({
+        "configuracao": simulacao.para_dict(),
+        "liquidacoes_agendadas": liquidante.pendentes(),
+        **contadores
+    }), 200
+
+@app.route('/simulacao', methods=['PUT'])
+def configurar_simulacao():
+    """Altera a configuração do modo de carga (apenas os campos enviados)"""
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        return jsonify({"erro": "Envie um objeto JSON com os campos a alterar"}), 400
     try:
-        response = requests.post(
-            MS_PAGAMENTO_WEBHOOK_URL,
-            json=payload,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            print(f"[Sistema Externo] ✅ Webhook enviado com sucesso para MS Pagamento")
-            print(f"   Transação: {transacao['transacao_id']}, Status: {transacao['status']}")
-        else:
-            print(f"[Sistema Externo] ⚠️ Webhook retornou status {response.status_code}")
-            print(f"   Resposta: {response.text}")
-            
-    except requests.exceptions.RequestException as e:
-        print(f"[Sistema Externo] ❌ Erro ao enviar webhook: {e}")
+        simulacao.atualizar(dados)
+    except (ValueError, TypeError) as e:
+        return jsonify({"erro": str(e)}), 400
+    log.info("Simulação configurada", **simulacao.para_dict())
+    return jsonify(simulacao.para_dict()), 200
+
+@app.route('/webhooks/estatisticas', methods=['GET'])
+def estatisticas_webhooks():
+    """Contadores de entrega dos webhooks"""
+    return jsonify(despachante.estatisticas()), 200
 
 @app.route('/transacoes', methods=['GET'])
 def listar_transacoes():
-    """Endpoint auxiliar para listar todas as transações (para debug)"""
+    """Lista as transações; ?ids=a,b,c consulta várias de uma vez (reconciliação do MS Pagamento)"""
+    ids = request.args.get('ids')
+    if ids:
+        return jsonify({t: transacoes[t] for t in ids.split(',') if t in transacoes}), 200
     return jsonify(transacoes), 200
 
 @app.route('/transacoes/<transacao_id>', methods=['GET'])
@@ -202,8 +566,6 @@ def consultar_transacao(transacao_id):
     return jsonify(transacao), 200
 
 if __name__ == '__main__':
-    print("🚀 Sistema Externo de Pagamento iniciado na porta 5001")
-    print("📡 Endpoint: POST /pagamentos - Criar transação")
-    print("📡 Endpoint: POST /pagamentos/<transacao_id>/processar - Processar pagamento")
-    print("📡 Webhook configurado para: http://localhost:4997/webhook/pagamento")
-    app.run(debug=True, port=5001, threaded=True)
+    # Servidor de desenvolvimento; em produção: python servir.py sistema_pagamento
+    log.info("Sistema Externo de Pagamento iniciado", porta=5001, webhook=MS_PAGAMENTO_WEBHOOK_URL)
+    criar_app().run(port=5001, threaded=True)
@@ -0,0 +1,79 @@
+import threading
+from flask import current_app, json
+from flask_sse import Message, ServerSentEventsBlueprint
+from redis import StrictRedis
+from redis.exceptions import ConnectionError
+from typing import Callable, Iterable
+
+TIPO_CONTROLE = '_interesse'
+
+def canal_leilao(leilao_id: str) -> str:
+    """Canal Redis onde os eventos de um leilão são publicados uma única vez"""
+    return f'leilao:{leilao_id}'
+
+class SSETopicos(ServerSentEventsBlueprint):
+    """
+    Blueprint SSE com um canal por leilão.
+
+    Cada stream (canal do cliente) também se inscreve nos canais dos leilões que
+    o cliente segue, então um evento custa um único PUBLISH, independente do
+    número de seguidores. Mudanças de interesse chegam ao stream como mensagens
+    de controle no canal do cliente, o que funciona entre instâncias do gateway.
+    """
+    def __init__(self, *args, leiloes_do_cliente: Callable[[str], Iterable[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.leiloes_do_cliente = leiloes_do_cliente or (lambda cliente_id: ())
+        self._clientes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def redis(self):
+        """Cliente Redis reutilizado (o original cria um pool novo a cada chamada)"""
+        redis_url = current_app.config.get("SSE_REDIS_URL") or current_app.config.get("REDIS_URL")
+        if not redis_url:
+            raise KeyError("Must set a redis connection URL in app config.")
+        cliente = self._clientes.get(redis_url)
+        if cliente is None:
+            with self._lock:
+                cliente = self._clientes.setdefault(redis_url, StrictRedis.from_url(redis_url))
+        return cliente
+
+    def publicar_leilao(self, leilao_id: str, data, type=None) -> int:
+        """Publica um evento para todos os seguidores do leilão; retorna quantos streams o receberam"""
+        return self.publish(data, type=type, channel=canal_leilao(leilao_id))
+
+    def notificar_interesse(self, cliente_id: str, seguir: Iterable[str] = (), deixar: Iterable[str] = ()):
+        """Avisa o stream do cliente (em qualquer instância) para entrar/sair de canais de leilão"""
+        dados = {"seguir": list(seguir), "deixar": list(deixar)}
+        self.publish(dados, type=TIPO_CONTROLE, channel=cliente_id)
+
+    def messages(self, channel='sse'):
+        pubsub = self.redis.pubsub()
+        pubsub.subscribe(channel)
+        # Inscreve após o canal do cliente para não perder mensagens de controle
+        canais_leiloes = {canal_leilao(leilao_id) for leilao_id in self.leiloes_do_cliente(channel)}
+        if canais_leiloes:
+            pubsub.subscribe(*canais_leiloes)
+        try:
+            for pubsub_message in pubsub.listen():
+                if pubsub_message['type'] != 'message':
+                    continue
+                msg_dict = json.loads(pubsub_message['data'])
+                if msg_dict.get('type') != TIPO_CONTROLE:
+                    yield Message(**msg_dict)
+                    continue
+
+                novos = {canal_leilao(l) for l in msg_dict['data'].get('seguir', ())} - canais_leiloes
+                antigos = {canal_leilao(l) for l in msg_dict['data'].get('deixar', ())} & canais_leiloes
+                if novos:
+                    pubsub.subscribe(*novos)
+                    canais_leiloes |= novos
+                if antigos:
+                    pubsub.unsubscribe(*antigos)
+                    canais_leiloes -= antigos
+        finally:
+            try:
+                pubsub.unsubscribe()
+                pubsub.close()
+            except ConnectionError:
+                pass
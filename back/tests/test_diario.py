@@ -0,0 +1,131 @@
+"""
+Diário com fsync em grupo: ordem, rotação de segmentos sob escrita concorrente e falhas de gravação.
+
+Uso: python -m pytest tests  (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from diario import DiarioGroupCommit, escrever_atomicamente, mapear_arquivo  # noqa: E402
+
+def conteudo_segmentos(diario: DiarioGroupCommit, a_partir_de: int = 0) -> list:
+    return [bytes(conteudo) for conteudo in diario.ler_segmentos(a_partir_de)]
+
+class TestDiarioGroupCommit(unittest.TestCase):
+    def setUp(self):
+        self._diretorio = tempfile.TemporaryDirectory()
+        self.diretorio = self._diretorio.name
+        self.diario = DiarioGroupCommit(self.diretorio, sincrono=False)
+
+    def tearDown(self):
+        self.diario.fechar()
+        self._diretorio.cleanup()
+
+    def test_registros_em_ordem(self):
+        seqs = [self.diario.anexar(f'{i}\n'.encode()) for i in range(100)]
+        self.assertEqual(seqs, list(range(1, 101)))
+        self.diario.aguardar(seqs[-1])
+        self.assertEqual(conteudo_segmentos(self.diario), [b''.join(f'{i}\n'.encode() for i in range(100))])
+
+    def test_rotacao(self):
+        self.diario.registrar(b'a\n')
+        self.assertEqual(self.diario.rotacionar(), 2)
+        self.diario.registrar(b'b\n')
+        self.assertEqual([n for n, _ in self.diario.segmentos()], [1, 2])
+        self.assertEqual(conteudo_segmentos(self.diario), [b'a\n', b'b\n'])
+        self.assertEqual(conteudo_segmentos(self.diario, 2), [b'b\n'])
+
+        self.diario.remover_segmentos_anteriores(2)
+        self.assertEqual([n for n, _ in self.diario.segmentos()], [2])
+
+    def test_reabre_no_ultimo_segmento(self):
+        self.diario.registrar(b'a\n')
+        self.diario.rotacionar()
+        self.diario.registrar(b'b\n')
+        self.diario.fechar()
+        self.diario = DiarioGroupCommit(self.diretorio, sincrono=False)
+        self.diario.registrar(b'c\n')
+        self.assertEqual(conteudo_segmentos(self.diario), [b'a\n', b'b\nc\n'])
+
+    def test_rotacao_com_escritores_concorrentes(self):
+        por_escritor = 500
+        parar = threading.Event()
+        erros = []
+
+        def escrever(escritor):
+            try:
+                for i in range(por_escritor):
+                    self.diario.registrar(f'{escritor}:{i}\n'.encode())
+            except Exception as e:
+                erros.append(e)
+
+        def rotacionar():
+            while not parar.is_set():
+                self.diario.rotacionar()
+
+        escritores = [threading.Thread(target=escrever, args=(e,)) for e in range(8)]
+        rotacao = threading.Thread(target=rotacionar)
+        rotacao.start()
+        for thread in escritores:
+            thread.start()
+        for thread in escritores:
+            thread.join()
+        parar.set()
+        rotacao.join()
+
+        self.assertEqual(erros, [])
+        self.assertTrue(self.diario._gravador.is_alive())
+        self.assertGreater(len(self.diario.segmentos()), 1)
+        # Nenhum registro perdido, repetido ou cortado na troca de segmento
+        linhas = b''.join(conteudo_segmentos(self.diario)).splitlines()
+        self.assertEqual(len(linhas), 8 * por_escritor)
+        for escritor in range(8):
+            proprias = [l for l in linhas if l.startswith(f'{escritor}:'.encode())]
+            self.assertEqual(proprias, [f'{escritor}:{i}'.encode() for i in range(por_escritor)])
+
+    def test_falha_de_gravacao_chega_a_quem_espera(self):
+        class ArquivoComDefeito:
+            def write(self, dados):
+                raise ValueError("disco com defeito")
+            def close(self):
+                pass
+
+        self.diario.registrar(b'a\n')
+        with self.diario._cond:
+            arquivo, self.diario._arquivo = self.diario._arquivo, ArquivoComDefeito()
+        self.addCleanup(arquivo.close)
+
+        with self.assertRaises(IOError):
+            self.diario.registrar(b'b\n')
+        with self.assertRaises(IOError):
+            self.diario.anexar(b'c\n')
+        with self.assertRaises(IOError):
+            self.diario.rotacionar()
+
+    def test_truncar_segmento_atual(self):
+        self.diario.registrar(b'completo\n')
+        self.diario.registrar(b'incomp')
+        self.diario.truncar_segmento_atual(len(b'completo\n'))
+        self.diario.registrar(b'novo\n')
+        self.assertEqual(conteudo_segmentos(self.diario), [b'completo\nnovo\n'])
+
+class TestArquivos(unittest.TestCase):
+    def test_escrever_atomicamente_e_mapear(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'snapshot')
+            escrever_atomicamente(caminho, b'v1')
+            escrever_atomicamente(caminho, b'v2')
+            self.assertEqual(os.listdir(diretorio), ['snapshot'])
+            with mapear_arquivo(caminho) as conteudo:
+                self.assertEqual(bytes(conteudo), b'v2')
+            escrever_atomicamente(caminho, b'')
+            with mapear_arquivo(caminho) as conteudo:
+                self.assertEqual(conteudo, b'')
+
+if __name__ == '__main__':
+    unittest.main()
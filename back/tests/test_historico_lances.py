@@ -0,0 +1,105 @@
+"""
+Histórico de lances: paginação, intervalo de tempo, top-N e ordem sob concorrência.
+
+Uso: python -m pytest tests  (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from historico_lances import HistoricoLances  # noqa: E402
+
+class TestHistoricoLances(unittest.TestCase):
+    def setUp(self):
+        self.historico = HistoricoLances(limite_encerrados=2)
+        # Recusados são intercalados com os aceitos; 1 ms entre lances para as consultas por intervalo
+        for i in range(10):
+            self.historico.registrar('l1', f'u{i % 3}', float(i + 1), aceito=i % 4 != 3)
+            time.sleep(0.001)
+        self.hist = self.historico.obter('l1')
+
+    def test_pagina(self):
+        total, lances = self.historico.pagina(self.hist, 1, 4)
+        self.assertEqual(total, 10)
+        self.assertEqual([l["valor"] for l in lances], [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual([l["aceito"] for l in lances], [True, True, True, False])
+        self.assertEqual(lances[1]["usuario_id"], 'u1')
+
+        _, lances = self.historico.pagina(self.hist, 3, 4)
+        self.assertEqual([l["valor"] for l in lances], [9.0, 10.0])
+        _, lances = self.historico.pagina(self.hist, 4, 4)
+        self.assertEqual(lances, [])
+
+    def test_pagina_recentes_primeiro(self):
+        _, lances = self.historico.pagina(self.hist, 1, 4, recentes_primeiro=True)
+        self.assertEqual([l["valor"] for l in lances], [10.0, 9.0, 8.0, 7.0])
+        _, lances = self.historico.pagina(self.hist, 3, 4, recentes_primeiro=True)
+        self.assertEqual([l["valor"] for l in lances], [2.0, 1.0])
+
+    def test_timestamps_nao_decrescentes(self):
+        _, lances = self.historico.pagina(self.hist, 1, 10)
+        instantes = [l["timestamp"] for l in lances]
+        self.assertEqual(instantes, sorted(instantes))
+
+    def test_intervalo(self):
+        _, lances = self.historico.pagina(self.hist, 1, 10)
+        inicio, fim = lances[2]["timestamp"] - 0.0005, lances[6]["timestamp"] + 0.0005
+        total, encontrados = self.historico.intervalo(self.hist, inicio, fim, limite=100)
+        self.assertEqual(total, 5)
+        self.assertEqual([l["valor"] for l in encontrados], [3.0, 4.0, 5.0, 6.0, 7.0])
+
+        total, encontrados = self.historico.intervalo(self.hist, inicio, fim, limite=2)
+        self.assertEqual(total, 5)
+        self.assertEqual([l["valor"] for l in encontrados], [3.0, 4.0])
+
+        self.assertEqual(self.historico.intervalo(self.hist, 0, 1, limite=100), (0, []))
+
+    def test_top_usuarios(self):
+        # Maior lance aceito de cada usuário: u0 -> 10, u1 -> 5 (o 8 foi recusado), u2 -> 9
+        self.assertEqual(self.historico.top_usuarios(self.hist, 2),
+                         [{"usuario_id": 'u0', "valor": 10.0}, {"usuario_id": 'u2', "valor": 9.0}])
+        self.assertEqual(len(self.historico.top_usuarios(self.hist, 10)), 3)
+
+    def test_encerrados_limitados(self):
+        for leilao_id in ('l1', 'l2', 'l3'):
+            self.historico.registrar(leilao_id, 'u', 1.0, aceito=True)
+            self.historico.encerrar(leilao_id)
+        self.assertIsNone(self.historico.obter('l1'))
+        self.assertIsNotNone(self.historico.obter('l2'))
+        self.assertIsNotNone(self.historico.obter('l3'))
+
+class TestOrdemDeAceitacao(unittest.TestCase):
+    def test_lances_concorrentes_entram_na_ordem_aceita(self):
+        import ms_lance
+        self.addCleanup(setattr, ms_lance, 'historico', ms_lance.historico)
+        ms_lance.historico = HistoricoLances()
+        estado = ms_lance.EstadoLeilao('concorrente')
+        valores = iter(range(1, 4001))
+        lock_valores = threading.Lock()
+
+        def disputar(usuario_id):
+            for _ in range(500):
+                with lock_valores:
+                    valor = float(next(valores))
+                estado.tentar_lance(usuario_id, valor)
+
+        threads = [threading.Thread(target=disputar, args=(f'u{i}',)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        hist = ms_lance.historico.obter('concorrente')
+        total, lances = ms_lance.historico.pagina(hist, 1, 4000)
+        self.assertEqual(total, 4000)
+        aceitos = [l["valor"] for l in lances if l["aceito"]]
+        # Cada lance aceito é maior que todos os aceitos antes dele no histórico
+        self.assertEqual(aceitos, sorted(aceitos))
+        self.assertEqual(aceitos[-1], estado.valor)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Registro de interesses no Redis, contra o fakeredis.
+
+Uso: python -m pytest tests  (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fakeredis  # noqa: E402
+from interesses import RegistroInteresses, RegistroInteressesRedis  # noqa: E402
+
+class TestRegistroInteressesRedis(unittest.TestCase):
+    def setUp(self):
+        self.servidor = fakeredis.FakeServer()
+        self.registro = RegistroInteressesRedis(fakeredis.FakeStrictRedis(server=self.servidor))
+
+    def test_seguir(self):
+        self.assertTrue(self.registro.seguir('l1', 'c1'))
+        self.assertFalse(self.registro.seguir('l1', 'c1'))
+        self.registro.seguir('l1', 'c2')
+        self.assertEqual(set(self.registro.seguidores('l1')), {'c1', 'c2'})
+
+    def test_indice_reverso(self):
+        self.registro.seguir('l1', 'c1')
+        self.registro.seguir('l2', 'c1')
+        self.registro.seguir('l2', 'c2')
+        self.assertEqual(set(self.registro.leiloes_do_cliente('c1')), {'l1', 'l2'})
+        self.assertEqual(set(self.registro.leiloes_do_cliente('c2')), {'l2'})
+        self.assertEqual(self.registro.leiloes_do_cliente('c3'), ())
+
+    def test_deixar_de_seguir(self):
+        self.assertIsNone(self.registro.deixar_de_seguir('l1', 'c1'))
+        self.registro.seguir('l1', 'c1')
+        self.assertFalse(self.registro.deixar_de_seguir('l1', 'c2'))
+        self.assertTrue(self.registro.deixar_de_seguir('l1', 'c1'))
+        self.assertEqual(self.registro.seguidores('l1'), ())
+        self.assertEqual(self.registro.leiloes_do_cliente('c1'), ())
+
+    def test_remover_cliente(self):
+        self.registro.seguir('l1', 'c1')
+        self.registro.seguir('l2', 'c1')
+        self.registro.seguir('l2', 'c2')
+        self.assertEqual(self.registro.remover_cliente('c1'), {'l1', 'l2'})
+        self.assertEqual(self.registro.leiloes_do_cliente('c1'), ())
+        self.assertEqual(self.registro.seguidores('l1'), ())
+        self.assertEqual(self.registro.seguidores('l2'), ('c2',))
+        self.assertEqual(self.registro.remover_cliente('c1'), set())
+
+    def test_compartilhado_entre_instancias(self):
+        # Dois gateways sobre o mesmo Redis enxergam os mesmos interesses
+        outro = RegistroInteressesRedis(fakeredis.FakeStrictRedis(server=self.servidor))
+        self.registro.seguir('l1', 'c1')
+        self.assertEqual(outro.leiloes_do_cliente('c1'), ('l1',))
+        self.assertTrue(outro.deixar_de_seguir('l1', 'c1'))
+        self.assertEqual(self.registro.seguidores('l1'), ())
+
+    def test_mesmo_comportamento_do_registro_em_memoria(self):
+        memoria = RegistroInteresses()
+        operacoes = [('seguir', 'l1', 'c1'), ('seguir', 'l1', 'c1'), ('seguir', 'l2', 'c1'),
+                     ('deixar_de_seguir', 'l3', 'c1'), ('deixar_de_seguir', 'l2', 'c2'),
+                     ('deixar_de_seguir', 'l2', 'c1')]
+        for nome, leilao_id, cliente_id in operacoes:
+            self.assertEqual(getattr(self.registro, nome)(leilao_id, cliente_id),
+                             getattr(memoria, nome)(leilao_id, cliente_id), (nome, leilao_id, cliente_id))
+        self.assertEqual(self.registro.remover_cliente('c1'), memoria.remover_cliente('c1'))
+
+if __name__ == '__main__':
+    unittest.main()
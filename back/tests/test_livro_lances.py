@@ -0,0 +1,115 @@
+"""
+Livro de lances: recuperação a partir do snapshot e da cauda do diário.
+
+Uso: python -m pytest tests  (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from livro_lances import LANCE, LivroLances, codificar  # noqa: E402
+
+class TestLivroLances(unittest.TestCase):
+    def setUp(self):
+        self._diretorio = tempfile.TemporaryDirectory()
+        self.diretorio = self._diretorio.name
+        self.livro = LivroLances(self.diretorio, sincrono=False)
+        self.estados = {}  # leilao_id -> (usuario_id, valor), como leiloes_ativos no MS Lance
+
+    def tearDown(self):
+        self.livro.diario.fechar()
+        self._diretorio.cleanup()
+
+    def iniciar(self, leilao_id):
+        self.estados[leilao_id] = (None, 0.0)
+        self.livro.aguardar(self.livro.registrar_iniciado(leilao_id))
+
+    def lance(self, leilao_id, usuario_id, valor):
+        self.estados[leilao_id] = (usuario_id, valor)
+        self.livro.aguardar(self.livro.registrar_lance(leilao_id, usuario_id, valor))
+
+    def registros(self):
+        return [(leilao_id, usuario_id, valor) for leilao_id, (usuario_id, valor) in self.estados.items()]
+
+    def recuperar(self):
+        self.livro.diario.fechar()
+        self.livro = LivroLances(self.diretorio, sincrono=False)
+        return self.livro.recuperar()
+
+    def ultimo_segmento(self) -> str:
+        return self.livro.diario.segmentos()[-1][1]
+
+    def test_recupera_do_diario(self):
+        self.iniciar('l1')
+        self.iniciar('l2')
+        self.lance('l1', 'u1', 10.0)
+        self.lance('l1', 'u2', 15.0)
+        self.lance('l2', 'u1', 7.0)
+        self.livro.aguardar(self.livro.registrar_finalizado('l2'))
+
+        self.assertEqual(self.recuperar(), {'l1': ('u2', 15.0)})
+
+    def test_cauda_incompleta_descartada(self):
+        self.iniciar('l1')
+        self.lance('l1', 'u1', 10.0)
+        self.livro.diario.fechar()
+        tamanho_valido = os.path.getsize(self.ultimo_segmento())
+        # Queda no meio da escrita de um lance
+        with open(self.ultimo_segmento(), 'ab') as f:
+            f.write(codificar(LANCE, 'l1', 'u2', 99.0)[:-3])
+
+        self.livro = LivroLances(self.diretorio, sincrono=False)
+        self.assertEqual(self.livro.recuperar(), {'l1': ('u1', 10.0)})
+        self.assertEqual(os.path.getsize(self.ultimo_segmento()), tamanho_valido)
+
+        # Registros novos vão logo após o último registro completo
+        self.lance('l1', 'u3', 20.0)
+        self.assertEqual(self.recuperar(), {'l1': ('u3', 20.0)})
+
+    def test_registro_corrompido_descartado(self):
+        self.iniciar('l1')
+        self.lance('l1', 'u1', 10.0)
+        self.lance('l1', 'u2', 20.0)
+        self.livro.diario.fechar()
+        with open(self.ultimo_segmento(), 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            ultimo_byte = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([ultimo_byte[0] ^ 0xFF]))
+
+        self.livro = LivroLances(self.diretorio, sincrono=False)
+        self.assertEqual(self.livro.recuperar(), {'l1': ('u1', 10.0)})
+
+    def test_leilao_iniciado_durante_a_compactacao(self):
+        self.iniciar('l1')
+        self.lance('l1', 'u1', 10.0)
+
+        # Um leilão inicia entre o início da compactação e a rotação do diário
+        rotacionar = self.livro.diario.rotacionar
+        def rotacionar_com_inicio_concorrente():
+            self.iniciar('l2')
+            return rotacionar()
+        self.livro.diario.rotacionar = rotacionar_com_inicio_concorrente
+
+        self.assertEqual(self.livro.compactar(self.registros), 2)
+        self.lance('l2', 'u2', 5.0)
+
+        self.assertEqual(self.recuperar(), {'l1': ('u1', 10.0), 'l2': ('u2', 5.0)})
+
+    def test_lance_depois_do_snapshot(self):
+        self.iniciar('l1')
+        self.lance('l1', 'u1', 10.0)
+        self.livro.compactar(self.registros)
+        self.lance('l1', 'u2', 20.0)
+        self.estados.pop('l1')
+        self.livro.aguardar(self.livro.registrar_finalizado('l1'))
+        self.iniciar('l3')
+
+        self.assertEqual(self.recuperar(), {'l3': (None, 0.0)})
+        self.assertEqual([n for n, _ in self.livro.diario.segmentos()], [2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Persistência dos leilões: snapshot + cauda do diário, registros incompletos e
+transições gravadas só depois da confirmação do evento.
+
+Uso: python -m pytest tests  (ou python -m unittest discover tests)
+"""
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import utils  # noqa: E402
+import ms_leilao  # noqa: E402
+from ms_leilao import CicloVidaLeilao, Leilao, PersistenciaLeiloes, RepositorioLeiloes  # noqa: E402
+
+def novo_leilao(leilao_id: str, inicio_em: float = -60, fim_em: float = 3600) -> Leilao:
+    agora = datetime.datetime.now()
+    return Leilao(leilao_id, f'Leilão {leilao_id}', 10, 'criador',
+                  agora + datetime.timedelta(seconds=inicio_em), agora + datetime.timedelta(seconds=fim_em))
+
+class PublicadorFalso:
+    """Publicador que confirma (ou recusa) cada evento imediatamente"""
+    def __init__(self, erro: Exception = None):
+        self.erro = erro
+        self.publicados = []
+
+    def publicar(self, routing_key, evento, exchange='', message_id=None) -> Future:
+        futuro = Future()
+        if self.erro is not None:
+            futuro.set_exception(self.erro)
+        else:
+            self.publicados.append(message_id)
+            futuro.set_result(message_id)
+        return futuro
+
+class BaseLeiloes(unittest.TestCase):
+    """Repositório com persistência num diretório temporário"""
+    def setUp(self):
+        self._diretorio = tempfile.TemporaryDirectory()
+        self.diretorio = self._diretorio.name
+        self.repositorio = self.abrir()
+
+    def tearDown(self):
+        self.repositorio.persistencia.diario.fechar()
+        self._diretorio.cleanup()
+
+    def abrir(self) -> RepositorioLeiloes:
+        return RepositorioLeiloes(persistencia=PersistenciaLeiloes(self.diretorio, sincrono=False))
+
+    def reabrir(self) -> dict:
+        """Simula um reinício: reabre o diretório e retorna {id: status} de todos os leilões recuperados"""
+        self.repositorio.persistencia.diario.fechar()
+        self.repositorio = self.abrir()
+        self.repositorio.recuperar()
+        return {leilao.id: leilao.status
+                for status in ms_leilao.STATUS_LEILAO for leilao in self.repositorio.listar(status)}
+
+    def ultimo_segmento(self) -> str:
+        return self.repositorio.persistencia.diario.segmentos()[-1][1]
+
+class TestPersistenciaLeiloes(BaseLeiloes):
+    def test_recupera_do_diario(self):
+        for leilao_id in ('a', 'b', 'c'):
+            self.repositorio.adicionar(novo_leilao(leilao_id))
+        self.repositorio.transicionar('a', 'agendado', 'ativo')
+        self.repositorio.transicionar('b', 'agendado', 'ativo')
+        self.repositorio.transicionar('b', 'ativo', 'finalizado')
+
+        self.assertEqual(self.reabrir(), {'a': 'ativo', 'b': 'finalizado', 'c': 'agendado'})
+        self.assertEqual(self.repositorio.obter('c').desc, 'Leilão c')
+
+    def test_snapshot_mais_cauda(self):
+        for leilao_id in ('a', 'b'):
+            self.repositorio.adicionar(novo_leilao(leilao_id))
+        self.repositorio.transicionar('a', 'agendado', 'ativo')
+        self.repositorio.compactar()
+        self.repositorio.adicionar(novo_leilao('c'))
+        self.repositorio.transicionar('a', 'ativo', 'finalizado')
+
+        self.assertEqual([n for n, _ in self.repositorio.persistencia.diario.segmentos()], [2])
+        self.assertEqual(self.reabrir(), {'a': 'finalizado', 'b': 'agendado', 'c': 'agendado'})
+
+        # Um segundo snapshot sobre o estado recuperado também é consistente
+        self.repositorio.compactar()
+        self.assertEqual(self.reabrir(), {'a': 'finalizado', 'b': 'agendado', 'c': 'agendado'})
+
+    def test_cauda_incompleta_descartada(self):
+        self.repositorio.adicionar(novo_leilao('a'))
+        self.repositorio.persistencia.diario.fechar()
+        tamanho_valido = os.path.getsize(self.ultimo_segmento())
+        with open(self.ultimo_segmento(), 'ab') as f:
+            f.write(b'{"op":"status","id":"a","sta')
+
+        self.repositorio = self.abrir()
+        self.assertEqual([l.id for l in self.repositorio.recuperar()], ['a'])
+        self.assertEqual(os.path.getsize(self.ultimo_segmento()), tamanho_valido)
+
+        self.repositorio.transicionar('a', 'agendado', 'ativo')
+        self.assertEqual(self.reabrir(), {'a': 'ativo'})
+
+class TestTransicaoConfirmada(BaseLeiloes):
+    def setUp(self):
+        super().setUp()
+        self.monitor = CicloVidaLeilao()
+        patcher = mock.patch.object(ms_leilao, 'leiloes', self.repositorio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def executar(self, publicador: PublicadorFalso, leilao_id: str, acao: str):
+        with mock.patch.object(utils, 'get_publicador', return_value=publicador):
+            self.monitor.executar_transicao(leilao_id, acao)
+
+    def test_publicacao_recusada_nao_grava_a_transicao(self):
+        self.repositorio.adicionar(novo_leilao('a'))
+        self.executar(PublicadorFalso(utils.PublicacaoRecusada("nack")), 'a', 'iniciar')
+
+        self.assertEqual(self.repositorio.obter('a').status, 'agendado')
+        self.assertEqual(len(self.monitor.agendador), 1)  # Nova tentativa agendada
+        # Reiniciar agora leva o leilão a ser iniciado (e o evento publicado) de novo
+        self.assertEqual(self.reabrir(), {'a': 'agendado'})
+
+    def test_publicacao_confirmada_grava_a_transicao(self):
+        self.repositorio.adicionar(novo_leilao('a'))
+        publicador = PublicadorFalso()
+        self.executar(publicador, 'a', 'iniciar')
+        self.assertEqual(publicador.publicados, ['leilao_iniciado:a'])
+        self.assertEqual(self.repositorio.obter('a').status, 'ativo')
+
+        self.executar(publicador, 'a', 'finalizar')
+        self.assertEqual(publicador.publicados, ['leilao_iniciado:a', 'leilao_finalizado:a'])
+        self.assertEqual(self.reabrir(), {'a': 'finalizado'})
+
+    def test_transicao_ignorada_se_o_status_mudou(self):
+        self.repositorio.adicionar(novo_leilao('a'))
+        publicador = PublicadorFalso()
+        self.executar(publicador, 'a', 'finalizar')
+        self.assertEqual(publicador.publicados, [])
+        self.assertEqual(self.repositorio.obter('a').status, 'agendado')
+
+if __name__ == '__main__':
+    unittest.main()
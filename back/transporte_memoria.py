@@ -0,0 +1,362 @@
+"""
+Transporte de mensagens em processo (TRANSPORTE_BACKEND=memoria).
+
+Implementa a mesma interface de conexão/canal do pika usada pelos serviços
+(ver utils.TransporteRabbitMQ): filas nomeadas e exclusivas, exchanges
+fanout, prefetch, consume() com inactivity_timeout, basic_consume/
+start_consuming, acks (inclusive multiple=True), nacks com requeue e
+add_callback_threadsafe. As mensagens passam por referência entre as filas,
+sem serialização extra nem rede: serve quando todos os serviços rodam no
+mesmo processo (implantação num único host, testes e benchmarks).
+
+Com `medir=True`, cada mensagem guarda o instante da publicação e o broker
+mede, por salto (exchange ou fila de destino), a latência até a entrega e
+até o ack.
+"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pika
+from metricas import registro
+
+# As mesmas métricas do produtor do RabbitMQ (utils): o registro devolve a mesma instância
+latencia_publicacao = registro.histograma('publicacao_segundos', 'Da chamada de publicar até a confirmação do broker')
+publicacoes_confirmadas = registro.contador('publicacoes_total', 'Mensagens publicadas', resultado='confirmada')
+
+class Mensagem:
+    __slots__ = ('salto', 'exchange', 'routing_key', 'body', 'properties', 'publicada_em', 'reentregue')
+
+    def __init__(self, salto, exchange, routing_key, body, properties, publicada_em):
+        self.salto = salto
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.publicada_em = publicada_em
+        self.reentregue = False
+
+class FilaMemoria:
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.mensagens = deque()
+        self.canais = set()  # Canais consumindo esta fila (acordados a cada publicação)
+
+    def acordar(self):
+        for canal in list(self.canais):
+            canal.evento.set()
+
+class EstatisticasSalto:
+    __slots__ = ('publicadas', 'entregas', 'acks')
+
+    def __init__(self):
+        self.publicadas = 0
+        self.entregas: List[float] = []  # Publicação -> entrega ao consumidor (s)
+        self.acks: List[float] = []  # Publicação -> ack (s)
+
+class BrokerMemoria:
+    def __init__(self, medir: bool = False):
+        self.medir = medir
+        self._lock = threading.Lock()
+        self.filas: Dict[str, FilaMemoria] = {}
+        self.vinculos: Dict[str, set] = {}  # exchange -> nomes das filas
+        self.estatisticas: Dict[str, EstatisticasSalto] = {}
+        self._nomes = itertools.count(1)
+        self._lock_contagem = threading.Lock()
+        self.nao_confirmadas = 0
+
+    def contar_entregas(self, delta: int):
+        with self._lock_contagem:
+            self.nao_confirmadas += delta
+
+    def declarar_fila(self, nome: str) -> FilaMemoria:
+        with self._lock:
+            if not nome:
+                nome = f'amq.gen-{next(self._nomes)}'
+            return self.filas.setdefault(nome, FilaMemoria(nome))
+
+    def remover_fila(self, nome: str):
+        with self._lock:
+            self.filas.pop(nome, None)
+            for filas in self.vinculos.values():
+                filas.discard(nome)
+
+    def declarar_exchange(self, nome: str):
+        with self._lock:
+            self.vinculos.setdefault(nome, set())
+
+    def vincular(self, exchange: str, fila: str):
+        with self._lock:
+            self.vinculos.setdefault(exchange, set()).add(fila)
+
+    def _estatisticas(self, salto: str) -> EstatisticasSalto:
+        estatisticas = self.estatisticas.get(salto)
+        if estatisticas is None:
+            with self._lock:
+                estatisticas = self.estatisticas.setdefault(salto, EstatisticasSalto())
+        return estatisticas
+
+    def publicar(self, exchange: str, routing_key: str, body, properties=None):
+        with self._lock:  # vincular/remover_fila alteram os conjuntos de vínculos
+            if exchange:
+                destinos = [self.filas.get(nome) for nome in self.vinculos.get(exchange, ())]
+            else:
+                destinos = [self.filas.get(routing_key)]
+        salto = exchange or routing_key
+        agora = time.perf_counter() if self.medir else 0.0
+        for fila in destinos:
+            if fila is None:
+                continue  # Sem fila vinculada: descartada, como no RabbitMQ
+            if self.medir:
+                estatisticas = self._estatisticas(salto)
+                with self._lock_contagem:
+                    estatisticas.publicadas += 1
+            fila.mensagens.append(Mensagem(salto, exchange, routing_key, body, properties, agora))
+            fila.acordar()
+
+    def pendentes(self) -> int:
+        """Mensagens nas filas ou entregues e ainda sem ack"""
+        return sum(len(f.mensagens) for f in list(self.filas.values())) + self.nao_confirmadas
+
+    def aguardar_ociosidade(self, timeout: float = 60.0, intervalo: float = 0.05) -> bool:
+        """Espera todas as filas esvaziarem e todas as entregas serem confirmadas"""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if self.pendentes() == 0:
+                return True
+            time.sleep(intervalo)
+        return False
+
+    def reiniciar_estatisticas(self):
+        with self._lock:
+            self.estatisticas = {}
+
+class CanalMemoria:
+    def __init__(self, conexao: "ConexaoMemoria"):
+        self.conexao = conexao
+        self.broker = conexao.broker
+        self.evento = threading.Event()
+        self.prefetch = 0
+        self.is_open = True
+        self._tags = itertools.count(1)
+        self._pendentes: Dict[int, tuple] = {}  # delivery_tag -> (fila, mensagem)
+        self._consumos = []  # (fila, callback) de basic_consume
+        self._consumindo = False
+
+    # --- Topologia ---
+
+    def queue_declare(self, queue: str = '', exclusive: bool = False, **kwargs):
+        fila = self.broker.declarar_fila(queue)
+        if exclusive:
+            self.conexao.exclusivas.append(fila.nome)
+        return SimpleNamespace(method=SimpleNamespace(queue=fila.nome))
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', **kwargs):
+        self.broker.declarar_exchange(exchange)
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = None, **kwargs):
+        self.broker.vincular(exchange, queue)
+
+    def basic_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch = prefetch_count
+
+    def confirm_delivery(self, *args, **kwargs):
+        pass
+
+    # --- Publicação e consumo ---
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None, mandatory: bool = False):
+        self.broker.publicar(exchange, routing_key, body, properties)
+
+    def _tentar_receber(self, fila: FilaMemoria):
+        if self.prefetch and len(self._pendentes) >= self.prefetch:
+            return None
+        try:
+            mensagem = fila.mensagens.popleft()
+        except IndexError:
+            return None
+        tag = next(self._tags)
+        self._pendentes[tag] = (fila, mensagem)
+        self.broker.contar_entregas(1)
+        if self.broker.medir:
+            self.broker._estatisticas(mensagem.salto).entregas.append(time.perf_counter() - mensagem.publicada_em)
+        method = SimpleNamespace(delivery_tag=tag, exchange=mensagem.exchange,
+                                 routing_key=mensagem.routing_key, redelivered=mensagem.reentregue)
+        return method, mensagem.properties or pika.BasicProperties(), mensagem.body
+
+    def consume(self, queue: str, inactivity_timeout: float = None, **kwargs):
+        fila = self.broker.filas[queue]
+        fila.canais.add(self)
+        try:
+            while self.is_open:
+                self.conexao.executar_callbacks()
+                self.evento.clear()
+                recebida = self._tentar_receber(fila)
+                if recebida:
+                    yield recebida
+                elif not self.evento.wait(inactivity_timeout):
+                    yield None, None, None
+        finally:
+            fila.canais.discard(self)
+
+    def basic_consume(self, queue: str, on_message_callback, **kwargs):
+        fila = self.broker.filas[queue]
+        fila.canais.add(self)
+        self._consumos.append((fila, on_message_callback))
+
+    def start_consuming(self):
+        self._consumindo = True
+        while self.is_open and self._consumindo:
+            self.conexao.executar_callbacks()
+            self.evento.clear()
+            recebeu = False
+            for fila, callback in self._consumos:
+                recebida = self._tentar_receber(fila)
+                if recebida:
+                    recebeu = True
+                    callback(self, *recebida)
+            if not recebeu:
+                self.evento.wait(0.05)
+
+    def stop_consuming(self):
+        self._consumindo = False
+
+    def _concluir(self, delivery_tag: int, multiple: bool) -> list:
+        if multiple:
+            tags = [t for t in self._pendentes if t <= delivery_tag]
+        else:
+            tags = [delivery_tag] if delivery_tag in self._pendentes else []
+        concluidas = [self._pendentes.pop(t) for t in tags]
+        self.broker.contar_entregas(-len(concluidas))
+        return concluidas
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        concluidas = self._concluir(delivery_tag, multiple)
+        if self.broker.medir:
+            agora = time.perf_counter()
+            for _, mensagem in concluidas:
+                self.broker._estatisticas(mensagem.salto).acks.append(agora - mensagem.publicada_em)
+        self.evento.set()
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        for fila, mensagem in self._concluir(delivery_tag, multiple):
+            if requeue:
+                mensagem.reentregue = True
+                fila.mensagens.appendleft(mensagem)
+                fila.acordar()
+        self.evento.set()
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        # Entregas sem ack voltam para a fila, como no RabbitMQ
+        for tag in sorted(self._pendentes, reverse=True):
+            fila, mensagem = self._pendentes.pop(tag)
+            self.broker.contar_entregas(-1)
+            mensagem.reentregue = True
+            fila.mensagens.appendleft(mensagem)
+            fila.acordar()
+        for fila, _ in self._consumos:
+            fila.canais.discard(self)
+        self.evento.set()
+
+class ConexaoMemoria:
+    """Equivalente a pika.BlockingConnection sobre o BrokerMemoria"""
+    def __init__(self, broker: BrokerMemoria):
+        self.broker = broker
+        self.is_open = True
+        self.exclusivas: List[str] = []
+        self._canais: List[CanalMemoria] = []
+        self._callbacks = deque()
+
+    def channel(self) -> CanalMemoria:
+        canal = CanalMemoria(self)
+        self._canais.append(canal)
+        return canal
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError("Conexão fechada")
+        self._callbacks.append(callback)
+        for canal in self._canais:
+            canal.evento.set()
+
+    def executar_callbacks(self):
+        while self._callbacks:
+            self._callbacks.popleft()()
+
+    def process_data_events(self, time_limit: float = 0):
+        self.executar_callbacks()
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for canal in self._canais:
+            canal.close()
+        for nome in self.exclusivas:
+            self.broker.remover_fila(nome)
+
+class PublicadorMemoria:
+    """Equivalente a utils.ProdutorConfirmado: publica direto no broker e resolve o Future na hora"""
+    def __init__(self, broker: BrokerMemoria):
+        self.broker = broker
+
+    def iniciar(self):
+        pass
+
+    def publicar(self, routing_key: str, evento, exchange: str = '', message_id: str = None) -> Future:
+        return self.publicar_lote([(routing_key, evento)], exchange=exchange, message_ids=[message_id])[0]
+
+    def publicar_lote(self, mensagens, exchange: str = '', message_ids=None) -> List[Future]:
+        futuros = []
+        for (routing_key, evento), message_id in zip(mensagens, message_ids or [None] * len(mensagens)):
+            inicio = time.perf_counter()
+            message_id = message_id or uuid.uuid4().hex
+            body = evento if isinstance(evento, (str, bytes)) else json.dumps(evento)
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.broker.publicar(exchange, routing_key, body,
+                                 pika.BasicProperties(delivery_mode=2, message_id=message_id,
+                                                      headers={'publicado_em': time.time()}))
+            futuro = Future()
+            futuro.set_result(message_id)
+            futuros.append(futuro)
+            latencia_publicacao.observar(time.perf_counter() - inicio)
+            publicacoes_confirmadas.inc()
+        return futuros
+
+    def pendentes(self) -> int:
+        return 0
+
+    def esvaziar(self, timeout: float = None) -> bool:
+        return True
+
+    def fechar(self, timeout: float = 5.0):
+        pass
+
+class TransporteMemoria:
+    """
+    Backend em memória: todas as conexões do processo compartilham um broker.
+    `declarar(channel)` cria a topologia antes da primeira publicação, como o
+    produtor do RabbitMQ faz ao abrir o canal.
+    """
+    def __init__(self, declarar=None, medir: bool = False):
+        self.broker = BrokerMemoria(medir=medir)
+        if declarar:
+            conexao = self.conectar()
+            declarar(conexao.channel())
+            conexao.close()
+
+    def conectar(self) -> ConexaoMemoria:
+        return ConexaoMemoria(self.broker)
+
+    def criar_produtor(self) -> PublicadorMemoria:
+        return PublicadorMemoria(self.broker)
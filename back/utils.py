@@ -4,17 +4,38 @@ import json
 #from cryptography.hazmat.primitives import hashes, serialization
 #from cryptography.exceptions import InvalidSignature
 import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from deduplicacao import CacheDeduplicacao
+from metricas import registro
+from logs import Log
+from transporte_memoria import TransporteMemoria
 
 HOST = 'localhost'
 
-def get_rabbitmq_connection():
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=HOST))
-    return connection
+log = Log('rabbitmq')
+
+# Tempo máximo que um consumidor espera a confirmação de um evento antes de dar ack no que o originou
+TEMPO_CONFIRMACAO = float(os.environ.get('RABBITMQ_TEMPO_CONFIRMACAO', 30))
+
+def get_conexao():
+    """Abre uma conexão no transporte configurado (mesma interface do pika.BlockingConnection)"""
+    return get_transporte().conectar()
 
 def setup_queues(channel):
     """Configura todas as filas necessárias para o sistema de leilões"""
     channel.queue_declare(queue='leilao_iniciado', durable=True)
     channel.queue_declare(queue='leilao_finalizado', durable=True)
+    # Eventos de ciclo de vida também são difundidos (ex.: cache de leilões ativos do gateway)
+    channel.exchange_declare(exchange='leilao_iniciado', exchange_type='fanout')
+    channel.queue_bind(exchange='leilao_iniciado', queue='leilao_iniciado')
+    channel.exchange_declare(exchange='leilao_finalizado', exchange_type='fanout')
+    channel.queue_bind(exchange='leilao_finalizado', queue='leilao_finalizado')
     channel.queue_declare(queue='lance_validado', durable=True)
     channel.queue_declare(queue='lance_invalidado', durable=True)
     #channel.queue_declare(queue='leilao_vencedor', durable=True)
@@ -22,12 +43,509 @@ def setup_queues(channel):
     channel.queue_declare(queue='link_pagamento', durable=True)
     channel.queue_declare(queue='status_pagamento', durable=True)
 
-def get_rabbitmq_channel():
-    """Retorna um canal RabbitMQ para uso direto"""
-    connection = get_rabbitmq_connection()
-    channel = connection.channel()
-    setup_queues(channel)
-    return channel
+class FilaPublicacaoCheia(pika.exceptions.AMQPError):
+    """Muitas mensagens aguardando confirmação do broker (broker lento ou fora do ar)"""
+
+class PublicacaoRecusada(pika.exceptions.AMQPError):
+    """O broker recusou (nack) a mensagem em todas as tentativas"""
+
+class _Envio:
+    __slots__ = ('exchange', 'routing_key', 'body', 'message_id', 'tentativas', 'futuro', 'publicado_em', 'inicio')
+
+    def __init__(self, exchange: str, routing_key: str, body, message_id: str):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.message_id = message_id
+        self.tentativas = 0
+        self.futuro = Future()
+        self.publicado_em = time.time()  # Vai no cabeçalho: os consumidores medem o atraso da fila
+        self.inicio = time.perf_counter()
+
+# Métricas de publicação (qualquer transporte) e de consumo
+latencia_publicacao = registro.histograma('publicacao_segundos', 'Da chamada de publicar até a confirmação do broker')
+publicacoes_confirmadas = registro.contador('publicacoes_total', 'Mensagens publicadas', resultado='confirmada')
+publicacoes_recusadas = registro.contador('publicacoes_total', 'Mensagens publicadas', resultado='recusada')
+
+def cabecalhos_publicacao(publicado_em: float) -> Dict:
+    return {'publicado_em': publicado_em}
+
+def observar_atraso(histograma, properties):
+    """Registra quanto tempo a mensagem esperou entre a publicação e o consumo"""
+    publicado_em = (properties.headers or {}).get('publicado_em') if properties else None
+    if publicado_em is not None:
+        histograma.observar(max(0.0, time.time() - publicado_em))
+
+def histograma_atraso(fila: str):
+    return registro.histograma('consumidor_atraso_segundos', 'Tempo entre a publicação e o consumo da mensagem', fila=fila)
+
+class ProdutorConfirmado:
+    """
+    Produtor compartilhado com publisher confirms.
+
+    Uma única conexão assíncrona (SelectConnection) roda numa thread de I/O
+    própria. Quem publica apenas enfileira a mensagem e recebe um Future, que é
+    resolvido quando o broker confirma (ack) a mensagem; assim a latência de
+    quem publica não inclui a ida e volta ao broker. Até `janela` mensagens
+    ficam em voo sem confirmação, e confirmações com multiple=True resolvem
+    várias de uma vez.
+
+    Cada mensagem leva um message_id. Mensagens recusadas (nack) ou em voo
+    quando a conexão cai são reenviadas com o mesmo message_id, e publicar de
+    novo um message_id ainda não confirmado não gera uma segunda mensagem.
+    """
+    def __init__(self, janela: int = 1000, max_pendentes: int = 100000, tentativas: int = 5,
+                 espera_fila: float = 5.0, espera_reconexao: float = 2.0):
+        self.janela = janela
+        self.tentativas = tentativas
+        self.espera_fila = espera_fila
+        self.espera_reconexao = espera_reconexao
+        self._vagas = threading.BoundedSemaphore(max_pendentes)
+        self._cond = threading.Condition()
+        self._fila = deque()  # Mensagens ainda não enviadas
+        self._por_id: Dict[str, _Envio] = {}  # Todas as mensagens não confirmadas, por message_id
+        self._em_voo: "OrderedDict[int, _Envio]" = OrderedDict()  # delivery_tag -> mensagem (só a thread de I/O)
+        self._proxima_tag = 1
+        self._connection = None
+        self._channel = None
+        self._canal_pronto = False
+        self._drenagem_agendada = False
+        self.running = True
+        self._thread = threading.Thread(target=self._executar, name='produtor-confirmado', daemon=True)
+
+    def iniciar(self):
+        registro.medidor('publicacoes_pendentes', self.pendentes, 'Mensagens aguardando confirmação do broker')
+        self._thread.start()
+
+    # --- API usada pelas threads da aplicação ---
+
+    def _novo_envio(self, routing_key: str, evento, exchange: str, message_id: Optional[str]) -> _Envio:
+        body = evento if isinstance(evento, (str, bytes)) else json.dumps(evento)
+        return _Envio(exchange, routing_key, body, message_id or uuid.uuid4().hex)
+
+    def publicar(self, routing_key: str, evento, exchange: str = '', message_id: str = None) -> Future:
+        """Enfileira um evento (dict ou str) persistente; o Future é resolvido com o message_id na confirmação"""
+        return self.publicar_lote([(routing_key, evento)], exchange=exchange,
+                                  message_ids=[message_id])[0]
+
+    def publicar_lote(self, mensagens, exchange: str = '', message_ids=None) -> List[Future]:
+        """Enfileira vários eventos [(routing_key, evento), ...] de uma vez, mantendo a ordem"""
+        envios = [self._novo_envio(routing_key, evento, exchange, message_id)
+                  for (routing_key, evento), message_id in zip(mensagens, message_ids or [None] * len(mensagens))]
+        # Contrapressão (fora do lock, que a thread de I/O usa para liberar vagas):
+        # não acumula mensagens sem limite se o broker não confirma
+        reservadas = 0
+        for _ in envios:
+            if not self._vagas.acquire(timeout=self.espera_fila):
+                for _ in range(reservadas):
+                    self._vagas.release()
+                raise FilaPublicacaoCheia("Fila de publicação cheia aguardando confirmações do broker")
+            reservadas += 1
+
+        futuros = []
+        with self._cond:
+            for envio in envios:
+                existente = self._por_id.get(envio.message_id)
+                if existente is not None:
+                    self._vagas.release()
+                    futuros.append(existente.futuro)
+                    continue
+                self._por_id[envio.message_id] = envio
+                self._fila.append(envio)
+                futuros.append(envio.futuro)
+            agendar = self._canal_pronto and not self._drenagem_agendada and bool(self._fila)
+            if agendar:
+                self._drenagem_agendada = True
+                connection = self._connection
+        if agendar:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drenar)
+            except Exception:
+                # Conexão caindo: a fila é drenada quando o canal reabrir
+                with self._cond:
+                    self._drenagem_agendada = False
+        return futuros
+
+    def pendentes(self) -> int:
+        """Mensagens ainda não confirmadas pelo broker"""
+        return len(self._por_id)
+
+    def esvaziar(self, timeout: float = None) -> bool:
+        """Espera todas as mensagens pendentes serem confirmadas (ou falharem)"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._por_id, timeout)
+
+    def fechar(self, timeout: float = 5.0):
+        """Espera as confirmações pendentes (até `timeout`) e encerra a conexão"""
+        self.esvaziar(timeout)
+        self.running = False
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(connection.close)
+            except Exception:
+                pass
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    # --- Thread de I/O ---
+
+    def _executar(self):
+        while self.running:
+            try:
+                self._connection = pika.SelectConnection(
+                    pika.ConnectionParameters(host=HOST),
+                    on_open_callback=self._ao_abrir_conexao,
+                    on_open_error_callback=self._ao_falhar_conexao,
+                    on_close_callback=self._ao_fechar_conexao
+                )
+                self._connection.ioloop.start()
+            except Exception:
+                log.erro("Erro no produtor", excecao=True)
+            with self._cond:
+                self._canal_pronto = False
+                self._drenagem_agendada = False
+                # Sem confirmação não dá para saber se chegaram: reenvia com o mesmo message_id
+                self._fila.extendleft(reversed(self._em_voo.values()))
+            self._em_voo.clear()
+            if self.running:
+                time.sleep(self.espera_reconexao)
+
+    def _ao_abrir_conexao(self, connection):
+        connection.channel(on_open_callback=self._ao_abrir_canal)
+
+    def _ao_falhar_conexao(self, connection, erro):
+        log.aviso("Produtor não conseguiu conectar, tentando novamente", erro=repr(erro))
+        connection.ioloop.stop()
+
+    def _ao_fechar_conexao(self, connection, motivo):
+        if self.running:
+            log.aviso("Conexão do produtor fechada, reconectando", motivo=str(motivo))
+        connection.ioloop.stop()
+
+    def _ao_fechar_canal(self, channel, motivo):
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _ao_abrir_canal(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._ao_fechar_canal)
+        setup_queues(channel)
+        # O callback de confirm_delivery só chega depois das declarações acima
+        channel.confirm_delivery(ack_nack_callback=self._ao_confirmar, callback=self._ao_ativar_confirmacoes)
+
+    def _ao_ativar_confirmacoes(self, frame):
+        self._proxima_tag = 1
+        with self._cond:
+            self._canal_pronto = True
+        self._drenar()
+
+    def _drenar(self):
+        """Envia mensagens da fila enquanto houver espaço na janela de mensagens em voo"""
+        with self._cond:
+            self._drenagem_agendada = False
+            if not self._canal_pronto:
+                return
+            lote = []
+            while self._fila and len(self._em_voo) + len(lote) < self.janela:
+                lote.append(self._fila.popleft())
+        for envio in lote:
+            self._em_voo[self._proxima_tag] = envio
+            self._proxima_tag += 1
+            self._channel.basic_publish(
+                exchange=envio.exchange,
+                routing_key=envio.routing_key,
+                body=envio.body,
+                properties=pika.BasicProperties(delivery_mode=2, message_id=envio.message_id,
+                                                headers=cabecalhos_publicacao(envio.publicado_em))
+            )
+
+    def _ao_confirmar(self, frame):
+        metodo = frame.method
+        confirmada = isinstance(metodo, pika.spec.Basic.Ack)
+        if metodo.multiple:
+            resolvidas = []
+            while self._em_voo and (metodo.delivery_tag == 0 or next(iter(self._em_voo)) <= metodo.delivery_tag):
+                resolvidas.append(self._em_voo.popitem(last=False)[1])
+        else:
+            envio = self._em_voo.pop(metodo.delivery_tag, None)
+            resolvidas = [envio] if envio is not None else []
+
+        reenviar = []
+        agora = time.perf_counter()
+        with self._cond:
+            for envio in resolvidas:
+                if not confirmada and envio.tentativas + 1 < self.tentativas:
+                    envio.tentativas += 1
+                    reenviar.append(envio)
+                    continue
+                del self._por_id[envio.message_id]
+                self._vagas.release()
+                if confirmada:
+                    latencia_publicacao.observar(agora - envio.inicio)
+                    publicacoes_confirmadas.inc()
+                    envio.futuro.set_result(envio.message_id)
+                else:
+                    publicacoes_recusadas.inc()
+                    log.erro("Mensagem recusada pelo broker", message_id=envio.message_id, tentativas=self.tentativas)
+                    envio.futuro.set_exception(PublicacaoRecusada(f"Mensagem {envio.message_id} recusada pelo broker"))
+            self._fila.extendleft(reversed(reenviar))
+            if not self._por_id:
+                self._cond.notify_all()
+        self._drenar()
+
+class DevolverMensagem(Exception):
+    """Levantada por `processar` para devolver a mensagem à fila (ex.: falha transitória ao publicar)"""
+
+def declarar_fila(nome: str):
+    """`declarar` de uma fila durável da topologia padrão (setup_queues)"""
+    def declarar(channel):
+        setup_queues(channel)
+        return nome
+    return declarar
+
+def declarar_fila_compartilhada(nome: str, exchange: str):
+    """
+    `declarar` de uma fila durável nomeada ligada a uma exchange fanout: as
+    instâncias de um mesmo serviço dividem os eventos e nada se perde enquanto
+    estão desconectadas (ao contrário de uma fila exclusiva por conexão)
+    """
+    def declarar(channel):
+        setup_queues(channel)
+        channel.queue_declare(queue=nome, durable=True)
+        channel.queue_bind(exchange=exchange, queue=nome)
+        return nome
+    return declarar
+
+class ConsumidorFila(threading.Thread):
+    """
+    Consome uma fila numa conexão própria, com prefetch explícito e acks em lote
+    (basic_ack com multiple=True).
+
+    Com `shards` > 1 as mensagens são distribuídas entre threads de trabalho
+    pela chave retornada por `chave(body)` (por padrão o campo "id" do evento),
+    preservando a ordem por leilão. Os acks continuam sendo enviados pela
+    thread da conexão, apenas até a maior tag já processada em sequência.
+
+    `declarar(channel)` configura a topologia e retorna o nome da fila (útil
+    para filas exclusivas, que pertencem à conexão que as declarou).
+    `processar(method, body)` é chamado para cada mensagem.
+
+    Mensagens com um message_id já processado com sucesso (reentregas) são
+    confirmadas sem chamar `processar` (`deduplicar=False` desliga). Se
+    `processar` levanta DevolverMensagem, a mensagem volta à fila (nack com
+    requeue) após `espera_devolucao` segundos; outras exceções são registradas
+    e a mensagem é confirmada.
+    """
+    def __init__(self, nome: str, declarar, processar, prefetch: int = 100, lote_ack: int = 50,
+                 shards: int = 1, chave=None, ao_conectar=None, ao_desconectar=None,
+                 espera_reconexao: float = 5.0, deduplicar: bool = True, espera_devolucao: float = 1.0):
+        super().__init__(name=f'consumidor-{nome}', daemon=True)
+        self.nome = nome
+        self.declarar = declarar
+        self.processar = processar
+        self.prefetch = prefetch
+        self.lote_ack = max(1, min(lote_ack, prefetch))
+        self.shards = shards
+        self.chave = chave or self._chave_padrao
+        self.ao_conectar = ao_conectar
+        self.ao_desconectar = ao_desconectar
+        self.espera_reconexao = espera_reconexao
+        self.espera_devolucao = espera_devolucao
+        self.dedup = CacheDeduplicacao() if deduplicar else None
+        self.atraso = histograma_atraso(nome)
+        self.processamento = registro.histograma('consumidor_processamento_segundos',
+                                                 'Duração do processamento de cada mensagem', fila=nome)
+        self.running = True
+        self.connection = None
+        self.channel = None
+
+        self._concluidas = queue.SimpleQueue()  # (epoca, delivery_tag, devolver) vindas dos shards
+        self._epoca = 0
+        self._filas_shards = []
+        if shards > 1:
+            self._filas_shards = [queue.SimpleQueue() for _ in range(shards)]
+
+    def start(self):
+        # As threads dos shards só nascem com o consumidor, não na construção
+        for i, fila in enumerate(self._filas_shards):
+            threading.Thread(target=self._trabalhar, args=(fila,), name=f'{self.name}-shard{i}',
+                             daemon=True).start()
+        super().start()
+
+    @staticmethod
+    def _chave_padrao(body: bytes):
+        try:
+            return str(json.loads(body).get('id'))
+        except (ValueError, AttributeError):
+            return None
+
+    def _executar(self, method, properties, body) -> bool:
+        """Processa a mensagem; retorna True se ela deve voltar à fila"""
+        # Feito na thread que processa: reentregas da mesma mensagem caem no mesmo shard
+        message_id = properties.message_id if self.dedup is not None else None
+        if message_id and self.dedup.contem(message_id):
+            return False
+        observar_atraso(self.atraso, properties)
+        try:
+            with self.processamento.cronometrar():
+                self.processar(method, body)
+            if message_id:
+                self.dedup.marcar(message_id)
+        except DevolverMensagem:
+            log.aviso("Mensagem devolvida à fila", fila=self.nome, message_id=message_id)
+            time.sleep(self.espera_devolucao)  # Evita reentregas em ciclo enquanto a falha persiste
+            return True
+        except Exception:
+            log.erro("Erro ao processar mensagem", excecao=True, fila=self.nome)
+        return False
+
+    def _trabalhar(self, fila):
+        while True:
+            epoca, method, properties, body = fila.get()
+            devolver = self._executar(method, properties, body)
+            self._concluidas.put((epoca, method.delivery_tag, devolver))
+
+    def connect(self):
+        self.connection = get_conexao()
+        self.channel = self.connection.channel()
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+        self._epoca += 1
+        return self.declarar(self.channel)
+
+    def disconnect(self):
+        if self.ao_desconectar:
+            self.ao_desconectar()
+        if self.connection and self.connection.is_open:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+
+    def _consumir(self, fila: str):
+        pendentes = set()  # Tags processadas ainda não confirmadas
+        proxima_tag = 1  # Menor tag ainda não processada
+        ultimo_ack = 0
+
+        def confirmar(forcar: bool):
+            nonlocal ultimo_ack
+            if proxima_tag - 1 > ultimo_ack and (forcar or proxima_tag - 1 - ultimo_ack >= self.lote_ack):
+                self.channel.basic_ack(delivery_tag=proxima_tag - 1, multiple=True)
+                ultimo_ack = proxima_tag - 1
+
+        def concluir(tag: int, devolver: bool):
+            nonlocal proxima_tag
+            if devolver:
+                # Antes de qualquer ack múltiplo que cubra a tag
+                self.channel.basic_nack(delivery_tag=tag, requeue=True)
+            pendentes.add(tag)
+            while proxima_tag in pendentes:
+                pendentes.remove(proxima_tag)
+                proxima_tag += 1
+
+        for method, properties, body in self.channel.consume(fila, inactivity_timeout=0.05):
+            if not self.running:
+                break
+            if method is not None:
+                if self.shards > 1:
+                    shard = hash(self.chave(body)) % self.shards
+                    self._filas_shards[shard].put((self._epoca, method, properties, body))
+                else:
+                    concluir(method.delivery_tag, self._executar(method, properties, body))
+
+            while True:
+                try:
+                    epoca, tag, devolver = self._concluidas.get_nowait()
+                except queue.Empty:
+                    break
+                if epoca == self._epoca:  # Ignora tags de conexões anteriores
+                    concluir(tag, devolver)
+
+            # Fila ociosa: confirma o que já foi processado sem esperar completar o lote
+            confirmar(forcar=method is None)
+
+    def run(self):
+        while self.running:
+            try:
+                fila = self.connect()
+                if self.ao_conectar:
+                    self.ao_conectar()
+                log.info("Consumindo fila", fila=self.nome, prefetch=self.prefetch, shards=self.shards)
+                self._consumir(fila)
+            except pika.exceptions.ConnectionClosedByBroker:
+                log.aviso("Conexão fechada pelo broker, reconectando", fila=self.nome)
+            except pika.exceptions.AMQPError as e:
+                log.aviso("Erro AMQP, reconectando", fila=self.nome, erro=repr(e))
+            except Exception:
+                log.erro("Erro no consumidor, reconectando", excecao=True, fila=self.nome)
+            finally:
+                self.disconnect()
+            if self.running:
+                time.sleep(self.espera_reconexao)
+
+    def parar(self):
+        self.running = False
+
+## Transporte ##
+
+class TransporteRabbitMQ:
+    """
+    Backend de produção. Um transporte oferece:
+      - conectar(): conexão com a interface do pika.BlockingConnection usada
+        pelos consumidores (channel, close, is_open, add_callback_threadsafe).
+        O canal cobre declaração de filas e exchanges fanout (queue_declare,
+        exchange_declare, queue_bind), prefetch (basic_qos), consumo
+        (basic_consume/start_consuming ou consume), acks (basic_ack/basic_nack)
+        e basic_publish;
+      - criar_produtor(): produtor com publicar/publicar_lote retornando Futures
+        resolvidos na confirmação, além de iniciar, pendentes, esvaziar e fechar.
+    """
+    def conectar(self):
+        return pika.BlockingConnection(pika.ConnectionParameters(host=HOST))
+
+    def criar_produtor(self) -> ProdutorConfirmado:
+        return ProdutorConfirmado()
+
+# TRANSPORTE_BACKEND=memoria troca o RabbitMQ por filas no próprio processo
+# (todos os serviços precisam rodar no mesmo processo)
+TRANSPORTE_BACKEND = os.environ.get('TRANSPORTE_BACKEND', 'rabbitmq')
+
+_transporte = None
+_publicador = None
+_publicador_lock = threading.Lock()
+
+def get_transporte():
+    """Retorna o transporte do processo, criado na primeira chamada de acordo com TRANSPORTE_BACKEND"""
+    global _transporte
+    if _transporte is None:
+        with _publicador_lock:
+            if _transporte is None:
+                if TRANSPORTE_BACKEND == 'memoria':
+                    _transporte = TransporteMemoria(declarar=setup_queues)
+                elif TRANSPORTE_BACKEND == 'rabbitmq':
+                    _transporte = TransporteRabbitMQ()
+                else:
+                    raise ValueError(f"TRANSPORTE_BACKEND desconhecido: {TRANSPORTE_BACKEND}")
+    return _transporte
+
+def usar_transporte(transporte):
+    """Define o transporte do processo (antes de qualquer conexão ou publicação)"""
+    global _transporte, _publicador
+    with _publicador_lock:
+        _transporte = transporte
+        _publicador = None
+
+def get_publicador():
+    """Retorna o produtor compartilhado do processo (criado e iniciado sob demanda)"""
+    global _publicador
+    if _publicador is None:
+        transporte = get_transporte()
+        with _publicador_lock:
+            if _publicador is None:
+                produtor = transporte.criar_produtor()
+                produtor.iniciar()
+                _publicador = produtor
+    return _publicador
 
 # def generate_keys():
 #     """Gera chaves pública e privada de acordo com o ID do processo cliente"""
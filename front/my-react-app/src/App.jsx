@@ -16,6 +16,15 @@ function App() {
 
   const latestNotification = useSSE(`${SSE_ENDPOINT}?channel=${userId}`);
 
+  // Ao fechar a aba, remove todos os interesses deste cliente no gateway
+  useEffect(() => {
+    const removerInteresses = () => {
+      fetch(`${API_BASE_URL}/interest/${userId}`, { method: 'DELETE', keepalive: true });
+    };
+    window.addEventListener('pagehide', removerInteresses);
+    return () => window.removeEventListener('pagehide', removerInteresses);
+  }, [userId]);
+
   useEffect(() => {
     if (latestNotification) {
       const { type, data } = latestNotification;